@@ -0,0 +1,273 @@
+"""
+认证与AI助手接口的并发压测脚本
+在进程内启动后端（临时数据库 + 模拟大模型），用 N 个并发虚拟用户按比例混合调用
+register / login / verify / logout / reply，统计各接口的吞吐、p50/p95/p99 延迟和错误率，
+并输出 JSON 结果，便于在不同提交之间对比、发现认证和数据库路径上的性能回退
+
+用法示例：
+    python bench_auth_api.py --users 20 --duration 30 --output bench.json
+    python bench_auth_api.py --mix verify=10,login=2,reply=1 --output new.json --compare bench.json
+    python bench_auth_api.py --url http://localhost:5000 --users 5   # 压测已运行的服务
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+ENDPOINTS = ("register", "login", "verify", "logout", "reply")
+DEFAULT_MIX = "login=2,verify=10,logout=1,reply=2"
+
+# reply 使用的问题池：数量有限，因此会命中缓存和请求合并，接近课堂上的真实情况
+QUESTIONS = [
+    "什么是Dropout", "卷积层的作用是什么", "RNN和LSTM有什么区别", "什么是过拟合",
+    "Dense层的units参数是什么意思", "学习率应该怎么设置", "批归一化有什么作用", "池化层为什么能减少参数",
+]
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """解析 "login=2,verify=10" 形式的调用比例"""
+    mix = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"未知接口: {name}（可选: {', '.join(ENDPOINTS)}）")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩法计算百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+class Recorder:
+    """线程安全地记录每个接口的延迟和错误"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.errors: Dict[str, int] = {name: 0 for name in ENDPOINTS}
+        self.statuses: Dict[str, Dict[str, int]] = {name: {} for name in ENDPOINTS}
+
+    def record(self, endpoint: str, latency: float, status: str, ok: bool):
+        with self._lock:
+            self.latencies[endpoint].append(latency)
+            self.statuses[endpoint][status] = self.statuses[endpoint].get(status, 0) + 1
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for name in ENDPOINTS:
+            values = sorted(self.latencies[name])
+            if not values:
+                continue
+            result[name] = {
+                "requests": len(values),
+                "throughput_rps": len(values) / elapsed,
+                "error_rate": self.errors[name] / len(values),
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": values[-1] * 1000,
+                "statuses": self.statuses[name],
+            }
+        return result
+
+class VirtualUser:
+    """一个虚拟用户：先注册，然后按比例随机调用各接口"""
+
+    def __init__(self, index: int, api_base: str, recorder: Recorder, mix: Dict[str, float], run_id: str):
+        self.api_base = api_base
+        self.recorder = recorder
+        self.names = list(mix.keys())
+        self.weights = list(mix.values())
+        self.session = requests.Session()
+        self.username = f"b{run_id}_{index}"
+        self.email = f"{self.username}@bench.local"
+        self.password = "bench-password"
+        self.token: Optional[str] = None
+
+    def call(self, endpoint: str, method: str, path: str, expected: int, **kwargs) -> Optional[requests.Response]:
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.api_base + path, timeout=60, **kwargs)
+        except requests.RequestException as e:
+            self.recorder.record(endpoint, time.perf_counter() - start, type(e).__name__, False)
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - start, str(response.status_code),
+                             response.status_code == expected)
+        return response
+
+    def register(self):
+        response = self.call("register", "POST", "/auth/register", 201,
+                             json={"username": self.username, "email": self.email, "password": self.password})
+        if response is not None and response.status_code == 201:
+            self.token = response.json().get("token")
+
+    def login(self):
+        response = self.call("login", "POST", "/auth/login", 200,
+                             json={"username": self.username, "password": self.password})
+        if response is not None and response.status_code == 200:
+            self.token = response.json().get("token")
+
+    def verify(self):
+        if not self.token:
+            return self.login()
+        self.call("verify", "GET", "/auth/verify", 200, headers={"Authorization": f"Bearer {self.token}"})
+
+    def logout(self):
+        if not self.token:
+            return self.login()
+        self.call("logout", "POST", "/auth/logout", 200, headers={"Authorization": f"Bearer {self.token}"})
+        self.token = None
+
+    def reply(self):
+        self.call("reply", "POST", "/reply", 200, json={"message": random.choice(QUESTIONS), "taskName": "CNN"})
+
+    def run(self, stop_at: float, max_requests: Optional[int]):
+        if "register" in self.names or self.token is None:
+            self.register()
+        count = 0
+        while time.monotonic() < stop_at and (max_requests is None or count < max_requests):
+            name = random.choices(self.names, self.weights)[0]
+            if name == "register":
+                # 注册每个用户只做一次，之后的 register 权重用于重新登录
+                name = "login"
+            getattr(self, name)()
+            count += 1
+
+def start_in_process_server(args) -> (str, object):
+    """在后台线程中启动后端：临时数据库 + 模拟大模型"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'model'))
+    os.environ.setdefault('BCRYPT_ROUNDS', str(args.bcrypt_rounds))
+    os.environ.setdefault('BBVDLE_FAKE_LLM_LATENCY', str(args.llm_latency))
+    from werkzeug.serving import make_server
+    from GLM import create_app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # 不输出每个请求的访问日志
+    db_dir = tempfile.mkdtemp(prefix='bbvdle-bench-')
+    app = create_app({'DB_PATH': os.path.join(db_dir, 'bench.db'), 'LLM_PROVIDER': 'fake',
+                      'RATE_LIMIT_ENABLED': args.rate_limit})
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/api", server
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """对比两次结果，返回超过阈值的回退项"""
+    regressions = []
+    for name, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if before[key] > 0 and now[key] > before[key] * (1 + threshold):
+                regressions.append(f"{name}.{key}: {before[key]:.1f} -> {now[key]:.1f}")
+        if before["throughput_rps"] > 0 and now["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{name}.throughput_rps: {before['throughput_rps']:.1f} -> {now['throughput_rps']:.1f}")
+        if now["error_rate"] > before["error_rate"] + 0.01:
+            regressions.append(f"{name}.error_rate: {before['error_rate']:.3f} -> {now['error_rate']:.3f}")
+    return regressions
+
+def print_summary(result: Dict):
+    print(f"{'接口':<10}{'请求数':>8}{'吞吐(rps)':>12}{'错误率':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for name, stats in result["endpoints"].items():
+        print(f"{name:<10}{stats['requests']:>8}{stats['throughput_rps']:>12.1f}{stats['error_rate']:>8.1%}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    print(f"总计: {result['total_requests']} 次请求，{result['elapsed_s']:.1f}s，{result['throughput_rps']:.1f} rps")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="认证与AI助手接口并发压测")
+    parser.add_argument('--users', type=int, default=10, help='并发虚拟用户数')
+    parser.add_argument('--duration', type=float, default=20, help='压测时长（秒）')
+    parser.add_argument('--requests', type=int, default=None, help='每个用户最多请求数（不设置则按时长）')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'调用比例（默认 {DEFAULT_MIX}）')
+    parser.add_argument('--url', default=None, help='压测已运行的服务（例如 http://localhost:5000），不设置则在进程内启动')
+    parser.add_argument('--bcrypt-rounds', type=int, default=10, help='进程内模式的 bcrypt 成本因子（固定以便对比）')
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='进程内模式模拟大模型的平均延迟（秒）')
+    parser.add_argument('--rate-limit', action='store_true', help='进程内模式启用限流（默认关闭，以免压测流量被限流）')
+    parser.add_argument('--output', default=None, help='把结果写入 JSON 文件')
+    parser.add_argument('--compare', default=None, help='与之前的 JSON 结果对比')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定为回退的相对变化（默认 20%%）')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子')
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    mix = parse_mix(args.mix)
+    server = None
+    if args.url:
+        api_base = args.url.rstrip('/') + '/api'
+    else:
+        api_base, server = start_in_process_server(args)
+
+    recorder = Recorder()
+    run_id = f"{int(time.time()) % 100000}{random.randint(0, 99)}"
+    users = [VirtualUser(i, api_base, recorder, mix, run_id) for i in range(args.users)]
+    started = time.monotonic()
+    stop_at = started + args.duration
+    threads = [threading.Thread(target=user.run, args=(stop_at, args.requests)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    if server is not None:
+        server.shutdown()
+
+    endpoints = recorder.summary(elapsed)
+    total = sum(stats["requests"] for stats in endpoints.values())
+    result = {
+        "commit": git_commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "config": {
+            "users": args.users, "duration": args.duration, "requests": args.requests, "mix": mix,
+            "url": args.url, "bcrypt_rounds": args.bcrypt_rounds, "llm_latency": args.llm_latency,
+            "rate_limit": args.rate_limit,
+        },
+        "elapsed_s": elapsed,
+        "total_requests": total,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+    print_summary(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"⚠️ 与 {args.compare}（{baseline.get('commit')}）相比存在性能回退：")
+            for item in regressions:
+                print(f"   {item}")
+            return 1
+        print(f"✅ 与 {args.compare}（{baseline.get('commit')}）相比没有超过 {args.threshold:.0%} 的回退")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
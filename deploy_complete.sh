@@ -88,12 +88,6 @@ if [ -f "dist/zhipuai_key.txt" ]; then
     log "已备份 dist/zhipuai_key.txt"
 fi
 
-# 备份 src/model/GLM.py（云端可能修改）
-if [ -f "src/model/GLM.py" ]; then
-    cp "src/model/GLM.py" "$BACKUP_DIR/GLM.py.bak"
-    log "已备份 src/model/GLM.py"
-fi
-
 # 备份数据库（如果存在）
 if [ -f "data/bbvdle.db" ]; then
     cp "data/bbvdle.db" "$BACKUP_DIR/bbvdle.db.bak"
@@ -138,7 +132,7 @@ fi
 if [ "$SKIP_SYNC" = true ]; then
     log "步骤3: 跳过配置文件恢复（使用当前配置）"
     # 跳过代码同步时，不需要恢复备份，直接使用当前配置
-    log "将使用当前已配置的文件（dist/ip.txt, dist/zhipuai_key.txt, src/model/GLM.py）"
+    log "将使用当前已配置的文件（dist/ip.txt, dist/zhipuai_key.txt）"
 else
     log "步骤3: 恢复云端配置（同步后重新配置云端特定文件）..."
     
@@ -172,29 +166,6 @@ else
         warn "提示：可以运行 ./setup_cloud_config.sh 进行配置"
     fi
     
-    # 恢复 src/model/GLM.py（从备份，恢复云端部署配置）
-    if [ -f "$BACKUP_DIR/GLM.py.bak" ]; then
-        # 检查备份文件是否包含部署配置
-        if grep -q "app.run(debug=False, host=\"0.0.0.0\"" "$BACKUP_DIR/GLM.py.bak"; then
-            # 备份文件已经是部署配置，直接恢复
-            cp "$BACKUP_DIR/GLM.py.bak" "src/model/GLM.py"
-            log "✓ 已恢复 src/model/GLM.py（部署配置）"
-        else
-            # 备份文件是本地配置，需要修改为部署配置
-            cp "$BACKUP_DIR/GLM.py.bak" "src/model/GLM.py"
-            log "检测到备份为本地配置，切换为部署配置..."
-            
-            # 修改为部署配置
-            sed -i 's/^    app\.run(debug=True, port=5000)$/    # app.run(debug=True, port=5000)/' "src/model/GLM.py" 2>/dev/null || true
-            sed -i 's/^    # app\.run(debug=False, host="0\.0\.0\.0", port=5000)$/    app.run(debug=False, host="0.0.0.0", port=5000)/' "src/model/GLM.py" 2>/dev/null || true
-            
-            log "✓ 已恢复并切换 src/model/GLM.py 为部署配置"
-        fi
-    else
-        warn "未找到 GLM.py 备份，将使用远程版本"
-        warn "提示：如果远程版本是本地配置，请运行 ./setup_cloud_config.sh 进行配置"
-    fi
-    
     # 数据库备份信息
     if [ -f "$BACKUP_DIR/bbvdle.db.bak" ]; then
         log "数据库备份已保存: $BACKUP_DIR/bbvdle.db.bak（不自动恢复）"
@@ -355,10 +326,13 @@ log "Apache服务已重启"
 # ==================== 步骤11: 重启后端服务 ====================
 log "步骤11: 重启后端服务..."
 
+# 后端进程匹配模式（兼容旧版直接运行 GLM.py 的方式）
+BACKEND_PATTERN="gunicorn.*wsgi:app|python.*(GLM|wsgi)\.py"
+
 # 停止可能正在运行的后端服务
-if pgrep -f "python.*GLM.py" > /dev/null; then
+if pgrep -f "$BACKEND_PATTERN" > /dev/null; then
     log "停止现有后端服务..."
-    pkill -f "python.*GLM.py" || true
+    pkill -f "$BACKEND_PATTERN" || true
     sleep 2
 fi
 
@@ -371,15 +345,30 @@ if [ -f "py38_env/bin/activate" ]; then
     source py38_env/bin/activate
 fi
 
-# 使用nohup后台运行
-nohup python src/model/GLM.py > backend.log 2>&1 &
+# 在启动前执行数据库迁移（失败时不启动服务，避免多个进程同时迁移）
+log "执行数据库迁移..."
+python src/model/migrations.py || error "数据库迁移失败，请查看上面的输出"
+
+# 应用日志（JSON Lines）写入 logs/，每个进程一个文件并按大小轮转；backend.log 只保留服务器自身的输出
+export BBVDLE_LOG_FILE="${BBVDLE_LOG_FILE:-$PROJECT_DIR/logs/backend-{pid}.jsonl}"
+mkdir -p "$PROJECT_DIR/logs"
+# 清理 7 天前旧进程留下的日志文件
+find "$PROJECT_DIR/logs" -name 'backend-*.jsonl*' -mtime +7 -delete 2>/dev/null || true
+
+# 使用 gunicorn 多进程多线程运行（进程数、线程数等通过 BBVDLE_* 环境变量配置，见 src/model/config.py）
+if command -v gunicorn &> /dev/null; then
+    nohup gunicorn -c src/model/gunicorn.conf.py wsgi:app > backend.log 2>&1 &
+else
+    warn "未找到 gunicorn，使用 waitress 单进程多线程运行"
+    BBVDLE_HOST=0.0.0.0 nohup python src/model/wsgi.py > backend.log 2>&1 &
+fi
 
 # 等待服务启动
 sleep 3
 
 # 验证服务是否启动
-if pgrep -f "python.*GLM.py" > /dev/null; then
-    PID=$(pgrep -f "python.*GLM.py")
+if pgrep -f "$BACKEND_PATTERN" > /dev/null; then
+    PID=$(pgrep -f "$BACKEND_PATTERN" | head -1)
     log "后端服务已启动，PID: $PID"
 else
     error "后端服务启动失败，请查看日志: $PROJECT_DIR/backend.log"
@@ -398,7 +387,7 @@ else
 fi
 
 # 检查后端服务状态
-if pgrep -f "python.*GLM.py" > /dev/null; then
+if pgrep -f "$BACKEND_PATTERN" > /dev/null; then
     log "✓ 后端服务运行正常"
 else
     error "✗ 后端服务未运行"
@@ -432,7 +421,7 @@ log "=========================================="
 log "前端访问地址: http://$SERVER_IP"
 log "后端API地址: http://$SERVER_IP:5000"
 log "备份目录: $BACKUP_DIR"
-log "后端日志: $PROJECT_DIR/backend.log"
+log "后端日志: $PROJECT_DIR/backend.log，应用日志: $PROJECT_DIR/logs/"
 log "=========================================="
 
 # 清理备份目录（可选，保留最近3个备份）
@@ -1,7 +1,7 @@
 #!/bin/bash
 
 # BBVDLE 云端配置脚本
-# 功能：在云端服务器上快速配置IP地址、API密钥和GLM.py部署设置
+# 功能：在云端服务器上快速配置IP地址和API密钥
 # 用法：./setup_cloud_config.sh
 
 set -e
@@ -104,61 +104,12 @@ fi
 echo "$API_KEY" > dist/zhipuai_key.txt
 log "✓ 已设置API密钥"
 
-# ==================== 配置3: 修改GLM.py部署设置 ====================
+# ==================== 配置3: 后端服务设置 ====================
 log ""
-log "配置3: 修改GLM.py部署设置"
-
-GLM_FILE="src/model/GLM.py"
-
-if [ ! -f "$GLM_FILE" ]; then
-    error "找不到文件: $GLM_FILE"
-fi
-
-# 备份原文件
-cp "$GLM_FILE" "${GLM_FILE}.backup.$(date +%Y%m%d_%H%M%S)"
-log "已备份原文件: ${GLM_FILE}.backup.*"
-
-# 检查当前配置
-if grep -q "# 本地测试使用以下代码" "$GLM_FILE" && grep -q "app.run(debug=True" "$GLM_FILE"; then
-    info "检测到当前为本地测试配置，将切换为部署配置"
-    
-    # 使用sed修改文件
-    # 注释掉本地测试代码
-    sed -i 's/^    app\.run(debug=True, port=5000)$/    # app.run(debug=True, port=5000)/' "$GLM_FILE"
-    
-    # 取消注释部署代码
-    sed -i 's/^    # 部署到服务器使用以下代码$/    # 部署到服务器使用以下代码/' "$GLM_FILE"
-    sed -i 's/^    # app\.run(debug=False, host="0\.0\.0\.0", port=5000)$/    app.run(debug=False, host="0.0.0.0", port=5000)/' "$GLM_FILE"
-    
-    log "✓ 已切换为部署配置"
-elif grep -q "app.run(debug=False, host=\"0.0.0.0\"" "$GLM_FILE"; then
-    info "当前已经是部署配置"
-    read -p "是否切换回本地测试配置? (y/N): " switch_back
-    if [[ "$switch_back" =~ ^[Yy]$ ]]; then
-        # 注释掉部署代码
-        sed -i 's/^    app\.run(debug=False, host="0\.0\.0\.0", port=5000)$/    # app.run(debug=False, host="0.0.0.0", port=5000)/' "$GLM_FILE"
-        
-        # 取消注释本地测试代码
-        sed -i 's/^    # app\.run(debug=True, port=5000)$/    app.run(debug=True, port=5000)/' "$GLM_FILE"
-        
-        log "✓ 已切换为本地测试配置"
-    else
-        log "保持部署配置"
-    fi
-else
-    warn "无法识别当前配置，请手动检查 $GLM_FILE"
-    warn "应该包含以下内容："
-    warn "    # 本地测试使用以下代码"
-    warn "    # app.run(debug=True, port=5000)"
-    warn "    "
-    warn "    # 部署到服务器使用以下代码"
-    warn "    app.run(debug=False, host=\"0.0.0.0\", port=5000)"
-fi
-
-# 显示当前配置
-log ""
-log "当前 GLM.py 配置："
-grep -A 5 "if __name__" "$GLM_FILE" | head -6 || true
+log "配置3: 后端服务设置"
+# 后端通过环境变量读取配置（见 src/model/config.py），部署时无需再修改 GLM.py
+info "后端由 gunicorn 通过 src/model/wsgi.py 启动，默认监听 0.0.0.0:5000"
+info "可通过环境变量调整：BBVDLE_PORT、BBVDLE_WORKERS、BBVDLE_THREADS、BBVDLE_KEEPALIVE"
 
 # ==================== 验证配置 ====================
 log ""
@@ -182,15 +133,6 @@ else
     warn "✗ API密钥未配置"
 fi
 
-# 验证GLM.py配置
-if grep -q "app.run(debug=False, host=\"0.0.0.0\"" "$GLM_FILE"; then
-    log "✓ GLM.py: 部署配置"
-elif grep -q "app.run(debug=True" "$GLM_FILE"; then
-    warn "✗ GLM.py: 本地测试配置（需要切换为部署配置）"
-else
-    warn "✗ GLM.py: 配置状态未知"
-fi
-
 log ""
 log "=========================================="
 log "配置完成！"
@@ -203,7 +145,7 @@ log "2. 或运行完整部署（包含代码同步）:"
 log "   ./deploy_complete.sh"
 log ""
 log "3. 或手动启动后端服务:"
-log "   nohup python src/model/GLM.py > backend.log 2>&1 &"
+log "   nohup gunicorn -c src/model/gunicorn.conf.py wsgi:app > backend.log 2>&1 &"
 log "=========================================="
 
 exit 0
@@ -1,56 +1,223 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, Response, current_app, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from zhipuai import ZhipuAI
-import re
+from werkzeug.middleware.proxy_fix import ProxyFix
+import hashlib
+import hmac
+import json
+import threading
+import time
 from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+import database
+import metrics
 from database import (
-    init_database, create_user, get_user_by_username, 
-    get_user_by_email, get_user_by_id, update_last_login,
-    save_session, get_session_by_token, delete_session, delete_expired_sessions
+    init_database, update_password_hash, get_session_by_token, delete_session,
+    revoke_token, load_revocations, get_prewarmed_answer
+)
+from repository import request_unit_of_work, close_unit_of_work
+from validators import validate_email, validate_username, validate_password
+from roster_import import ROSTER_REQUEST_MAX_ROWS, parse_roster, import_roster
+from timeseries import windows_payload
+from static_assets import StaticAssetStore
+from config import load_config
+from session_reaper import start_session_reaper
+from write_behind import write_behind, record_last_login
+from session_cache import session_cache, session_expiry_timestamp
+from revocation import revocation_list
+from structured_logging import body_fields, clear_request_id, get_logger, new_request_id, setup_logging
+from response_cache import ResponseCache, make_cache_key
+from similar_questions import context_key, normalize_question, similar_index, split_question
+from prompt_builder import EDUCATION_ACTION_MESSAGES, build_prompt, chat_messages
+from conversation_memory import CONVERSATION_MEMORY_ENABLED, Conversation, conversation_key, load_conversation, record_turn
+from model_router import MODEL_TIERS, RouteDecision, model_router
+from single_flight import SingleFlight, FutureTimeoutError
+from rate_limit import RateLimiter, RateLimitedError, create_rate_limiter
+from llm_gateway import LLMGateway, GatewayBusyError, DeadlineExceededError, create_provider
+from auth_utils import (
+    hash_password, verify_password, generate_token, verify_token,
+    AuthBusyError, calibrate_bcrypt_rounds, needs_rehash, rehash_password_async
 )
-from auth_utils import hash_password, verify_password, generate_token, verify_token
-
-app = Flask(__name__)
-# 配置CORS，允许所有来源（生产环境可以限制特定域名）
-CORS(app, resources={
-    r"/api/*": {
-        "origins": "*",
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
-    }
-})
 
-# 初始化数据库
-init_database()
+api = Blueprint('api', __name__)
+logger = get_logger('api')
 
 # 读取 API key 文件
 def read_api_key(file_path):
     with open(file_path, 'r') as file:
         return file.read().strip()
 
-# 初始化 ZhipuAI 客户端（使用你的 API key）
-api_key = read_api_key("./dist/zhipuai_key.txt")
-client = ZhipuAI(api_key=api_key)
+# ==================== 应用工厂与懒加载 ====================
 
-# ==================== 认证相关 API ====================
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """创建 Flask 应用；数据库、后台任务和大模型客户端都在首次使用时才初始化"""
+    app = Flask(__name__)
+    app.config.update(load_config())
+    if config:
+        app.config.update(config)
+    setup_logging()
+    database.DB_PATH = app.config['DB_PATH']
+    
+    # 配置CORS，默认允许所有来源（生产环境可通过 BBVDLE_CORS_ORIGINS 限制特定域名）
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": app.config['CORS_ORIGINS'],
+            "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization", "X-Admin-Token"]
+        },
+        # 前端页面从后端跨域获取带版本的静态文件（见 /api/config 的 assets）
+        r"/(dist|resources/educationimages)/*": {
+            "origins": app.config['CORS_ORIGINS'],
+            "methods": ["GET", "OPTIONS"],
+            "expose_headers": ["ETag"]
+        }
+    })
+    # 懒加载的组件按应用实例保存
+    app.extensions['bbvdle'] = {"lock": threading.Lock(), "initialized": False, "llm_gateway": None,
+                                "rate_limiter": None}
+    # 静态文件在启动时一次性读入并压缩，请求时只查字典
+    app.extensions['bbvdle']['static_assets'] = (
+        StaticAssetStore().load() if app.config['STATIC_ASSETS_ENABLED'] else None)
+    # 部署在 nginx 等反向代理之后时，从 X-Forwarded-For 获取客户端 IP（用于限流）
+    if app.config['PROXY_COUNT'] > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_COUNT'])
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+    app.teardown_request(finish_request)
+    app.teardown_request(close_unit_of_work)
+    app.before_request(ensure_initialized)
+    app.register_blueprint(api)
+    return app
+
+def start_request_timer():
+    """记录请求开始时间，用于按路由统计延迟；为请求分配ID（日志中的 request_id）"""
+    g.request_start = time.perf_counter()
+    g.request_id = new_request_id(request.headers.get('X-Request-ID'))
+    metrics.HTTP_IN_FLIGHT.inc()
+
+def record_request_metrics(response):
+    """按路由模板、方法和状态码记录请求数与延迟（流式响应记录的是首字节时间）"""
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        status = str(response.status_code)
+        duration = time.perf_counter() - start
+        metrics.HTTP_REQUESTS.inc(route, request.method, status)
+        metrics.HTTP_LATENCY.observe(duration, route, request.method, status)
+        logger.info("请求完成", extra={"fields": {"route": route, "method": request.method,
+                                              "status": response.status_code,
+                                              "duration_ms": round(duration * 1000, 1)}})
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+def finish_request(_exc=None):
+    if g.pop('request_start', None) is not None:
+        metrics.HTTP_IN_FLIGHT.dec()
+    clear_request_id()
+
+def ensure_initialized():
+    """首次请求时初始化数据库、启动会话清理线程并校准 bcrypt（之后只是一次布尔判断）"""
+    state = current_app.extensions['bbvdle']
+    if state['initialized']:
+        return
+    with state['lock']:
+        if state['initialized']:
+            return
+        init_database()
+        # 在后台定时清理过期会话，不再占用请求处理路径
+        start_session_reaper(current_app.config['SESSION_REAP_INTERVAL'])
+        # 低优先级写入（如最后登录时间）由后台线程批量提交
+        write_behind.start()
+        # 相似问题索引在后台线程中加载和刷新
+        similar_index.start()
+        # 按目标耗时校准 bcrypt 成本因子
+        calibrate_bcrypt_rounds()
+        state['initialized'] = True
 
-def validate_email(email: str) -> bool:
-    """验证邮箱格式"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+def get_llm_gateway() -> LLMGateway:
+    """首次调用大模型时才读取 API key 并创建网关"""
+    state = current_app.extensions['bbvdle']
+    if state['llm_gateway'] is None:
+        with state['lock']:
+            if state['llm_gateway'] is None:
+                config = current_app.config
+                provider_name = config['LLM_PROVIDER']
+                api_key = None
+                if provider_name != 'fake':
+                    api_key = config['ZHIPUAI_API_KEY'] or read_api_key(config['ZHIPUAI_KEY_FILE'])
+                state['llm_gateway'] = LLMGateway(create_provider(provider_name, api_key))
+    return state['llm_gateway']
 
-def validate_username(username: str) -> bool:
-    """验证用户名格式（3-20个字符，只能包含字母、数字、下划线）"""
-    pattern = r'^[a-zA-Z0-9_]{3,20}$'
-    return re.match(pattern, username) is not None
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """按配置懒加载限流器，未启用时返回 None"""
+    config = current_app.config
+    if not config['RATE_LIMIT_ENABLED']:
+        return None
+    state = current_app.extensions['bbvdle']
+    if state['rate_limiter'] is None:
+        with state['lock']:
+            if state['rate_limiter'] is None:
+                state['rate_limiter'] = create_rate_limiter(
+                    config['RATE_LIMIT_BACKEND'], config['RATE_LIMIT_DB'], config['RATE_LIMITS'])
+    return state['rate_limiter']
+
+def client_identity(route: str) -> Dict[str, Optional[str]]:
+    """限流使用的客户端标识：ip 为客户端地址，user 为 JWT 中的用户ID（登录接口为提交的用户名）"""
+    username = None
+    if route == 'login':
+        data = request.get_json(silent=True) or {}
+        username = data.get('username', '')
+    return identity_for(route, request.remote_addr, request.headers.get('Authorization', ''), username)
+
+def identity_for(route: str, remote_addr: Optional[str], auth_header: str,
+                 username: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """与框架无关的限流标识（ASGI 模式共用）"""
+    user = None
+    if route == 'login':
+        user = str(username or '').strip().lower() or None
+    elif auth_header.startswith('Bearer '):
+        payload = verify_token(auth_header[7:])
+        if payload:
+            user = str(payload['user_id'])
+    return {"ip": remote_addr, "user": user}
+
+def rate_limited_response(e: RateLimitedError):
+    """超出限额时返回 429，并提示客户端多久之后重试"""
+    response = jsonify({"success": False, "error": str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def rate_limited(route: str):
+    """按 route 对应的限额检查请求，超限时直接返回 429"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limiter = get_rate_limiter()
+            if limiter is not None:
+                try:
+                    limiter.check(route, client_identity(route))
+                except RateLimitedError as e:
+                    return rate_limited_response(e)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def check_llm_budget():
+    """每次实际调用上游大模型前检查全局预算，超出时抛出 RateLimitedError"""
+    limiter = get_rate_limiter()
+    if limiter is not None:
+        limiter.check('llm', {})
+
+# ==================== 认证相关 API ====================
 
-def validate_password(password: str):
-    """验证密码强度（至少6个字符）"""
-    if len(password) < 6:
-        return (False, "密码长度至少为6个字符")
-    return (True, "")
+def auth_busy_response(e: AuthBusyError):
+    """bcrypt 线程池饱和时返回 503，并提示客户端稍后重试"""
+    response = jsonify({"success": False, "error": str(e)})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
 
-@app.route('/api/auth/register', methods=['POST'])
+@api.route('/api/auth/register', methods=['POST'])
+@rate_limited('register')
 def register():
     """用户注册"""
     try:
@@ -77,25 +244,18 @@ def register():
         if not is_valid:
             return jsonify({"success": False, "error": error_msg}), 400
         
-        # 检查用户名是否已存在
-        if get_user_by_username(username):
-            return jsonify({"success": False, "error": "用户名已存在"}), 400
-        
-        # 检查邮箱是否已注册
-        if get_user_by_email(email):
-            return jsonify({"success": False, "error": "邮箱已被注册"}), 400
-        
-        # 创建用户
+        # 先计算密码哈希，避免在 bcrypt 期间占用数据库连接
         password_hash = hash_password(password)
-        user_id = create_user(username, email, password_hash)
         
-        if not user_id:
-            return jsonify({"success": False, "error": "注册失败"}), 500
+        # 创建用户和会话在同一个事务中完成，用户名/邮箱重复由 UNIQUE 约束报告
+        uow = request_unit_of_work()
+        user_id = uow.users.create(username, email, password_hash)
         
         # 生成token
-        token = generate_token(user_id, username)
         expires_at = datetime.utcnow() + timedelta(hours=168)
-        save_session(user_id, token, expires_at)
+        token = generate_token(user_id, username, email, expires_at)
+        uow.sessions.add(user_id, token, expires_at)
+        uow.commit()
         
         return jsonify({
             "success": True,
@@ -107,11 +267,14 @@ def register():
         
     except ValueError as e:
         return jsonify({"success": False, "error": str(e)}), 400
+    except AuthBusyError as e:
+        return auth_busy_response(e)
     except Exception as e:
-        print(f"注册错误: {e}")
+        logger.exception("注册错误")
         return jsonify({"success": False, "error": "服务器错误"}), 500
 
-@app.route('/api/auth/login', methods=['POST'])
+@api.route('/api/auth/login', methods=['POST'])
+@rate_limited('login')
 def login():
     """用户登录"""
     try:
@@ -125,11 +288,11 @@ def login():
         if not password:
             return jsonify({"success": False, "error": "密码不能为空"}), 400
         
-        # 根据输入判断是用户名还是邮箱
-        if '@' in username_or_email:
-            user = get_user_by_email(username_or_email.lower())
-        else:
-            user = get_user_by_username(username_or_email)
+        # 根据输入判断是用户名还是邮箱（邮箱不区分大小写）
+        uow = request_unit_of_work()
+        user = uow.users.find_for_login(username_or_email)
+        # 验证密码期间不占用数据库连接
+        uow.release()
         
         if not user:
             return jsonify({"success": False, "error": "用户名或密码错误"}), 401
@@ -142,13 +305,19 @@ def login():
         if not user['is_active']:
             return jsonify({"success": False, "error": "账户已被禁用"}), 403
         
-        # 更新最后登录时间
-        update_last_login(user['id'])
+        # 旧成本因子的密码哈希在后台透明升级
+        if needs_rehash(user['password_hash']):
+            user_id = user['id']
+            rehash_password_async(password, lambda new_hash: update_password_hash(user_id, new_hash))
         
         # 生成token
-        token = generate_token(user['id'], user['username'])
         expires_at = datetime.utcnow() + timedelta(hours=168 if remember_me else 24)
-        save_session(user['id'], token, expires_at)
+        token = generate_token(user['id'], user['username'], user['email'], expires_at)
+        
+        # 关键路径上只保存会话；最后登录时间延迟合并写入
+        uow.sessions.add(user['id'], token, expires_at)
+        uow.commit()
+        record_last_login(user['id'])
         
         return jsonify({
             "success": True,
@@ -158,11 +327,13 @@ def login():
             "email": user['email']
         }), 200
         
+    except AuthBusyError as e:
+        return auth_busy_response(e)
     except Exception as e:
-        print(f"登录错误: {e}")
+        logger.exception("登录错误")
         return jsonify({"success": False, "error": "服务器错误"}), 500
 
-@app.route('/api/auth/logout', methods=['POST'])
+@api.route('/api/auth/logout', methods=['POST'])
 def logout():
     """用户登出"""
     try:
@@ -173,12 +344,25 @@ def logout():
         token = auth_header.split(' ')[1]
         delete_session(token)
         
+        # 同时吊销 token，无状态认证模式下登出立即生效
+        payload = verify_token(token)
+        if payload and payload.get('jti'):
+            revoke_token(payload['jti'], payload['exp'])
+        
         return jsonify({"success": True}), 200
     except Exception as e:
-        print(f"登出错误: {e}")
+        logger.exception("登出错误")
         return jsonify({"success": False, "error": "服务器错误"}), 500
 
-@app.route('/api/auth/verify', methods=['GET'])
+def refresh_revocations():
+    """无状态模式下定期从数据库重新加载吊销列表，同步其它进程中的登出和禁用"""
+    if revocation_list.claim_reload():
+        try:
+            load_revocations()
+        except Exception as e:
+            logger.warning("加载吊销列表失败: %s", e)
+
+@api.route('/api/auth/verify', methods=['GET'])
 def verify():
     """验证token有效性"""
     try:
@@ -193,121 +377,532 @@ def verify():
         if not payload:
             return jsonify({"valid": False, "error": "token无效或已过期"}), 401
         
-        # 检查数据库中的会话
-        session = get_session_by_token(token)
-        if not session:
-            return jsonify({"valid": False, "error": "会话不存在或已过期"}), 401
-        
-        user = get_user_by_id(payload['user_id'])
-        if not user or not user['is_active']:
-            return jsonify({"valid": False, "error": "用户不存在或已被禁用"}), 401
+        if current_app.config['AUTH_MODE'] == 'stateless' and payload.get('jti') and 'email' in payload:
+            # 无状态模式：签名和 exp 已校验，只需检查内存中的吊销列表，不访问数据库
+            refresh_revocations()
+            if revocation_list.is_revoked(payload):
+                return jsonify({"valid": False, "error": "会话不存在或已过期"}), 401
+            session = {
+                "user_id": payload['user_id'],
+                "username": payload['username'],
+                "email": payload['email'],
+            }
+        else:
+            # 先查进程内缓存，未命中时再查数据库中的会话（JOIN 已包含用户信息）
+            session = session_cache.get(token)
+            if session is None:
+                row = get_session_by_token(token)
+                if not row:
+                    return jsonify({"valid": False, "error": "会话不存在或已过期"}), 401
+                if not row['is_active']:
+                    return jsonify({"valid": False, "error": "用户不存在或已被禁用"}), 401
+                session = {
+                    "user_id": row['user_id'],
+                    "username": row['username'],
+                    "email": row['email'],
+                }
+                # 缓存在 JWT 过期和会话过期中较早的时刻失效
+                session_cache.set(token, session, min(payload['exp'], session_expiry_timestamp(row['expires_at'])))
         
         return jsonify({
             "valid": True,
-            "user_id": user['id'],
-            "username": user['username'],
-            "email": user['email']
+            "user_id": session['user_id'],
+            "username": session['username'],
+            "email": session['email']
         }), 200
         
     except Exception as e:
-        print(f"验证错误: {e}")
+        logger.exception("验证错误")
         return jsonify({"valid": False, "error": "服务器错误"}), 500
 
-# 定期清理过期会话的装饰器（可选）
-@app.before_request
-def cleanup_expired_sessions():
-    """在每次请求前清理过期会话（可以优化为定时任务）"""
+# ==================== 管理 API ====================
+
+def admin_token_error(admin_token: Optional[str], provided: str) -> Optional[Tuple[Dict[str, Any], int]]:
+    """校验管理员令牌，通过时返回 None，否则返回 (响应体, 状态码)；Flask 和 ASGI 入口共用"""
+    if not admin_token:
+        return {"success": False, "error": "管理接口未启用"}, 403
+    if not hmac.compare_digest(provided.encode('utf-8'), admin_token.encode('utf-8')):
+        return {"success": False, "error": "管理员令牌无效"}, 401
+    return None
+
+def require_admin(view):
+    """管理接口（包括统计和指标）需要在 X-Admin-Token 请求头中提供 BBVDLE_ADMIN_TOKEN"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        error = admin_token_error(current_app.config.get('ADMIN_TOKEN'), request.headers.get('X-Admin-Token', ''))
+        if error is not None:
+            return jsonify(error[0]), error[1]
+        return view(*args, **kwargs)
+    return wrapper
+
+@api.route('/api/admin/roster/import', methods=['POST'])
+@require_admin
+def roster_import():
+    """批量导入班级名单（JSON 或 text/csv），返回逐行结果；?dry_run=1 只校验不写入
+    一次最多 ROSTER_REQUEST_MAX_ROWS（BBVDLE_ROSTER_REQUEST_MAX_ROWS，默认200）行，超出返回 413，
+    更大的名单分批导入或使用 roster_import.py 命令行"""
+    try:
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'json'
+        rows = parse_roster(request.get_data(as_text=True), fmt)
+        dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        # 密码哈希在请求线程中进行，行数过多会超过 gunicorn 超时（只校验时不计算哈希，不受此限制）
+        if not dry_run and len(rows) > ROSTER_REQUEST_MAX_ROWS:
+            return jsonify({"success": False, "error": f"通过接口最多导入 {ROSTER_REQUEST_MAX_ROWS} 行，"
+                                                       f"更大的名单请分批导入或使用 roster_import.py 命令行"}), 413
+        report = import_roster(rows, dry_run=dry_run)
+        return jsonify({"success": True, **report}), 200
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.exception("名单导入错误")
+        return jsonify({"success": False, "error": "服务器错误"}), 500
+
+@api.route('/api/admin/users/<int:user_id>', methods=['PATCH'])
+@require_admin
+def admin_update_user(user_id):
+    """启用或禁用用户：{"active": false}；禁用后该用户已签发的 token 立即失效，也不能再登录"""
+    data = request.json or {}
+    active = data.get('active')
+    if not isinstance(active, bool):
+        return jsonify({"success": False, "error": "active 必须是布尔值"}), 400
+    try:
+        if not database.set_user_active(user_id, active):
+            return jsonify({"success": False, "error": "用户不存在"}), 404
+        return jsonify({"success": True, "user_id": user_id, "active": active}), 200
+    except Exception:
+        logger.exception("修改用户状态失败")
+        return jsonify({"success": False, "error": "服务器错误"}), 500
+
+def similar_question_context(data) -> str:
+    """管理接口中条目的上下文，与 /api/reply 请求体的 selectedLayer、taskName 字段相同"""
+    return context_key(data.get('selectedLayer'), data.get('taskName'), model=MODEL_TIERS['primary'])
+
+@api.route('/api/admin/similar-questions', methods=['GET'])
+@require_admin
+def similar_questions_list():
+    """相似问题索引中的条目（?q= 按问题文字筛选，?limit=&offset= 分页）和命中统计"""
     try:
-        delete_expired_sessions()
-    except:
-        pass  # 忽略清理错误，不影响主流程
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"success": False, "error": "limit 和 offset 必须是整数"}), 400
+    try:
+        entries = database.list_similar_questions(request.args.get('q', ''), limit, offset)
+        return jsonify({"success": True, "entries": entries, "stats": similar_index.stats()}), 200
+    except Exception:
+        logger.exception("读取相似问题失败")
+        return jsonify({"success": False, "error": "服务器错误"}), 500
+
+@api.route('/api/admin/similar-questions', methods=['POST'])
+@require_admin
+def similar_questions_add():
+    """添加或替换一条整理过的问答：{"question", "answer", "selectedLayer"?, "taskName"?}"""
+    data = request.json or {}
+    question = (data.get('question') or '').strip()
+    answer = (data.get('answer') or '').strip()
+    if not question or not answer:
+        return jsonify({"success": False, "error": "问题和回答不能为空"}), 400
+    normalized = normalize_question(question)
+    if not split_question(normalized)[1]:
+        return jsonify({"success": False, "error": "问题去掉套话后为空"}), 400
+    try:
+        question_id = database.save_similar_question(similar_question_context(data), question, normalized, answer)
+        similar_index.reload()
+        return jsonify({"success": True, "id": question_id}), 201
+    except Exception:
+        logger.exception("添加相似问题失败")
+        return jsonify({"success": False, "error": "服务器错误"}), 500
+
+@api.route('/api/admin/similar-questions/<int:question_id>', methods=['PATCH'])
+@require_admin
+def similar_questions_update(question_id):
+    """修改回答或停用/启用条目：{"answer"?, "enabled"?}；停用的问题不会再被自动加入"""
+    data = request.json or {}
+    answer = data.get('answer')
+    enabled = data.get('enabled')
+    if answer is not None and not (isinstance(answer, str) and answer.strip()):
+        return jsonify({"success": False, "error": "回答不能为空"}), 400
+    if enabled is not None and not isinstance(enabled, bool):
+        return jsonify({"success": False, "error": "enabled 必须是布尔值"}), 400
+    try:
+        if not database.update_similar_question(question_id, answer.strip() if answer else None, enabled):
+            return jsonify({"success": False, "error": "条目不存在"}), 404
+        similar_index.reload()
+        return jsonify({"success": True}), 200
+    except Exception:
+        logger.exception("修改相似问题失败")
+        return jsonify({"success": False, "error": "服务器错误"}), 500
+
+@api.route('/api/admin/similar-questions/<int:question_id>', methods=['DELETE'])
+@require_admin
+def similar_questions_delete(question_id):
+    """删除条目"""
+    try:
+        if not database.delete_similar_question(question_id):
+            return jsonify({"success": False, "error": "条目不存在"}), 404
+        similar_index.reload()
+        return jsonify({"success": True}), 200
+    except Exception:
+        logger.exception("删除相似问题失败")
+        return jsonify({"success": False, "error": "服务器错误"}), 500
+
+@api.route('/api/admin/similar-questions/match', methods=['POST'])
+@require_admin
+def similar_questions_match():
+    """查看一个问题会匹配到哪条已有问答及相似度（用于调整阈值，不计入命中统计）"""
+    data = request.json or {}
+    if not data.get('message'):
+        return jsonify({"success": False, "error": "消息为空"}), 400
+    match = similar_index.best_match(data['message'], similar_question_context(data))
+    if match is not None:
+        match["hit"] = match["score"] >= similar_index.threshold
+    return jsonify({"success": True, "match": match, "threshold": similar_index.threshold}), 200
+
+# ==================== 时间序列数据 API ====================
+
+@api.route('/api/timeseries/airpassengers', methods=['GET'])
+def airpassengers_windows():
+    """AirPassengers 归一化后的训练/测试窗口（float32 二进制，格式见 timeseries.py），支持 If-None-Match"""
+    try:
+        time_step = int(request.args.get('time_step', 12))
+        split = float(request.args.get('split', 0.8))
+        payload, etag = windows_payload(time_step, round(split, 4))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers=headers)
+    return Response(payload, mimetype='application/octet-stream', headers=headers)
+
+# ==================== 前端配置与静态文件 ====================
+
+@api.route('/api/config', methods=['GET'])
+def bootstrap_config():
+    """前端启动时需要的配置：后端地址、功能开关和静态文件的版本化 URL，支持 If-None-Match"""
+    store = current_app.extensions['bbvdle']['static_assets']
+    server_ip = request.host.rsplit(':', 1)[0]
+    ip_file = store.assets.get('dist/ip.txt') if store is not None else None
+    if ip_file is not None:
+        server_ip = ip_file.bodies['identity'].decode('utf-8').strip() or server_ip
+    payload = json.dumps({
+        "serverIP": server_ip,
+        "apiBaseUrl": request.host_url.rstrip('/') + '/api',
+        # assets 中的 URL 相对于后端地址，前端拼接后直接从后端获取（ETag、预压缩版本）
+        "assetBaseUrl": request.host_url.rstrip('/'),
+        "features": {"stream": True, "conversationMemory": CONVERSATION_MEMORY_ENABLED},
+        "assets": store.versioned_urls() if store is not None else {},
+    }, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    # 内容很小但会随部署变化：每次都重新验证，未变化时返回 304
+    etag = '"' + hashlib.sha256(payload).hexdigest()[:20] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers=headers)
+    return Response(payload, mimetype='application/json', headers=headers)
+
+@api.route('/dist/<name>', methods=['GET'])
+@api.route('/resources/educationimages/<name>', methods=['GET'])
+def static_asset(name):
+    """白名单内的静态文件（见 static_assets.py），其余路径返回 404"""
+    store = current_app.extensions['bbvdle']['static_assets']
+    result = None
+    if store is not None:
+        result = store.respond(request.path, request.args.get('v'), request.headers.get('If-None-Match', ''),
+                               request.headers.get('Accept-Encoding', ''))
+    if result is None:
+        return jsonify({"error": "文件不存在"}), 404
+    status, headers, body = result
+    return Response(body, status=status, headers=headers)
 
 # ==================== AI 助手 API ====================
 
+# AI回复缓存（相同的提示词和模型参数直接返回缓存结果）
+response_cache = ResponseCache()
+
+# 合并相同提示词的并发请求，只向上游发起一次调用
+single_flight = SingleFlight()
+
+# 缓存与请求合并的统计在导出指标时读取
+metrics.gauge('bbvdle_reply_cache_events', 'AI reply cache hits, misses and evictions.', ('event',),
+              callback=lambda: {('hit',): response_cache.hits, ('miss',): response_cache.misses,
+                                ('eviction',): response_cache.evictions})
+metrics.gauge('bbvdle_reply_single_flight_calls', 'Upstream calls executed vs. coalesced by single-flight.',
+              ('result',), callback=lambda: {('executed',): single_flight.executions,
+                                             ('coalesced',): single_flight.coalesced,
+                                             ('timeout',): single_flight.timeouts})
+metrics.gauge('bbvdle_revocation_entries', 'Revoked tokens and users held in memory (stateless auth mode).',
+              ('kind',), callback=lambda: {(kind,): count for kind, count in revocation_list.stats().items()})
+PREWARMED_LOOKUPS = metrics.counter('bbvdle_reply_prewarmed_total', 'Lookups of offline-prewarmed AI replies.',
+                                    ('result',))
+metrics.gauge('bbvdle_session_cache_events', 'Verified-session cache hits and misses.', ('event',),
+              callback=lambda: {('hit',): session_cache.hits, ('miss',): session_cache.misses})
+
+def prewarmed_reply(cache_key) -> Optional[str]:
+    """查询离线预热的回复，查询失败时按未命中处理"""
+    try:
+        answer = get_prewarmed_answer(cache_key)
+    except Exception as e:
+        logger.warning("读取预热回复失败: %s", e)
+        return None
+    PREWARMED_LOOKUPS.inc('hit' if answer is not None else 'miss')
+    return answer
+
+def find_cached_reply(cache_key) -> Optional[str]:
+    """依次查询回复缓存和离线预热的回复（教学内容的常见操作已由 prewarm.py 生成）"""
+    cached_reply = response_cache.get(cache_key)
+    if cached_reply is None:
+        cached_reply = prewarmed_reply(cache_key)
+        if cached_reply is not None:
+            response_cache.set(cache_key, cached_reply)
+    return cached_reply
+
+def similar_reply(user_message, similar_key) -> Optional[str]:
+    """查询相似问题索引，出错时按未命中处理"""
+    try:
+        return similar_index.lookup(user_message, similar_key)
+    except Exception as e:
+        logger.warning("查询相似问题失败: %s", e)
+        return None
+
+def remember_reply(user_message, similar_key, ai_reply):
+    """把新生成的问答加入相似问题索引"""
+    try:
+        similar_index.remember(user_message, similar_key, ai_reply)
+    except Exception as e:
+        logger.warning("写入相似问题索引失败: %s", e)
+
+def conversation_history(memory_key, education_context) -> Optional[Conversation]:
+    """读取对话历史（没有历史时返回 None）；教学内容的解释/概括/测验不带历史，与离线预热的提示词保持一致"""
+    if memory_key is None:
+        return None
+    if isinstance(education_context, dict) and education_context.get('mode') in EDUCATION_ACTION_MESSAGES:
+        return None
+    try:
+        history = load_conversation(memory_key)
+    except Exception as e:
+        logger.warning("读取对话历史失败: %s", e)
+        return None
+    return history if history.turns or history.summary else None
+
+def remember_turn(memory_key, user_message, ai_reply):
+    """把这一轮问答记入对话历史"""
+    try:
+        record_turn(memory_key, user_message, ai_reply)
+    except Exception as e:
+        logger.warning("保存对话历史失败: %s", e)
+
+def on_reply_complete(user_message, similar_key=None, memory_key=None) -> Optional[Callable[[str], None]]:
+    """回复生成后的处理：加入相似问题索引（similar_key 不为空时）、记入对话历史（memory_key 不为空时）"""
+    if not similar_key and not memory_key:
+        return None
+
+    def complete(ai_reply):
+        if similar_key:
+            remember_reply(user_message, similar_key, ai_reply)
+        if memory_key:
+            remember_turn(memory_key, user_message, ai_reply)
+    return complete
+
+def cached_reply_response(data, cached_reply):
+    """直接返回已有的回复（流式客户端收到一段完整内容和 done 事件）"""
+    if wants_stream(data):
+        return Response(
+            sse_event({"delta": cached_reply}) + sse_event({"reply": cached_reply, "cached": True}, event="done"),
+            mimetype='text/event-stream')
+    return jsonify({"reply": cached_reply, "cached": True})
+
+def wants_stream(data) -> bool:
+    """客户端是否选择了流式返回（请求体 stream=true 或 Accept: text/event-stream）"""
+    if data.get('stream') is True:
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_event(payload, event=None) -> str:
+    """格式化一条 Server-Sent Events 消息"""
+    data = json.dumps(payload, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {data}\n\n"
+    return f"data: {data}\n\n"
+
+def generate_reply(full_prompt, decision: RouteDecision, cache_key=None) -> str:
+    """通过网关调用路由选择的模型生成完整回复；cache_key 不为空时写入缓存"""
+    check_llm_budget()
+    started = time.perf_counter()
+    try:
+        result = get_llm_gateway().complete(chat_messages(full_prompt), **decision.params)
+    except GatewayBusyError:
+        raise  # 没有发往上游，不计入延迟
+    except Exception:
+        model_router.record(decision, time.perf_counter() - started)
+        raise
+    model_router.record(decision, time.perf_counter() - started, result)
+    
+    # 获取模型的回复内容
+    ai_reply = result.content
+    logger.info("生成回复", extra={"fields": body_fields(ai_reply, 'reply')})
+    if cache_key:
+        response_cache.set(cache_key, ai_reply)
+    return ai_reply
+
+def stream_reply(full_prompt, decision: RouteDecision, cache_key=None,
+                 on_complete: Optional[Callable[[str], None]] = None):
+    """以 SSE 的形式逐段转发大模型生成的内容；cache_key 不为空时缓存完整回复，生成完成后调用 on_complete"""
+    def generate():
+        upstream = None
+        parts = []
+        usage = []
+        started = time.perf_counter()
+        try:
+            upstream = get_llm_gateway().stream(chat_messages(full_prompt), on_usage=usage.append,
+                                                **decision.params)
+            for delta in upstream:
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+            model_router.record(decision, time.perf_counter() - started, usage[0] if usage else None)
+            ai_reply = "".join(parts)
+            logger.info("生成回复", extra={"fields": {"stream": True, **body_fields(ai_reply, 'reply')}})
+            if cache_key:
+                response_cache.set(cache_key, ai_reply)
+            if on_complete:
+                on_complete(ai_reply)
+            yield sse_event({"reply": ai_reply}, event="done")
+        except GeneratorExit:
+            # 客户端已断开连接，下面的 finally 会关闭上游连接以终止生成
+            logger.info("客户端断开连接，已取消生成")
+            raise
+        except Exception as e:
+            if not isinstance(e, GatewayBusyError):
+                model_router.record(decision, time.perf_counter() - started)
+            logger.exception("流式回复失败")
+            yield sse_event({"error": str(e)}, event="error")
+        finally:
+            if upstream is not None:
+                upstream.close()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # 禁止反向代理缓冲
+    })
+
 # 定义一个简单的路由来处理用户消息
-@app.route('/api/reply', methods=['POST'])
+@api.route('/api/reply', methods=['POST'])
+@rate_limited('reply')
 def reply():
 
     # 获取用户消息
-    user_message = request.json.get('message')
-    selected_layer = request.json.get('selectedLayer')
-    task_name = request.json.get('taskName')
-    education_context = request.json.get('educationContext')
+    data = request.json or {}
+    user_message = data.get('message')
+    selected_layer = data.get('selectedLayer')
+    task_name = data.get('taskName')
+    education_context = data.get('educationContext')
     
     if user_message:
+        # 登录用户提供 conversationId 时，追问会带上同一段对话的历史
+        user_id = client_identity('reply')['user']
+        memory_key = conversation_key(user_id, data.get('conversationId'))
+        history = conversation_history(memory_key, education_context)
+        full_prompt = build_prompt(user_message, selected_layer, task_name, education_context, history)
+        logger.info("提示词", extra={"fields": body_fields(full_prompt, 'prompt')})
+        
+        # 按提问类型选择模型和 max_tokens（主模型变慢时临时降级到快速模型）
+        decision = model_router.route(user_message, selected_layer, education_context, full_prompt)
+        
+        # 请求体 cache=false 时跳过缓存，每次都重新生成（例如希望得到不同的回答）
+        cache_key = None
+        similar_key = None
+        if data.get('cache', True) is not False:
+            cache_key = make_cache_key(full_prompt, decision.cache_params)
+            cached_reply = find_cached_reply(cache_key)
+            # 提示词不同时，再查上下文相同的相似问题（换一种说法的同一问题）；带历史的追问依赖上文，不参与
+            if history is None:
+                similar_key = context_key(selected_layer, task_name, education_context, MODEL_TIERS['primary'])
+            if cached_reply is None and similar_key:
+                cached_reply = similar_reply(user_message, similar_key)
+            if cached_reply is not None:
+                if memory_key:
+                    remember_turn(memory_key, user_message, cached_reply)
+                return cached_reply_response(data, cached_reply)
+        # 降级期间的回复只返回给本次请求，不写入缓存和相似问题索引
+        store_key = None if decision.fallback else cache_key
+        on_complete = on_reply_complete(user_message, None if decision.fallback else similar_key, memory_key)
+        
+        # 选择流式返回的客户端通过 SSE 逐段接收回复（开始推送前检查上游调用预算）
+        if wants_stream(data):
+            try:
+                check_llm_budget()
+            except RateLimitedError as e:
+                return rate_limited_response(e)
+            return stream_reply(full_prompt, decision, store_key, on_complete)
+        
         # 调用 ZhipuAI API 获取回复
         try:
-            # 构建上下文信息
-            context_parts = ["你现在作为一名深度学习神经网络教学者,用简洁准确的语言为我解答与神经网络相关的问题。"]
-            
-            # 如果有选中的层，添加层信息到上下文
-            if selected_layer:
-                layer_type = selected_layer.get('layerType', '')
-                layer_params = selected_layer.get('params', {})
-                context_parts.append(f"\n当前用户选中了一个 {layer_type} 层。")
-                if layer_params:
-                    params_str = ", ".join([f"{k}: {v}" for k, v in layer_params.items()])
-                    context_parts.append(f"该层的参数为: {params_str}。")
-                context_parts.append("请根据这个层的信息，提供更有针对性的解答，例如解释该层的参数含义、作用等。")
-            
-            # 如果有当前任务，添加任务信息到上下文
-            if task_name and task_name != "None":
-                task_mapping = {
-                    "MLP": "多层感知机",
-                    "CNN": "卷积神经网络",
-                    "RNN": "循环神经网络"
-                }
-                task_display_name = task_mapping.get(task_name, task_name)
-                context_parts.append(f"\n当前用户正在进行 {task_display_name} 的学习任务。请结合该任务的特点提供建议。")
-            
-            # 如果有教学内容选中，添加进上下文
-            if education_context:
-                snippet = (education_context.get('text') or '').strip()
-                mode = education_context.get('mode', 'custom')
-                if snippet:
-                    snippet = snippet[:1200]
-                    if mode == 'summarize':
-                        context_parts.append(f"\n请概括以下教学内容的要点，并突出重点：\n{snippet}\n")
-                    elif mode == 'quiz':
-                        context_parts.append(f"\n请根据以下教学内容设计三道测验题，并给出标准答案：\n{snippet}\n")
-                    elif mode == 'explain':
-                        context_parts.append(f"\n请用循序渐进的方式解释以下教学内容，并结合初学者视角：\n{snippet}\n")
-                    else:
-                        context_parts.append(f"\n以下是用户选中的教学内容，请在回答时参考：\n{snippet}\n")
-            
-            # 组合完整的提示词
-            full_prompt = "".join(context_parts) + "\n\n用户问题: " + user_message
-            
-            print(full_prompt)
-            response = client.chat.completions.create(
-                model="glm-4",
-                messages=[
-                    {"role": "user", "content": full_prompt
-                    }],
-                top_p=0.7,
-                temperature=0.9,
-                stream=False,
-                max_tokens=2000,
-            )
-            
-            # 获取模型的回复内容
-            print(response.choices[0].message.content)
-            ai_reply = response.choices[0].message.content
+            if cache_key:
+                # 相同提示词正在生成时，等待同一个结果而不是重复调用上游
+                ai_reply = single_flight.do(cache_key, lambda: generate_reply(full_prompt, decision, store_key))
+            else:
+                ai_reply = generate_reply(full_prompt, decision)
+            if on_complete:
+                on_complete(ai_reply)
             
             # 返回生成的回复
             return jsonify({"reply": ai_reply})
 
+        except RateLimitedError as e:
+            # 上游调用的全局预算已用完
+            return rate_limited_response(e)
+        except GatewayBusyError as e:
+            # 并发已满或熔断中，提示客户端稍后重试
+            response = jsonify({"error": str(e)})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
+        except (DeadlineExceededError, FutureTimeoutError) as e:
+            return jsonify({"error": str(e) or "等待相同请求的回复超时"}), 504
         except Exception as e:
             # 捕获异常并返回错误信息
-            print(e)
+            logger.exception("生成回复失败")
             return jsonify({"error": str(e)}), 500
     else:
         return jsonify({"error": "消息为空"}), 400
 
-# 启动 Flask 服务
+@api.route('/api/reply/cache/stats', methods=['GET'])
+@require_admin
+def reply_cache_stats():
+    """AI回复缓存的命中统计"""
+    return jsonify(response_cache.stats()), 200
+
+@api.route('/api/reply/single-flight/stats', methods=['GET'])
+@require_admin
+def reply_single_flight_stats():
+    """请求合并统计（coalesced 为节省的上游调用次数）"""
+    return jsonify(single_flight.stats()), 200
+
+@api.route('/api/reply/similar/stats', methods=['GET'])
+@require_admin
+def reply_similar_stats():
+    """相似问题索引统计（hits 为节省的大模型调用次数）"""
+    return jsonify(similar_index.stats()), 200
+
+@api.route('/api/reply/router/stats', methods=['GET'])
+@require_admin
+def reply_router_stats():
+    """模型路由配置、各模型最近的 p95 延迟和降级次数"""
+    return jsonify(model_router.stats()), 200
+
+@api.route('/api/reply/gateway/stats', methods=['GET'])
+@require_admin
+def reply_gateway_stats():
+    """大模型网关统计（并发、排队、重试、熔断状态）；网关在首次调用大模型时才创建，之前不读取 API key"""
+    gateway = current_app.extensions['bbvdle']['llm_gateway']
+    return jsonify(gateway.stats() if gateway is not None else {"initialized": False}), 200
+
+@api.route('/api/metrics', methods=['GET'])
+@require_admin
+def metrics_endpoint():
+    """以 Prometheus 文本格式导出指标"""
+    return Response(metrics.render(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+# 启动 Flask 开发服务器（生产环境请使用 wsgi.py）
+# 本地测试：BBVDLE_DEBUG=1 python src/model/GLM.py
+# 对外提供服务：BBVDLE_HOST=0.0.0.0 python src/model/GLM.py
 if __name__ == "__main__":
-    # 本地测试使用以下代码
-    app.run(debug=True, port=5000)
-    
-    # 部署到服务器使用以下代码
-    # app.run(debug=False, host="0.0.0.0", port=5000)
+    app = create_app()
+    app.run(debug=app.config['DEBUG'], host=app.config['HOST'], port=app.config['PORT'])
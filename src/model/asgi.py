@@ -0,0 +1,394 @@
+"""
+ASGI 入口：AI助手接口在 asyncio 事件循环中处理，等待大模型时只占用一个协程，单进程可同时保持数百个进行中的调用
+
+    uvicorn --app-dir src/model asgi:app --host 0.0.0.0 --port 5000
+    python src/model/asgi.py        （进程数 BBVDLE_WORKERS，监听地址 BBVDLE_HOST / BBVDLE_PORT）
+
+- POST /api/reply 与 Flask 版本的请求/响应格式完全相同（JSON 或 SSE 流式），共用提示词构建、回复缓存、
+  离线预热、限流和 token 校验；上游通过 llm_async.AsyncLLMGateway 异步调用
+- /api/reply/gateway/stats、/api/reply/single-flight/stats 返回异步网关和异步请求合并的统计（需要管理员令牌）
+- 其余路由（认证、管理、指标等）转交 Flask 应用，在线程池中执行；这些接口的响应不是流式的，整体返回
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from GLM import (
+    admin_token_error, conversation_history, create_app, ensure_initialized, find_cached_reply, get_rate_limiter,
+    identity_for, on_reply_complete, read_api_key, remember_turn, response_cache, similar_reply, sse_event
+)
+from llm_async import AsyncLLMGateway, create_async_provider
+from llm_gateway import DeadlineExceededError, GatewayBusyError
+from model_router import MODEL_TIERS, RouteDecision, model_router
+from conversation_memory import conversation_key
+from prompt_builder import build_prompt, chat_messages
+from rate_limit import RateLimitedError
+from response_cache import make_cache_key
+from similar_questions import context_key
+from single_flight import AsyncSingleFlight
+from structured_logging import body_fields, get_logger, new_request_id
+
+flask_app = create_app()
+config = flask_app.config
+logger = get_logger('asgi')
+
+# 数据库、限流（sqlite 后端）和 Flask 路由都是同步的，放在线程池中执行，不阻塞事件循环
+executor = ThreadPoolExecutor(config['THREADS'], thread_name_prefix='asgi-sync')
+
+# 事件循环内的组件在启动时创建（asyncio 对象需要绑定到运行中的事件循环）
+state: Dict[str, Any] = {"gateway": None, "single_flight": None}
+
+async def run_sync(fn: Callable, *args):
+    return await asyncio.get_event_loop().run_in_executor(executor, fn, *args)
+
+def _initialize():
+    # 与 Flask 首次请求时相同：初始化数据库、启动后台线程、校准 bcrypt
+    with flask_app.app_context():
+        ensure_initialized()
+
+def _check_rate_limit(route: str, identity: Dict[str, Optional[str]]):
+    with flask_app.app_context():
+        limiter = get_rate_limiter()
+    if limiter is not None:
+        limiter.check(route, identity)
+
+def _create_gateway() -> AsyncLLMGateway:
+    api_key = None
+    if config['LLM_PROVIDER'] != 'fake':
+        api_key = config['ZHIPUAI_API_KEY'] or read_api_key(config['ZHIPUAI_KEY_FILE'])
+    return AsyncLLMGateway(create_async_provider(config['LLM_PROVIDER'], api_key))
+
+# ==================== HTTP 工具 ====================
+
+def _headers(scope) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').lower()
+        value = value.decode('latin-1')
+        headers[key] = headers[key] + ',' + value if key in headers else value
+    return headers
+
+def _client_ip(scope, headers: Dict[str, str]) -> Optional[str]:
+    """与 Flask 中的 ProxyFix 相同：配置了代理层数时取 X-Forwarded-For 中对应的地址"""
+    proxies = config['PROXY_COUNT']
+    if proxies > 0:
+        forwarded = [part.strip() for part in headers.get('x-forwarded-for', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    client = scope.get('client')
+    return client[0] if client else None
+
+def _cors_headers(headers: Dict[str, str]) -> List[Tuple[bytes, bytes]]:
+    origins = config['CORS_ORIGINS']
+    origin = headers.get('origin')
+    if origins == '*':
+        return [(b'access-control-allow-origin', b'*')]
+    if origin and origin == origins:
+        return [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'Origin')]
+    return []
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+async def _send_json(send, status: int, payload, headers: List[Tuple[bytes, bytes]]):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+                + headers})
+    await send({"type": "http.response.body", "body": body})
+
+async def _send_sse(send, receive, events, headers: List[Tuple[bytes, bytes]]):
+    """逐条发送 SSE 事件；客户端断开时取消生成（关闭生成器会关闭上游连接）"""
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),  # 禁止反向代理缓冲
+    ] + headers})
+    task = asyncio.current_task()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        task.cancel()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        async for event in events:
+            await send({"type": "http.response.body", "body": event.encode('utf-8'), "more_body": True})
+        await send({"type": "http.response.body", "body": b''})
+    except asyncio.CancelledError:
+        logger.info("客户端断开连接，已取消生成")
+    finally:
+        watcher.cancel()
+        await events.aclose()
+
+# ==================== AI 助手 API ====================
+
+async def generate_reply(full_prompt: str, decision: RouteDecision, cache_key: Optional[str] = None) -> str:
+    """通过异步网关调用路由选择的模型生成完整回复；cache_key 不为空时写入缓存"""
+    await run_sync(_check_rate_limit, 'llm', {})
+    started = time.perf_counter()
+    try:
+        result = await state['gateway'].complete(chat_messages(full_prompt), **decision.params)
+    except GatewayBusyError:
+        raise  # 没有发往上游，不计入延迟
+    except Exception:
+        model_router.record(decision, time.perf_counter() - started)
+        raise
+    model_router.record(decision, time.perf_counter() - started, result)
+    logger.info("生成回复", extra={"fields": body_fields(result.content, 'reply')})
+    if cache_key:
+        await run_sync(response_cache.set, cache_key, result.content)
+    return result.content
+
+async def stream_events(full_prompt: str, decision: RouteDecision, cache_key: Optional[str] = None,
+                        on_complete: Optional[Callable[[str], None]] = None):
+    """以 SSE 的形式逐段产出大模型生成的内容；cache_key 不为空时缓存完整回复，生成完成后调用 on_complete"""
+    usage = []
+    started = time.perf_counter()
+    upstream = state['gateway'].stream(chat_messages(full_prompt), on_usage=usage.append, **decision.params)
+    parts = []
+    try:
+        async for delta in upstream:
+            parts.append(delta)
+            yield sse_event({"delta": delta})
+        model_router.record(decision, time.perf_counter() - started, usage[0] if usage else None)
+        ai_reply = "".join(parts)
+        logger.info("生成回复", extra={"fields": {"stream": True, **body_fields(ai_reply, 'reply')}})
+        if cache_key:
+            await run_sync(response_cache.set, cache_key, ai_reply)
+        if on_complete:
+            await run_sync(on_complete, ai_reply)
+        yield sse_event({"reply": ai_reply}, event="done")
+    except Exception as e:
+        if not isinstance(e, GatewayBusyError):
+            model_router.record(decision, time.perf_counter() - started)
+        logger.exception("流式回复失败")
+        yield sse_event({"error": str(e)}, event="error")
+    finally:
+        await upstream.aclose()
+
+async def _single_event(payload):
+    yield payload
+
+async def reply(scope, receive, send, headers: Dict[str, str]):
+    """POST /api/reply：与 GLM.reply 相同的请求和响应格式"""
+    cors = _cors_headers(headers)
+    try:
+        data = json.loads(await _read_body(receive) or b'{}')
+    except ValueError:
+        return await _send_json(send, 400, {"error": "请求体不是有效的JSON"}, cors)
+    if not isinstance(data, dict):
+        data = {}
+
+    identity = identity_for('reply', _client_ip(scope, headers), headers.get('authorization', ''))
+    try:
+        await run_sync(_check_rate_limit, 'reply', identity)
+    except RateLimitedError as e:
+        return await _send_json(send, 429, {"success": False, "error": str(e)},
+                                cors + [(b'retry-after', str(e.retry_after).encode())])
+
+    user_message = data.get('message')
+    if not user_message:
+        return await _send_json(send, 400, {"error": "消息为空"}, cors)
+    # 登录用户提供 conversationId 时，追问会带上同一段对话的历史
+    memory_key = conversation_key(identity['user'], data.get('conversationId'))
+    history = await run_sync(conversation_history, memory_key, data.get('educationContext'))
+    full_prompt = build_prompt(user_message, data.get('selectedLayer'), data.get('taskName'),
+                               data.get('educationContext'), history)
+    logger.info("提示词", extra={"fields": body_fields(full_prompt, 'prompt')})
+    stream = data.get('stream') is True or 'text/event-stream' in headers.get('accept', '')
+
+    # 请求体 cache=false 时跳过缓存，每次都重新生成
+    decision = model_router.route(user_message, data.get('selectedLayer'), data.get('educationContext'), full_prompt)
+    cache_key = None
+    similar_key = None
+    if data.get('cache', True) is not False:
+        cache_key = make_cache_key(full_prompt, decision.cache_params)
+        cached_reply = await run_sync(find_cached_reply, cache_key)
+        if history is None:
+            similar_key = context_key(data.get('selectedLayer'), data.get('taskName'), data.get('educationContext'),
+                                      MODEL_TIERS['primary'])
+        if cached_reply is None and similar_key:
+            cached_reply = await run_sync(similar_reply, user_message, similar_key)
+        if cached_reply is not None:
+            if memory_key:
+                await run_sync(remember_turn, memory_key, user_message, cached_reply)
+            if stream:
+                event = sse_event({"delta": cached_reply}) + sse_event({"reply": cached_reply, "cached": True},
+                                                                       event="done")
+                return await _send_sse(send, receive, _single_event(event), cors)
+            return await _send_json(send, 200, {"reply": cached_reply, "cached": True}, cors)
+    # 降级期间的回复不写入缓存和相似问题索引
+    store_key = None if decision.fallback else cache_key
+    on_complete = on_reply_complete(user_message, None if decision.fallback else similar_key, memory_key)
+
+    try:
+        if stream:
+            await run_sync(_check_rate_limit, 'llm', {})
+            return await _send_sse(send, receive, stream_events(full_prompt, decision, store_key, on_complete), cors)
+        if cache_key:
+            ai_reply = await state['single_flight'].do(
+                cache_key, lambda: generate_reply(full_prompt, decision, store_key))
+        else:
+            ai_reply = await generate_reply(full_prompt, decision)
+        if on_complete:
+            await run_sync(on_complete, ai_reply)
+        return await _send_json(send, 200, {"reply": ai_reply}, cors)
+    except RateLimitedError as e:
+        await _send_json(send, 429, {"success": False, "error": str(e)},
+                         cors + [(b'retry-after', str(e.retry_after).encode())])
+    except GatewayBusyError as e:
+        await _send_json(send, 503, {"error": str(e)}, cors + [(b'retry-after', str(e.retry_after).encode())])
+    except (DeadlineExceededError, asyncio.TimeoutError) as e:
+        await _send_json(send, 504, {"error": str(e) or "等待相同请求的回复超时"}, cors)
+    except Exception as e:
+        logger.exception("生成回复失败")
+        await _send_json(send, 500, {"error": str(e)}, cors)
+
+# ==================== 其余路由转交 Flask ====================
+
+def _call_wsgi(environ: Dict[str, Any]) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    response: Dict[str, Any] = {}
+    chunks: List[bytes] = []
+
+    def start_response(status, response_headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                               for name, value in response_headers]
+        return chunks.append
+
+    result = flask_app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+async def call_flask(scope, receive, send):
+    """把请求转换为 WSGI environ，在线程池中由 Flask 处理"""
+    body = await _read_body(receive)
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in _headers(scope).items():
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'content-length':
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+    status, headers, content = await run_sync(_call_wsgi, environ)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": content})
+
+# ==================== ASGI 应用 ====================
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await run_sync(_initialize)
+                state['gateway'] = _create_gateway()
+                state['single_flight'] = AsyncSingleFlight()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message['type'] == 'lifespan.shutdown':
+            provider = state['gateway'].provider if state['gateway'] else None
+            if hasattr(provider, 'aclose'):
+                await provider.aclose()
+            executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+def _stats_handler(component: str):
+    """异步组件的统计，与 Flask 的统计接口一样需要管理员令牌；启动完成前返回 initialized: false"""
+    async def handler(scope, receive, send, headers):
+        cors = _cors_headers(headers)
+        error = admin_token_error(config.get('ADMIN_TOKEN'), headers.get('x-admin-token', ''))
+        if error is not None:
+            return await _send_json(send, error[1], error[0], cors)
+        target = state[component]
+        return await _send_json(send, 200, target.stats() if target is not None else {"initialized": False}, cors)
+    return handler
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    path, method = scope['path'], scope['method']
+    if path == '/api/reply' and method == 'POST':
+        route, handler = path, reply
+    elif path == '/api/reply/gateway/stats' and method == 'GET':
+        route, handler = path, _stats_handler('gateway')
+    elif path == '/api/reply/single-flight/stats' and method == 'GET':
+        route, handler = path, _stats_handler('single_flight')
+    else:
+        # Flask 自行记录请求指标
+        return await call_flask(scope, receive, send)
+
+    # 与 Flask 相同的请求指标（流式响应记录的是完整时长）
+    start = time.perf_counter()
+    status = {"code": 500}
+    headers = _headers(scope)
+    request_id = new_request_id(headers.get('x-request-id'))
+
+    async def send_with_status(message):
+        if message['type'] == 'http.response.start':
+            status['code'] = message['status']
+            message['headers'] = list(message['headers']) + [(b'x-request-id', request_id.encode('latin-1'))]
+        await send(message)
+
+    metrics.HTTP_IN_FLIGHT.inc()
+    try:
+        await handler(scope, receive, send_with_status, headers)
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        code = str(status['code'])
+        metrics.HTTP_REQUESTS.inc(route, method, code)
+        duration = time.perf_counter() - start
+        metrics.HTTP_LATENCY.observe(duration, route, method, code)
+        logger.info("请求完成", extra={"fields": {"route": route, "method": method, "status": status['code'],
+                                              "duration_ms": round(duration * 1000, 1)}})
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run('asgi:app', app_dir=os.path.dirname(os.path.abspath(__file__)),
+                host=config['HOST'], port=config['PORT'], workers=config['WORKERS'],
+                timeout_keep_alive=config['KEEPALIVE'])
@@ -3,36 +3,160 @@
 """
 import jwt
 import bcrypt
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any, List
 import os
 
+from metrics import BCRYPT_LATENCY
+from structured_logging import get_logger
+
+logger = get_logger('auth')
+
 # JWT密钥（生产环境应该从环境变量读取）
 JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'bbvdle-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 168  # 7天
 
+# bcrypt 配置：BCRYPT_ROUNDS 固定成本因子；未设置时在启动时按 BCRYPT_TARGET_MS 校准
+BCRYPT_ROUNDS = os.environ.get('BCRYPT_ROUNDS')
+BCRYPT_TARGET_MS = float(os.environ.get('BCRYPT_TARGET_MS', '250'))
+BCRYPT_DEFAULT_ROUNDS = 12  # 与 bcrypt.gensalt() 默认值一致
+# 校准只会提高成本因子，不会低于 BCRYPT_MIN_ROUNDS（默认与之前固定的 12 相同；降低需要显式设置）
+BCRYPT_MIN_ROUNDS = int(os.environ.get('BCRYPT_MIN_ROUNDS', str(BCRYPT_DEFAULT_ROUNDS)))
+BCRYPT_MAX_ROUNDS = 14
+BCRYPT_PROBE_ROUNDS = 10  # 校准时实际测量的成本因子，更高的按耗时翻倍推算
+# bcrypt 线程池大小与排队上限（bcrypt 计算时释放GIL，线程即可利用多核）
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+BCRYPT_MAX_QUEUE = int(os.environ.get('BCRYPT_MAX_QUEUE', '32'))
+
+class AuthBusyError(Exception):
+    """bcrypt 线程池已饱和，调用方应返回 503 并带上 Retry-After"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("认证服务繁忙，请稍后重试")
+        self.retry_after = retry_after
+
+_bcrypt_rounds = int(BCRYPT_ROUNDS) if BCRYPT_ROUNDS else BCRYPT_DEFAULT_ROUNDS
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+# 正在执行和排队的 bcrypt 任务总数上限
+_bcrypt_slots = threading.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_MAX_QUEUE)
+_bcrypt_last_ms = [BCRYPT_TARGET_MS]  # 最近一次 bcrypt 耗时，用于估算 Retry-After
+
+def get_bcrypt_rounds() -> int:
+    """当前使用的 bcrypt 成本因子"""
+    return _bcrypt_rounds
+
+def calibrate_bcrypt_rounds(target_ms: float = BCRYPT_TARGET_MS) -> int:
+    """测量本机 bcrypt 速度，选择耗时不超过 target_ms 的最大成本因子，但不低于 BCRYPT_MIN_ROUNDS
+    （设置了 BCRYPT_ROUNDS 时不校准）"""
+    global _bcrypt_rounds
+    if BCRYPT_ROUNDS:
+        return _bcrypt_rounds
+    start = time.perf_counter()
+    bcrypt.hashpw(b'calibration', bcrypt.gensalt(BCRYPT_PROBE_ROUNDS))
+    # 成本因子每加 1，耗时翻倍
+    rounds = max(4, min(BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS))
+    elapsed_ms = (time.perf_counter() - start) * 1000 * 2 ** (rounds - BCRYPT_PROBE_ROUNDS)
+    while rounds < BCRYPT_MAX_ROUNDS and elapsed_ms * 2 <= target_ms:
+        rounds += 1
+        elapsed_ms *= 2
+    _bcrypt_rounds = rounds
+    _bcrypt_last_ms[0] = elapsed_ms
+    logger.info("bcrypt 成本因子校准为 %d（约 %.0fms）", rounds, elapsed_ms)
+    return rounds
+
+def _run_bcrypt(operation: str, fn: Callable, *args):
+    """在 bcrypt 线程池中执行并等待结果，线程池饱和时抛出 AuthBusyError"""
+    if not _bcrypt_slots.acquire(blocking=False):
+        queued = BCRYPT_WORKERS + BCRYPT_MAX_QUEUE
+        raise AuthBusyError(max(1, round(queued / BCRYPT_WORKERS * _bcrypt_last_ms[0] / 1000)))
+    try:
+        future = _bcrypt_executor.submit(_timed, operation, fn, *args)
+    except Exception:
+        _bcrypt_slots.release()
+        raise
+    future.add_done_callback(lambda _: _bcrypt_slots.release())
+    return future.result()
+
+def _timed(operation: str, fn: Callable, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        _bcrypt_last_ms[0] = elapsed * 1000
+        BCRYPT_LATENCY.observe(elapsed, operation)
+
+def _hashpw(password: bytes, rounds: int) -> str:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _checkpw(password: bytes, password_hash: bytes) -> bool:
+    try:
+        return bcrypt.checkpw(password, password_hash)
+    except Exception:
+        return False
+
 def hash_password(password: str) -> str:
     """使用bcrypt加密密码"""
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+    return _run_bcrypt('hash', _hashpw, password.encode('utf-8'), _bcrypt_rounds)
+
+def hash_passwords(passwords: List[str], workers: Optional[int] = None, rounds: Optional[int] = None) -> List[str]:
+    """批量加密密码（班级名单导入），使用独立线程池并行计算，不占用登录注册的 bcrypt 线程池；
+    线程数默认与 BCRYPT_WORKERS 相同，在服务进程中调用时两个线程池合计不会占满全部核心"""
+    workers = workers or BCRYPT_WORKERS
+    rounds = rounds or _bcrypt_rounds
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt-bulk') as executor:
+        return list(executor.map(
+            lambda password: _timed('bulk_hash', _hashpw, password.encode('utf-8'), rounds), passwords))
 
 def verify_password(password: str, password_hash: str) -> bool:
     """验证密码"""
+    return _run_bcrypt('verify', _checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def needs_rehash(password_hash: str) -> bool:
+    """密码哈希的成本因子是否低于当前配置（格式 $2b$12$...）"""
+    try:
+        return int(password_hash.split('$')[2]) < _bcrypt_rounds
+    except (IndexError, ValueError):
+        return False
+
+def rehash_password_async(password: str, on_done: Callable[[str], None]) -> bool:
+    """在后台用当前成本因子重新哈希并回调 on_done(new_hash)；线程池繁忙时放弃，返回 False"""
+    if not _bcrypt_slots.acquire(blocking=False):
+        return False
+
+    def task():
+        try:
+            on_done(_timed('rehash', _hashpw, password.encode('utf-8'), _bcrypt_rounds))
+        except Exception as e:
+            logger.warning("密码哈希升级失败: %s", e)
+        finally:
+            _bcrypt_slots.release()
+
     try:
-        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+        _bcrypt_executor.submit(task)
     except Exception:
+        _bcrypt_slots.release()
         return False
+    return True
 
-def generate_token(user_id: int, username: str) -> str:
-    """生成JWT token"""
+def generate_token(user_id: int, username: str, email: Optional[str] = None,
+                   expires_at: Optional[datetime] = None) -> str:
+    """生成JWT token（jti 唯一标识每个 token，用于登出时吊销）；expires_at 为会话的过期时间（UTC），
+    无状态模式只校验 exp，两者必须一致"""
     payload = {
         'user_id': user_id,
         'username': username,
-        'exp': datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS),
-        'iat': datetime.utcnow()
+        'exp': expires_at or datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS),
+        'iat': datetime.utcnow(),
+        'jti': uuid.uuid4().hex
     }
+    if email is not None:
+        payload['email'] = email
     token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
     return token
 
@@ -0,0 +1,54 @@
+"""
+后端配置：默认值来自环境变量，create_app(config) 传入的字典可以覆盖
+"""
+import os
+from typing import Any, Dict
+
+# 项目根目录（不依赖启动时的工作目录）
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+def _default_rate_limit_db() -> str:
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm/bbvdle_ratelimit.db'
+    return os.path.join(ROOT_DIR, 'data', 'ratelimit.db')
+
+def load_config() -> Dict[str, Any]:
+    """从环境变量读取配置"""
+    cpu_count = os.cpu_count() or 1
+    workers = int(os.environ.get('BBVDLE_WORKERS', str(cpu_count)))
+    return {
+        # 数据库与大模型
+        'DB_PATH': os.environ.get('BBVDLE_DB_PATH', os.path.join(ROOT_DIR, 'data', 'bbvdle.db')),
+        'ZHIPUAI_API_KEY': os.environ.get('ZHIPUAI_API_KEY'),  # 优先于密钥文件
+        'ZHIPUAI_KEY_FILE': os.environ.get('BBVDLE_ZHIPUAI_KEY_FILE', os.path.join(ROOT_DIR, 'dist', 'zhipuai_key.txt')),
+        'LLM_PROVIDER': os.environ.get('BBVDLE_LLM_PROVIDER', 'zhipuai'),  # zhipuai | fake
+        'SESSION_REAP_INTERVAL': float(os.environ.get('BBVDLE_SESSION_REAP_INTERVAL', '300')),
+        'CORS_ORIGINS': os.environ.get('BBVDLE_CORS_ORIGINS', '*'),
+        # session：每次验证查询会话表；stateless：只校验 JWT 签名和吊销列表，不访问数据库
+        'AUTH_MODE': os.environ.get('BBVDLE_AUTH_MODE', 'session'),
+        # 限流：memory 为进程内状态，多进程时每个进程各有一份限额（全局 llm 预算变为 进程数 倍）；
+        # sqlite 在同一台机器的多个进程间共享（文件建议放在 /dev/shm），多于一个进程时默认使用
+        'RATE_LIMIT_ENABLED': _env_bool('BBVDLE_RATE_LIMIT_ENABLED', True),
+        'RATE_LIMIT_BACKEND': os.environ.get('BBVDLE_RATE_LIMIT_BACKEND', 'sqlite' if workers > 1 else 'memory'),
+        'RATE_LIMIT_DB': os.environ.get('BBVDLE_RATE_LIMIT_DB', _default_rate_limit_db()),
+        'RATE_LIMITS': os.environ.get('BBVDLE_RATE_LIMITS'),  # JSON，覆盖 rate_limit.py 中的默认限额
+        'PROXY_COUNT': int(os.environ.get('BBVDLE_PROXY_COUNT', '0')),  # 前面的反向代理层数，用于获取客户端真实 IP
+        'ADMIN_TOKEN': os.environ.get('BBVDLE_ADMIN_TOKEN'),  # 管理接口的令牌，未设置时管理接口不可用
+        # 启动时加载前端的静态文件（ip.txt、tasksteps.json、教学图片），带 ETag 和预压缩版本
+        'STATIC_ASSETS_ENABLED': _env_bool('BBVDLE_STATIC_ASSETS', True),
+        # 开发服务器（python GLM.py）
+        'HOST': os.environ.get('BBVDLE_HOST', '127.0.0.1'),
+        'PORT': int(os.environ.get('BBVDLE_PORT', '5000')),
+        'DEBUG': _env_bool('BBVDLE_DEBUG', False),
+        # 生产服务器（wsgi.py / gunicorn.conf.py）
+        'WORKERS': workers,
+        'THREADS': int(os.environ.get('BBVDLE_THREADS', '8')),
+        'KEEPALIVE': int(os.environ.get('BBVDLE_KEEPALIVE', '5')),
+        'TIMEOUT': int(os.environ.get('BBVDLE_TIMEOUT', '120')),  # 需大于大模型调用的截止时间
+    }
@@ -0,0 +1,87 @@
+"""
+AI助手的服务端对话记忆：按 (用户, 对话) 保存最近几轮问答，追问时 build_prompt 把历史放进提示词
+- 每轮只保存截断后的问题和回答；最近几轮的估计 token 数超过 HISTORY_TOKENS 时，最早的轮次折叠为一行摘要
+  （问题和回答的第一句话），摘要也超过 SUMMARY_TOKENS 时丢弃最早的摘要行
+- 摘要由规则抽取，不额外调用大模型；保存在 ai_conversations 表中，多个进程共享，超过 TTL 未更新的对话视为过期
+"""
+import json
+import os
+import re
+import time
+from typing import List, Optional, Tuple
+
+from database import get_conversation, update_conversation
+from prompt_builder import estimate_tokens
+
+# 配置（可通过环境变量调整）
+CONVERSATION_MEMORY_ENABLED = os.environ.get('BBVDLE_CONVERSATION_MEMORY', '1').lower() in ('1', 'true', 'yes')
+CONVERSATION_TTL = float(os.environ.get('BBVDLE_CONVERSATION_TTL', '7200'))  # 秒
+CONVERSATION_HISTORY_TOKENS = int(os.environ.get('BBVDLE_CONVERSATION_HISTORY_TOKENS', '1200'))
+CONVERSATION_SUMMARY_TOKENS = int(os.environ.get('BBVDLE_CONVERSATION_SUMMARY_TOKENS', '300'))
+
+# 每轮保存的问题和回答的最大字数
+TURN_QUESTION_CHARS = 300
+TURN_ANSWER_CHARS = 600
+# 摘要行中问题和回答的最大字数
+SUMMARY_QUESTION_CHARS = 60
+SUMMARY_ANSWER_CHARS = 80
+MAX_CONVERSATION_ID_LENGTH = 64
+
+_SENTENCE_END = re.compile(r'(?<=[。！？!?\n])')
+
+class Conversation:
+    """一段对话：summary 为更早轮次的摘要行，turns 为最近的 (问题, 回答)"""
+    __slots__ = ('summary', 'turns')
+
+    def __init__(self, summary: Optional[List[str]] = None, turns: Optional[List[Tuple[str, str]]] = None):
+        self.summary = summary or []
+        self.turns = turns or []
+
+def conversation_key(user_id: Optional[str], conversation_id) -> Optional[str]:
+    """登录用户的对话标识；未登录或客户端没有提供对话ID时不记录历史"""
+    if not CONVERSATION_MEMORY_ENABLED or not user_id or conversation_id is None:
+        return None
+    conversation_id = str(conversation_id)
+    if not conversation_id or len(conversation_id) > MAX_CONVERSATION_ID_LENGTH:
+        return None
+    return f"{user_id}:{conversation_id}"
+
+def load_conversation(key: str) -> Conversation:
+    """读取未过期的对话，不存在时返回空对话"""
+    return _parse(get_conversation(key, time.time() - CONVERSATION_TTL))
+
+def record_turn(key: str, question: str, answer: str) -> Conversation:
+    """追加一轮问答，超出预算的旧轮次折叠进摘要后保存（读取和写回在同一个写事务中）"""
+    turn = (_clip(question, TURN_QUESTION_CHARS), _clip(answer, TURN_ANSWER_CHARS))
+    result = []
+
+    def append(row) -> Tuple[str, str]:
+        conversation = _parse(row)
+        conversation.turns.append(turn)
+        while len(conversation.turns) > 1 and _turns_tokens(conversation.turns) > CONVERSATION_HISTORY_TOKENS:
+            conversation.summary.append(summarize_turn(*conversation.turns.pop(0)))
+        while conversation.summary and estimate_tokens("\n".join(conversation.summary)) > CONVERSATION_SUMMARY_TOKENS:
+            conversation.summary.pop(0)
+        result[:] = [conversation]
+        return (json.dumps(conversation.summary, ensure_ascii=False),
+                json.dumps(conversation.turns, ensure_ascii=False))
+
+    update_conversation(key, time.time() - CONVERSATION_TTL, append)
+    return result[0]
+
+def summarize_turn(question: str, answer: str) -> str:
+    """一轮问答的摘要行：问题 + 回答的第一句话"""
+    first_sentence = next((part.strip() for part in _SENTENCE_END.split(answer) if part.strip()), '')
+    return f"问：{_clip(' '.join(question.split()), SUMMARY_QUESTION_CHARS)}；" \
+           f"答：{_clip(first_sentence, SUMMARY_ANSWER_CHARS)}"
+
+def _parse(row) -> Conversation:
+    if row is None:
+        return Conversation()
+    return Conversation(json.loads(row['summary']), [tuple(turn) for turn in json.loads(row['turns'])])
+
+def _turns_tokens(turns: List[Tuple[str, str]]) -> int:
+    return sum(estimate_tokens(question) + estimate_tokens(answer) for question, answer in turns)
+
+def _clip(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars] + "…"
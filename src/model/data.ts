@@ -4,6 +4,7 @@ import * as tf from "@tensorflow/tfjs";
 import { Rank, Tensor } from "@tensorflow/tfjs";
 import { Cifar10 } from "tfjs-cifar10-web";
 import { model } from "./params_object";
+import { getApiBaseUrl } from "../ui/auth/authService";
 
 const NUM_DATASET_ELEMENTS = 65000;
 
@@ -481,6 +482,39 @@ export class AirPassengersData {
         return {sequences, targets};
     }
 
+    /**
+     * 从后端 /api/timeseries/airpassengers 获取归一化后的训练/测试窗口
+     * 数据格式：float32 头部 [timeSteps, 训练样本数, 测试样本数, min, max]，随后为 x_train、y_train、x_test、y_test
+     * 成功时创建Tensor并返回true，请求失败或数据不一致时返回false
+     */
+    private async loadFromServer(): Promise<boolean> {
+        try {
+            const apiBaseUrl = await getApiBaseUrl();
+            const response = await fetch(`${apiBaseUrl}/timeseries/airpassengers?time_step=${this.timeSteps}&split=0.8`);
+            if (!response.ok) {
+                return false;
+            }
+            const values = new Float32Array(await response.arrayBuffer());
+            const [timeSteps, numTrain, numTest] = Array.from(values.subarray(0, 3));
+            if (timeSteps !== this.timeSteps || values.length !== 5 + (numTrain + numTest) * (timeSteps + 1)) {
+                return false;
+            }
+            this.minValue = values[3];
+            this.maxValue = values[4];
+
+            let offset = 5;
+            const take = (count: number): Float32Array => values.subarray(offset, offset += count);
+            this.trainData = tf.tensor3d(take(numTrain * timeSteps), [numTrain, timeSteps, 1]);
+            this.trainLabels = tf.tensor2d(take(numTrain), [numTrain, 1]);
+            this.testData = tf.tensor3d(take(numTest * timeSteps), [numTest, timeSteps, 1]);
+            this.testLabels = tf.tensor2d(take(numTest), [numTest, 1]);
+            return true;
+        } catch (error) {
+            console.warn("获取服务端时序窗口失败，改为本地计算:", error);
+            return false;
+        }
+    }
+
     public async load(): Promise<void> {
         if (this.dataLoaded) {
             return;
@@ -503,6 +537,13 @@ export class AirPassengersData {
             
             console.log(`AirPassengers数据归一化参数: min=${this.minValue}, max=${this.maxValue} (基于全量${this.rawData.length}个数据点)`);
 
+            // 优先使用后端预先计算好的窗口（float32 二进制，浏览器按 ETag 缓存），后端不可用时在本地计算
+            if (await this.loadFromServer()) {
+                this.dataLoaded = true;
+                console.log(`AirPassengers数据加载完成（服务端窗口）: 训练样本${this.trainData.shape[0]}个, 测试样本${this.testData.shape[0]}个`);
+                return;
+            }
+
             // 第一步：创建全量序列（基于完整rawData）
             // 这样可以确保所有序列都使用相同的归一化参数，避免数据泄露
             const {sequences: allSequences, targets: allTargets} = this.createSequences(this.rawData, this.timeSteps);
@@ -3,160 +3,472 @@
 """
 import sqlite3
 import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Any, Callable, Dict, Optional, Tuple
 import hashlib
+import time
+
+from auth_utils import JWT_EXPIRATION_HOURS
+from metrics import timed_query
+from migrations import migrate, get_version
+from revocation import revocation_list
+from session_cache import session_cache
+from structured_logging import get_logger
+
+logger = get_logger('database')
 
 DB_PATH = os.path.join(os.path.dirname(__file__), '../../data', 'bbvdle.db')
 
+# 连接池配置（可通过环境变量调整）
+DB_POOL_SIZE = int(os.environ.get('BBVDLE_DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.environ.get('BBVDLE_DB_POOL_TIMEOUT', '10'))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('BBVDLE_DB_BUSY_TIMEOUT_MS', '5000'))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('BBVDLE_DB_STATEMENT_CACHE_SIZE', '128'))
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """创建一个已调优的数据库连接（WAL、busy_timeout、synchronous=NORMAL）"""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,  # 连接会在线程间复用，由连接池保证同一时刻只被一个线程持有
+        cached_statements=DB_STATEMENT_CACHE_SIZE,  # 预编译语句缓存
+    )
+    conn.row_factory = sqlite3.Row  # 使返回结果可以像字典一样访问
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+class ConnectionPool:
+    """线程安全的SQLite连接池"""
+
+    def __init__(self, db_path: str, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=self.size)  # 后进先出，优先复用热连接
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        # 确保数据目录存在（只在创建连接池时执行一次）
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    def acquire(self) -> sqlite3.Connection:
+        """借出一个连接，连接池耗尽时最多等待 timeout 秒"""
+        if self._closed:
+            raise RuntimeError("连接池已关闭")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return _connect(self.db_path)
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("获取数据库连接超时")
+
+    def release(self, conn: sqlite3.Connection):
+        """归还连接，未提交的事务会被回滚"""
+        if self._closed:
+            conn.close()
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # 连接已损坏，丢弃并允许重新创建
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """以上下文管理器的方式借用连接"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """关闭连接池中所有空闲连接"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """获取（必要时懒加载）当前 DB_PATH 对应的连接池"""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.db_path == DB_PATH:
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.db_path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+def close_pool():
+    """关闭连接池（进程退出或 fork 前调用）"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def db_connection():
+    """从连接池借用连接：with db_connection() as conn: ..."""
+    return get_pool().connection()
+
 def get_db_connection():
-    """获取数据库连接"""
+    """获取一个独立的数据库连接（调用方负责 close，常规查询请使用 db_connection）"""
     # 确保数据目录存在
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # 使返回结果可以像字典一样访问
-    return conn
+    return _connect(DB_PATH)
 
+@timed_query
 def init_database():
-    """初始化数据库表"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 创建用户表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username VARCHAR(50) UNIQUE NOT NULL,
-            email VARCHAR(100) UNIQUE NOT NULL,
-            password_hash VARCHAR(255) NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            last_login DATETIME,
-            is_active BOOLEAN DEFAULT 1
-        )
-    ''')
-    
-    # 创建用户会话表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            token VARCHAR(500) UNIQUE NOT NULL,
-            expires_at DATETIME NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    print(f"数据库初始化完成: {DB_PATH}")
+    """初始化数据库：执行尚未执行的结构迁移（见 migrations.py）"""
+    with db_connection() as conn:
+        migrate(conn)
+        version = get_version(conn)
+    logger.info("数据库初始化完成: %s（版本 %d）", DB_PATH, version)
 
+@timed_query
 def create_user(username: str, email: str, password_hash: str) -> Optional[int]:
     """创建新用户"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute('''
-            INSERT INTO users (username, email, password_hash)
-            VALUES (?, ?, ?)
-        ''', (username, email, password_hash))
-        conn.commit()
-        user_id = cursor.lastrowid
-        return user_id
-    except sqlite3.IntegrityError as e:
-        if 'username' in str(e):
-            raise ValueError("用户名已存在")
-        elif 'email' in str(e):
-            raise ValueError("邮箱已被注册")
-        raise
-    finally:
-        conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO users (username, email, password_hash)
+                VALUES (?, ?, ?)
+            ''', (username, email, password_hash))
+            conn.commit()
+            user_id = cursor.lastrowid
+            return user_id
+        except sqlite3.IntegrityError as e:
+            if 'username' in str(e):
+                raise ValueError("用户名已存在")
+            elif 'email' in str(e):
+                raise ValueError("邮箱已被注册")
+            raise
 
+@timed_query
 def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
     """根据用户名获取用户"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-    row = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        row = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
     if row:
         return dict(row)
     return None
 
+@timed_query
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     """根据邮箱获取用户"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-    row = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        row = conn.execute('SELECT * FROM users WHERE email = ? COLLATE NOCASE', (email,)).fetchone()
     if row:
         return dict(row)
     return None
 
+@timed_query
 def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
     """根据ID获取用户"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        row = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
     if row:
         return dict(row)
     return None
 
+@timed_query
 def update_last_login(user_id: int):
     """更新最后登录时间"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE users SET last_login = ? WHERE id = ?
-    ''', (datetime.now().isoformat(), user_id))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute('''
+            UPDATE users SET last_login = ? WHERE id = ?
+        ''', (datetime.now().isoformat(), user_id))
+        conn.commit()
+
+@timed_query
+def update_password_hash(user_id: int, password_hash: str):
+    """更新密码哈希（成本因子升级时使用）"""
+    with db_connection() as conn:
+        conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
+        conn.commit()
 
+@timed_query
 def save_session(user_id: int, token: str, expires_at: datetime):
     """保存用户会话"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO user_sessions (user_id, token, expires_at)
-        VALUES (?, ?, ?)
-    ''', (user_id, token, expires_at.isoformat()))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute('''
+            INSERT INTO user_sessions (user_id, token, expires_at)
+            VALUES (?, ?, ?)
+        ''', (user_id, token, expires_at.isoformat(sep=' ')))  # 与 datetime('now') 格式一致，按字符串比较
+        conn.commit()
 
+@timed_query
 def get_session_by_token(token: str) -> Optional[Dict[str, Any]]:
     """根据token获取会话"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT s.*, u.username, u.email, u.is_active
-        FROM user_sessions s
-        JOIN users u ON s.user_id = u.id
-        WHERE s.token = ? AND s.expires_at > datetime('now')
-    ''', (token,))
-    row = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        row = conn.execute('''
+            SELECT s.*, u.username, u.email, u.is_active
+            FROM user_sessions s
+            JOIN users u ON s.user_id = u.id
+            WHERE s.token = ? AND s.expires_at > datetime('now')
+        ''', (token,)).fetchone()
     if row:
         return dict(row)
     return None
 
+@timed_query
 def delete_session(token: str):
     """删除会话"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM user_sessions WHERE token = ?', (token,))
-    conn.commit()
-    conn.close()
-
-def delete_expired_sessions():
-    """删除过期会话"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM user_sessions WHERE expires_at < datetime('now')")
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute('DELETE FROM user_sessions WHERE token = ?', (token,))
+        conn.commit()
+    session_cache.invalidate_token(token)
+
+@timed_query
+def set_user_active(user_id: int, is_active: bool) -> bool:
+    """启用或禁用用户；禁用时吊销该用户此前签发的所有 token。用户不存在时返回 False"""
+    # JWT 的 iat 为整数秒，截止时间也取整数秒：同一秒内签发的 token 一律视为已吊销
+    revoked_before = int(time.time())
+    expires_at = revoked_before + JWT_EXPIRATION_HOURS * 3600
+    with db_connection() as conn:
+        cursor = conn.execute('UPDATE users SET is_active = ? WHERE id = ?', (1 if is_active else 0, user_id))
+        if cursor.rowcount == 0:
+            return False
+        if not is_active:
+            conn.execute('''
+                INSERT OR REPLACE INTO revoked_users (user_id, revoked_before, expires_at)
+                VALUES (?, ?, ?)
+            ''', (user_id, revoked_before, expires_at))
+        conn.commit()
+    if not is_active:
+        session_cache.invalidate_user(user_id)
+        revocation_list.add_user(user_id, revoked_before, expires_at)
+    return True
+
+@timed_query
+def revoke_token(jti: str, expires_at: float):
+    """吊销单个 token（登出时调用），expires_at 为 token 的过期时间戳"""
+    with db_connection() as conn:
+        conn.execute('INSERT OR IGNORE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)', (jti, expires_at))
+        conn.commit()
+    revocation_list.add_token(jti, expires_at)
+
+@timed_query
+def load_revocations():
+    """从数据库重新加载吊销列表（多进程部署时同步其它进程的登出和禁用）"""
+    now = time.time()
+    with db_connection() as conn:
+        tokens = conn.execute('SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > ?', (now,)).fetchall()
+        users = conn.execute('''
+            SELECT user_id, revoked_before, expires_at FROM revoked_users WHERE expires_at > ?
+        ''', (now,)).fetchall()
+    revocation_list.replace([tuple(row) for row in tokens], [tuple(row) for row in users])
+
+@timed_query
+def delete_expired_revocations() -> int:
+    """删除已过期的吊销记录，返回删除数量"""
+    now = time.time()
+    with db_connection() as conn:
+        deleted = conn.execute('DELETE FROM revoked_tokens WHERE expires_at <= ?', (now,)).rowcount
+        deleted += conn.execute('DELETE FROM revoked_users WHERE expires_at <= ?', (now,)).rowcount
+        conn.commit()
+    return deleted
+
+@timed_query
+def delete_expired_sessions(batch_size: int = 500) -> int:
+    """分批删除过期会话，每批单独提交以尽快释放写锁，返回删除总数"""
+    deleted = 0
+    with db_connection() as conn:
+        while True:
+            cursor = conn.execute('''
+                DELETE FROM user_sessions WHERE id IN (
+                    SELECT id FROM user_sessions
+                    WHERE expires_at < datetime('now')
+                    LIMIT ?
+                )
+            ''', (batch_size,))
+            conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+    return deleted
+
+@timed_query
+def get_cached_response(cache_key: str, min_created_at: float) -> Optional[Dict[str, Any]]:
+    """获取未过期的AI回复缓存（与内存缓存一致，存在时间达到 TTL 即视为过期）"""
+    with db_connection() as conn:
+        row = conn.execute('''
+            SELECT response, created_at FROM ai_response_cache
+            WHERE cache_key = ? AND created_at > ?
+        ''', (cache_key, min_created_at)).fetchone()
+    if row:
+        return dict(row)
+    return None
+
+@timed_query
+def save_cached_response(cache_key: str, response: str, created_at: float):
+    """保存AI回复缓存"""
+    with db_connection() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO ai_response_cache (cache_key, response, created_at)
+            VALUES (?, ?, ?)
+        ''', (cache_key, response, created_at))
+        conn.commit()
+
+@timed_query
+def delete_expired_cached_responses(min_created_at: float) -> int:
+    """删除过期的AI回复缓存，返回删除数量"""
+    with db_connection() as conn:
+        cursor = conn.execute('DELETE FROM ai_response_cache WHERE created_at <= ?', (min_created_at,))
+        conn.commit()
+        return cursor.rowcount
+
+@timed_query
+def get_prewarmed_answer(cache_key: str) -> Optional[str]:
+    """获取离线预热的AI回复"""
+    with db_connection() as conn:
+        row = conn.execute('SELECT response FROM ai_prewarmed_answers WHERE cache_key = ?',
+                           (cache_key,)).fetchone()
+    return row['response'] if row else None
+
+@timed_query
+def save_prewarmed_answer(cache_key: str, response: str, source: str, model: str):
+    """保存离线预热的AI回复（已存在时覆盖）"""
+    with db_connection() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO ai_prewarmed_answers (cache_key, response, source, model, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (cache_key, response, source, model, time.time()))
+        conn.commit()
+
+def get_prewarmed_keys() -> set:
+    """已预热的缓存键（断点续跑时跳过）"""
+    with db_connection() as conn:
+        return {row[0] for row in conn.execute('SELECT cache_key FROM ai_prewarmed_answers')}
+
+def get_similar_questions_version() -> tuple:
+    """相似问题表的版本（条目数和最后修改时间），变化时各进程重新加载索引"""
+    with db_connection() as conn:
+        row = conn.execute('SELECT COUNT(*), MAX(updated_at) FROM ai_similar_questions').fetchone()
+    return tuple(row)
+
+@timed_query
+def get_similar_question_rows() -> list:
+    """构建相似问题索引所需的全部条目（包括已停用的）"""
+    with db_connection() as conn:
+        return conn.execute('''
+            SELECT context_key, question_norm, answer, enabled FROM ai_similar_questions ORDER BY id
+        ''').fetchall()
+
+@timed_query
+def list_similar_questions(query: str = '', limit: int = 50, offset: int = 0) -> list:
+    """管理接口：按问题文字筛选的条目，命中次数多的在前"""
+    with db_connection() as conn:
+        rows = conn.execute('''
+            SELECT id, context_key, question, answer, source, enabled, hits, created_at, updated_at
+            FROM ai_similar_questions WHERE question LIKE ?
+            ORDER BY hits DESC, id DESC LIMIT ? OFFSET ?
+        ''', (f"%{query}%", limit, offset)).fetchall()
+    return [dict(row) for row in rows]
+
+@timed_query
+def save_similar_question(context_key: str, question: str, question_norm: str, answer: str,
+                          source: str = 'curated') -> int:
+    """添加问答，已有相同问题时替换回答并重新启用；返回条目 id"""
+    now = time.time()
+    with db_connection() as conn:
+        conn.execute('''
+            INSERT INTO ai_similar_questions
+                (context_key, question, question_norm, answer, source, enabled, hits, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, 1, 0, ?, ?)
+            ON CONFLICT (context_key, question_norm) DO UPDATE SET
+                question = excluded.question, answer = excluded.answer, source = excluded.source,
+                enabled = 1, updated_at = excluded.updated_at
+        ''', (context_key, question, question_norm, answer, source, now, now))
+        row = conn.execute('SELECT id FROM ai_similar_questions WHERE context_key = ? AND question_norm = ?',
+                           (context_key, question_norm)).fetchone()
+        conn.commit()
+    return row['id']
+
+@timed_query
+def update_similar_question(question_id: int, answer: Optional[str] = None,
+                            enabled: Optional[bool] = None) -> bool:
+    """修改回答或启用状态（修改过的条目标记为 curated），条目不存在时返回 False"""
+    with db_connection() as conn:
+        cursor = conn.execute('''
+            UPDATE ai_similar_questions
+            SET answer = COALESCE(?, answer), enabled = COALESCE(?, enabled),
+                source = 'curated', updated_at = ?
+            WHERE id = ?
+        ''', (answer, None if enabled is None else int(enabled), time.time(), question_id))
+        conn.commit()
+        return cursor.rowcount > 0
+
+@timed_query
+def delete_similar_question(question_id: int) -> bool:
+    """删除条目（之后同一问题可能被重新自动加入，要阻止请改为停用），条目不存在时返回 False"""
+    with db_connection() as conn:
+        cursor = conn.execute('DELETE FROM ai_similar_questions WHERE id = ?', (question_id,))
+        conn.commit()
+        return cursor.rowcount > 0
+
+@timed_query
+def get_conversation(conversation_key: str, min_updated_at: float) -> Optional[Dict[str, Any]]:
+    """获取未过期的对话历史（summary、turns 为 JSON 文本）"""
+    with db_connection() as conn:
+        row = conn.execute('''
+            SELECT summary, turns FROM ai_conversations WHERE conversation_key = ? AND updated_at >= ?
+        ''', (conversation_key, min_updated_at)).fetchone()
+    return dict(row) if row else None
+
+@timed_query
+def update_conversation(conversation_key: str, min_updated_at: float,
+                        update: Callable[[Optional[Dict[str, Any]]], Tuple[str, str]]):
+    """在一个写事务中读取未过期的对话历史，用 update(旧记录或 None) 返回的 (summary, turns) 覆盖"""
+    with db_connection() as conn:
+        # 写锁在事务开始时获取，同一对话的并发追加（包括其它进程）不会互相覆盖
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('''
+            SELECT summary, turns FROM ai_conversations WHERE conversation_key = ? AND updated_at >= ?
+        ''', (conversation_key, min_updated_at)).fetchone()
+        summary, turns = update(dict(row) if row else None)
+        conn.execute('''
+            INSERT OR REPLACE INTO ai_conversations (conversation_key, summary, turns, updated_at)
+            VALUES (?, ?, ?, ?)
+        ''', (conversation_key, summary, turns, time.time()))
+        conn.commit()
+
+@timed_query
+def delete_expired_conversations(min_updated_at: float) -> int:
+    """删除过期的对话历史，返回删除数量"""
+    with db_connection() as conn:
+        cursor = conn.execute('DELETE FROM ai_conversations WHERE updated_at < ?', (min_updated_at,))
+        conn.commit()
+        return cursor.rowcount
 
 # 初始化数据库
 if __name__ == "__main__":
@@ -0,0 +1,26 @@
+"""
+gunicorn 配置：gunicorn -c src/model/gunicorn.conf.py wsgi:app
+所有参数都从环境变量读取（见 config.py），部署时无需修改源码
+"""
+import os
+import sys
+
+# 让 gunicorn 能从任意工作目录找到 wsgi.py 及其同级模块
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, pythonpath)
+
+from config import load_config  # noqa: E402
+
+_config = load_config()
+
+bind = f"{os.environ.get('BBVDLE_HOST', '0.0.0.0')}:{_config['PORT']}"
+workers = _config['WORKERS']
+worker_class = 'gthread'  # 每个进程内多线程，适合等待大模型响应的长请求
+threads = _config['THREADS']
+keepalive = _config['KEEPALIVE']
+timeout = _config['TIMEOUT']
+graceful_timeout = 30
+# 不使用 preload_app：每个进程在 fork 之后各自创建数据库连接池和后台线程
+preload_app = False
+accesslog = '-'
+errorlog = '-'
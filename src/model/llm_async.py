@@ -0,0 +1,312 @@
+"""
+异步大模型网关（ASGI 模式使用）：与 llm_gateway.LLMGateway 相同的并发上限、有界等待、截止时间、重试和熔断，
+但等待上游时只占用一个协程而不是一个线程，单进程可以同时保持数百个进行中的调用
+上游通过 httpx.AsyncClient 直接调用 ZhipuAI 的 HTTP 接口（与 SDK 使用同一个地址和鉴权方式）
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+
+import metrics
+from llm_gateway import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceededError, FakeProvider, GatewayBusyError, LLMError, LLMResult,
+    TransientLLMError, LLM_DEADLINE, LLM_IN_FLIGHT, LLM_MAX_RETRIES, LLM_QUEUE_TIMEOUT, LLM_REJECTED,
+    LLM_RETRIES, LLM_RETRY_BASE_DELAY, LLM_WAITING, RETRYABLE_STATUS_CODES,
+)
+
+# 协程不占用线程，并发上限可以比同步网关高得多（实际上限取决于上游的配额）
+ASYNC_LLM_MAX_CONCURRENCY = int(os.environ.get('BBVDLE_ASYNC_LLM_MAX_CONCURRENCY', '256'))
+ASYNC_LLM_MAX_QUEUE = int(os.environ.get('BBVDLE_ASYNC_LLM_MAX_QUEUE', '512'))
+ZHIPUAI_BASE_URL = os.environ.get('ZHIPUAI_BASE_URL', 'https://open.bigmodel.cn/api/paas/v4')
+
+# ==================== 提供方 ====================
+
+class AsyncZhipuAIProvider:
+    """通过 httpx.AsyncClient 调用 ZhipuAI 的 chat/completions 接口，错误映射与 ZhipuAIProvider 一致"""
+
+    def __init__(self, api_key: str, base_url: str = ZHIPUAI_BASE_URL, client: Optional[httpx.AsyncClient] = None):
+        # 连接池上限与网关并发上限一致，keep-alive 连接在调用之间复用
+        self.client = client or httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            limits=httpx.Limits(max_connections=ASYNC_LLM_MAX_CONCURRENCY,
+                                max_keepalive_connections=ASYNC_LLM_MAX_CONCURRENCY),
+        )
+
+    async def complete(self, messages: List[Dict[str, str]], timeout: float, **params) -> LLMResult:
+        try:
+            response = await self.client.post('/chat/completions', json={"messages": messages, **params},
+                                              timeout=timeout)
+        except httpx.TransportError as e:  # 包括超时和连接失败
+            raise TransientLLMError(str(e)) from e
+        self._check_status(response.status_code, response.text)
+        data = response.json()
+        usage = data.get('usage') or {}
+        return LLMResult(data['choices'][0]['message']['content'], params.get('model', ''),
+                         usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+
+    async def stream(self, messages: List[Dict[str, str]], timeout: float, **params) -> "AsyncZhipuAIStream":
+        request = self.client.build_request('POST', '/chat/completions',
+                                            json={"messages": messages, "stream": True, **params}, timeout=timeout)
+        try:
+            response = await self.client.send(request, stream=True)
+        except httpx.TransportError as e:
+            raise TransientLLMError(str(e)) from e
+        if response.status_code != 200:
+            body = (await response.aread()).decode('utf-8', 'replace')
+            await response.aclose()
+            self._check_status(response.status_code, body)
+        return AsyncZhipuAIStream(response)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    @staticmethod
+    def _check_status(status_code: int, body: str):
+        if status_code in RETRYABLE_STATUS_CODES:
+            raise TransientLLMError(f"上游返回 {status_code}: {body[:200]}")
+        if status_code != 200:
+            raise LLMError(f"上游返回 {status_code}: {body[:200]}")
+
+class AsyncZhipuAIStream:
+    """逐段产出回复文本（解析上游的 SSE）；aclose() 关闭上游连接以终止生成"""
+
+    def __init__(self, response: httpx.Response):
+        self._response = response
+        self.usage = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        try:
+            async for line in self._response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    return
+                chunk = json.loads(data)
+                if chunk.get('usage'):
+                    usage = chunk['usage']
+                    self.usage = LLMResult('', chunk.get('model', ''), usage.get('prompt_tokens', 0),
+                                           usage.get('completion_tokens', 0))
+                for choice in chunk.get('choices') or ():
+                    delta = (choice.get('delta') or {}).get('content')
+                    if delta:
+                        yield delta
+        except httpx.TransportError as e:
+            raise TransientLLMError(str(e)) from e
+
+    async def aclose(self):
+        await self._response.aclose()
+
+class AsyncFakeProvider(FakeProvider):
+    """异步的模拟提供方：用 asyncio.sleep 模拟延迟，便于离线压测 ASGI 模式"""
+
+    async def complete(self, messages: List[Dict[str, str]], timeout: float, **params) -> LLMResult:
+        await self._simulate_async(timeout, self.latency)
+        content = self._reply(messages)
+        return LLMResult(content, params.get('model', 'fake'), len(messages[-1]['content']), len(content))
+
+    async def stream(self, messages: List[Dict[str, str]], timeout: float, **params) -> "AsyncFakeStream":
+        await self._simulate_async(timeout, self.latency / 2)
+        return AsyncFakeStream(self._reply(messages), self.chunks, self.latency / 2)
+
+    async def _simulate_async(self, timeout: float, latency: float):
+        with self._lock:
+            self.calls += 1
+        delay = random.uniform(0.5 * latency, 1.5 * latency)
+        if delay > timeout:
+            await asyncio.sleep(max(0.0, timeout))
+            raise TransientLLMError("模拟上游超时")
+        await asyncio.sleep(delay)
+        if random.random() < self.failure_rate:
+            raise TransientLLMError("模拟上游错误")
+
+class AsyncFakeStream:
+    """模拟的异步流式回复"""
+
+    def __init__(self, content: str, chunks: int, latency: float):
+        self._content = content
+        self._chunks = max(1, chunks)
+        self._latency = latency
+        self._closed = False
+        self.usage = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        size = max(1, len(self._content) // self._chunks + 1)
+        for i in range(0, len(self._content), size):
+            if self._closed:
+                return
+            await asyncio.sleep(self._latency / self._chunks)
+            yield self._content[i:i + size]
+        self.usage = LLMResult(self._content, 'fake', 0, len(self._content))
+
+    async def aclose(self):
+        self._closed = True
+
+# ==================== 网关 ====================
+
+class AsyncLLMGateway:
+    """LLMGateway 的 asyncio 版本，需在同一个事件循环中使用"""
+
+    def __init__(self, provider, max_concurrency: int = ASYNC_LLM_MAX_CONCURRENCY,
+                 max_queue: int = ASYNC_LLM_MAX_QUEUE, queue_timeout: float = LLM_QUEUE_TIMEOUT,
+                 deadline: float = LLM_DEADLINE, max_retries: int = LLM_MAX_RETRIES,
+                 retry_base_delay: float = LLM_RETRY_BASE_DELAY, breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.max_retries = max(0, max_retries)
+        self.retry_base_delay = retry_base_delay
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+    async def complete(self, messages: List[Dict[str, str]], deadline: Optional[float] = None,
+                       **params) -> LLMResult:
+        """异步补全调用，deadline 为本次调用（含排队和重试）的最长秒数"""
+        expires = time.monotonic() + (deadline or self.deadline)
+        model = params.get('model', '')
+        await self._acquire(expires)
+        try:
+            result = await self._with_retries(expires, model,
+                                              lambda timeout: self.provider.complete(messages, timeout, **params))
+        finally:
+            self._release()
+        self._record_usage(model, result)
+        return result
+
+    async def stream(self, messages: List[Dict[str, str]], deadline: Optional[float] = None,
+                     on_usage: Optional[Callable[[Any], None]] = None, **params) -> AsyncIterator[str]:
+        """异步流式调用；关闭生成器（或任务被取消）会关闭上游连接并归还并发名额；完整接收后调用 on_usage"""
+        expires = time.monotonic() + (deadline or self.deadline)
+        model = params.get('model', '')
+        await self._acquire(expires)
+        upstream = None
+        try:
+            upstream = await self._with_retries(expires, model,
+                                                lambda timeout: self.provider.stream(messages, timeout, **params))
+            try:
+                async for delta in upstream:
+                    yield delta
+            except TransientLLMError:
+                self.breaker.record_failure()
+                raise
+            self._record_usage(model, upstream.usage)
+            if on_usage is not None:
+                on_usage(upstream.usage)
+        finally:
+            if upstream is not None:
+                await upstream.aclose()
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回网关运行统计"""
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "circuit": self.breaker.state,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
+
+    async def _acquire(self, expires: float):
+        """获取并发名额；队列已满或排队超时时抛出 GatewayBusyError"""
+        if self._slots.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                LLM_REJECTED.inc('queue_full')
+                raise GatewayBusyError()
+            self.waiting += 1
+            LLM_WAITING.inc()
+            try:
+                timeout = max(0.0, min(self.queue_timeout, expires - time.monotonic()))
+                await asyncio.wait_for(self._slots.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                LLM_REJECTED.inc('queue_timeout')
+                raise GatewayBusyError()
+            finally:
+                LLM_WAITING.dec()
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+        self.in_flight += 1
+        self.calls += 1
+        LLM_IN_FLIGHT.inc()
+
+    def _release(self):
+        self.in_flight -= 1
+        LLM_IN_FLIGHT.dec()
+        self._slots.release()
+
+    @staticmethod
+    def _record_usage(model: str, usage):
+        if usage is None:
+            return
+        metrics.LLM_PROMPT_TOKENS.inc(model, amount=getattr(usage, 'prompt_tokens', 0) or 0)
+        metrics.LLM_COMPLETION_TOKENS.inc(model, amount=getattr(usage, 'completion_tokens', 0) or 0)
+
+    async def _with_retries(self, expires: float, model: str, call):
+        """在截止时间内调用，遇到可重试错误时按全抖动指数退避重试"""
+        attempt = 0
+        while True:
+            timeout = expires - time.monotonic()
+            if timeout <= 0:
+                raise DeadlineExceededError()
+            try:
+                probe = self.breaker.allow()
+            except CircuitOpenError:
+                LLM_REJECTED.inc('circuit_open')
+                raise
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(call(timeout), timeout)
+            except (TransientLLMError, asyncio.TimeoutError) as e:
+                metrics.LLM_LATENCY.observe(time.perf_counter() - start, model, 'transient_error')
+                self.breaker.record_failure()
+                self.failures += 1
+                delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+                if attempt >= self.max_retries:
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise DeadlineExceededError() from e
+                    raise
+                if time.monotonic() + delay >= expires:
+                    raise DeadlineExceededError()
+                attempt += 1
+                self.retries += 1
+                LLM_RETRIES.inc()
+                await asyncio.sleep(delay)
+                continue
+            except Exception:
+                metrics.LLM_LATENCY.observe(time.perf_counter() - start, model, 'error')
+                raise
+            else:
+                metrics.LLM_LATENCY.observe(time.perf_counter() - start, model, 'ok')
+                self.breaker.record_success()
+                return result
+            finally:
+                # 非上游故障的错误或任务被取消时释放试探名额，否则熔断器会一直停在半开状态
+                if probe:
+                    self.breaker.release_probe()
+
+def create_async_provider(name: str, api_key: Optional[str] = None):
+    """按名称创建异步提供方：zhipuai 需要 api_key，fake 为离线模拟"""
+    if name == 'fake':
+        return AsyncFakeProvider()
+    return AsyncZhipuAIProvider(api_key)
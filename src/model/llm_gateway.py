@@ -0,0 +1,434 @@
+"""
+大模型调用网关：并发上限与有界等待队列、单次调用截止时间、带抖动的重试、熔断器，
+以及可配置延迟和失败率的本地模拟提供方（用于离线压测）
+"""
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import metrics
+
+# 网关配置（可通过环境变量调整）
+LLM_PROVIDER = os.environ.get('BBVDLE_LLM_PROVIDER', 'zhipuai')  # zhipuai | fake
+LLM_MAX_CONCURRENCY = int(os.environ.get('BBVDLE_LLM_MAX_CONCURRENCY', '8'))
+LLM_MAX_QUEUE = int(os.environ.get('BBVDLE_LLM_MAX_QUEUE', '32'))
+LLM_QUEUE_TIMEOUT = float(os.environ.get('BBVDLE_LLM_QUEUE_TIMEOUT', '10'))  # 排队等待的最长时间（秒）
+LLM_DEADLINE = float(os.environ.get('BBVDLE_LLM_DEADLINE', '60'))  # 单次调用（含重试）的截止时间（秒）
+LLM_MAX_RETRIES = int(os.environ.get('BBVDLE_LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BASE_DELAY = float(os.environ.get('BBVDLE_LLM_RETRY_BASE_DELAY', '0.5'))
+LLM_BREAKER_THRESHOLD = int(os.environ.get('BBVDLE_LLM_BREAKER_THRESHOLD', '5'))  # 连续失败多少次后熔断
+LLM_BREAKER_RESET = float(os.environ.get('BBVDLE_LLM_BREAKER_RESET', '30'))  # 熔断后多久允许试探（秒）
+
+# 模拟提供方配置
+FAKE_LLM_LATENCY = float(os.environ.get('BBVDLE_FAKE_LLM_LATENCY', '0.5'))  # 平均延迟（秒）
+FAKE_LLM_FAILURE_RATE = float(os.environ.get('BBVDLE_FAKE_LLM_FAILURE_RATE', '0'))
+
+# 网关指标（进程内所有网关实例共用）
+LLM_IN_FLIGHT = metrics.gauge('bbvdle_llm_in_flight', 'LLM upstream calls currently holding a concurrency slot.')
+LLM_WAITING = metrics.gauge('bbvdle_llm_waiting', 'LLM calls waiting for a concurrency slot.')
+LLM_RETRIES = metrics.counter('bbvdle_llm_retries_total', 'LLM upstream retries.')
+LLM_REJECTED = metrics.counter('bbvdle_llm_rejected_total', 'LLM calls rejected by the gateway.', ('reason',))
+
+# 可重试的上游 HTTP 状态码
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+class LLMError(Exception):
+    """网关错误基类"""
+
+class TransientLLMError(LLMError):
+    """可重试的上游错误（超时、连接失败、限流、5xx）"""
+
+class GatewayBusyError(LLMError):
+    """并发已满且等待队列已满（或排队超时）"""
+
+    def __init__(self, message: str = "AI服务繁忙，请稍后重试", retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitOpenError(GatewayBusyError):
+    """熔断器打开，快速失败"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("AI服务暂时不可用，请稍后重试", retry_after)
+
+class DeadlineExceededError(LLMError):
+    """调用超过截止时间"""
+
+    def __init__(self):
+        super().__init__("AI服务响应超时")
+
+class LLMResult:
+    """一次补全调用的结果"""
+
+    def __init__(self, content: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.content = content
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+# ==================== 提供方 ====================
+
+class ZhipuAIProvider:
+    """ZhipuAI 提供方：把 SDK 的异常映射为网关的错误类型"""
+
+    def __init__(self, client):
+        # client 应以 max_retries=0 创建，由网关统一负责重试
+        self.client = client
+
+    def complete(self, messages: List[Dict[str, str]], timeout: float, **params) -> LLMResult:
+        response = self._create(messages, timeout, stream=False, **params)
+        usage = getattr(response, 'usage', None)
+        return LLMResult(
+            response.choices[0].message.content,
+            params.get('model', ''),
+            getattr(usage, 'prompt_tokens', 0) or 0,
+            getattr(usage, 'completion_tokens', 0) or 0,
+        )
+
+    def stream(self, messages: List[Dict[str, str]], timeout: float, **params) -> "ZhipuAIStream":
+        return ZhipuAIStream(self._create(messages, timeout, stream=True, **params))
+
+    def _create(self, messages, timeout, **params):
+        from zhipuai import APIConnectionError, APIStatusError
+        try:
+            return self.client.chat.completions.create(messages=messages, timeout=timeout, **params)
+        except APIConnectionError as e:  # 包括 APITimeoutError
+            raise TransientLLMError(str(e)) from e
+        except APIStatusError as e:
+            if e.status_code in RETRYABLE_STATUS_CODES:
+                raise TransientLLMError(str(e)) from e
+            raise
+
+class ZhipuAIStream:
+    """逐段产出回复文本；close() 关闭上游连接以终止生成"""
+
+    def __init__(self, upstream):
+        self._upstream = upstream
+        self.usage = None  # 最后一段通常携带 token 用量
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in self._upstream:
+            if getattr(chunk, 'usage', None):
+                self.usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    def close(self):
+        self._upstream.response.close()
+
+class FakeProvider:
+    """进程内模拟提供方：可配置延迟和失败率，不访问网络"""
+
+    def __init__(self, latency: float = FAKE_LLM_LATENCY, failure_rate: float = FAKE_LLM_FAILURE_RATE,
+                 chunks: int = 8):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.chunks = chunks
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, messages: List[Dict[str, str]], timeout: float, **params) -> LLMResult:
+        self._simulate(timeout)
+        content = self._reply(messages)
+        return LLMResult(content, params.get('model', 'fake'), len(messages[-1]['content']), len(content))
+
+    def stream(self, messages: List[Dict[str, str]], timeout: float, **params) -> "FakeStream":
+        # 首段延迟约为总延迟的一半，其余在各段之间平均分配
+        self._simulate(timeout, self.latency / 2)
+        return FakeStream(self._reply(messages), self.chunks, self.latency / 2)
+
+    def _simulate(self, timeout: float, latency: Optional[float] = None):
+        with self._lock:
+            self.calls += 1
+        latency = self.latency if latency is None else latency
+        delay = random.uniform(0.5 * latency, 1.5 * latency)
+        if delay > timeout:
+            time.sleep(max(0.0, timeout))
+            raise TransientLLMError("模拟上游超时")
+        time.sleep(delay)
+        if random.random() < self.failure_rate:
+            raise TransientLLMError("模拟上游错误")
+
+    @staticmethod
+    def _reply(messages: List[Dict[str, str]]) -> str:
+        question = messages[-1]['content'].rsplit("用户问题: ", 1)[-1]
+        return f"（模拟回复）关于“{question[:50]}”：这是离线模拟提供方生成的回答。"
+
+class FakeStream:
+    """模拟的流式回复"""
+
+    def __init__(self, content: str, chunks: int, latency: float):
+        self._content = content
+        self._chunks = max(1, chunks)
+        self._latency = latency
+        self._closed = False
+        self.usage = None
+
+    def __iter__(self) -> Iterator[str]:
+        size = max(1, len(self._content) // self._chunks + 1)
+        for i in range(0, len(self._content), size):
+            if self._closed:
+                return
+            time.sleep(self._latency / self._chunks)
+            yield self._content[i:i + size]
+        self.usage = LLMResult(self._content, 'fake', 0, len(self._content))
+
+    def close(self):
+        self._closed = True
+
+# ==================== 熔断器 ====================
+
+class CircuitBreaker:
+    """连续失败达到阈值后打开；reset_timeout 秒后进入半开状态，放行一个试探请求"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, reset_timeout: float = LLM_BREAKER_RESET):
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """检查是否允许调用，不允许时抛出 CircuitOpenError；返回本次调用是否为半开状态的试探请求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            raise CircuitOpenError(max(1, int(remaining + 0.999)))
+
+    def release_probe(self):
+        """试探请求没有得出结论（如非上游故障的错误或调用被中断）时释放，下一个请求重新试探"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+# ==================== 网关 ====================
+
+class LLMGateway:
+    """位于 reply() 和提供方之间，负责限流、截止时间、重试和熔断"""
+
+    def __init__(self, provider, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT, deadline: float = LLM_DEADLINE,
+                 max_retries: int = LLM_MAX_RETRIES, retry_base_delay: float = LLM_RETRY_BASE_DELAY,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.max_retries = max(0, max_retries)
+        self.retry_base_delay = retry_base_delay
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.Semaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def complete(self, messages: List[Dict[str, str]], deadline: Optional[float] = None, **params) -> LLMResult:
+        """同步补全调用，deadline 为本次调用（含排队和重试）的最长秒数"""
+        expires = time.monotonic() + (deadline or self.deadline)
+        model = params.get('model', '')
+        self._acquire(expires)
+        try:
+            result = self._with_retries(expires, model,
+                                        lambda timeout: self.provider.complete(messages, timeout, **params))
+        finally:
+            self._release()
+        self._record_usage(model, result)
+        return result
+
+    def stream(self, messages: List[Dict[str, str]], deadline: Optional[float] = None,
+               on_usage: Optional[Callable[[Any], None]] = None, **params) -> Iterator[str]:
+        """流式调用：deadline 约束排队和建立连接；关闭生成器会关闭上游连接并归还并发名额；
+        完整接收后以 token 用量（可能为 None）调用 on_usage"""
+        expires = time.monotonic() + (deadline or self.deadline)
+        model = params.get('model', '')
+        self._acquire(expires)
+        upstream = None
+        try:
+            upstream = self._with_retries(expires, model,
+                                          lambda timeout: self.provider.stream(messages, timeout, **params))
+            try:
+                yield from upstream
+            except TransientLLMError:
+                self.breaker.record_failure()
+                raise
+            self._record_usage(model, upstream.usage)
+            if on_usage is not None:
+                on_usage(upstream.usage)
+        finally:
+            if upstream is not None:
+                upstream.close()
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回网关运行统计"""
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "circuit": self.breaker.state,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+            }
+
+    def _acquire(self, expires: float):
+        """获取并发名额；队列已满或排队超时时抛出 GatewayBusyError"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    LLM_REJECTED.inc('queue_full')
+                    raise GatewayBusyError()
+                self.waiting += 1
+            LLM_WAITING.inc()
+            try:
+                timeout = max(0.0, min(self.queue_timeout, expires - time.monotonic()))
+                acquired = self._slots.acquire(timeout=timeout)
+            finally:
+                LLM_WAITING.dec()
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self.rejected += 1
+                LLM_REJECTED.inc('queue_timeout')
+                raise GatewayBusyError()
+        with self._lock:
+            self.in_flight += 1
+            self.calls += 1
+        LLM_IN_FLIGHT.inc()
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        LLM_IN_FLIGHT.dec()
+        self._slots.release()
+
+    @staticmethod
+    def _record_usage(model: str, usage):
+        """记录提供方返回的 token 用量"""
+        if usage is None:
+            return
+        metrics.LLM_PROMPT_TOKENS.inc(model, amount=getattr(usage, 'prompt_tokens', 0) or 0)
+        metrics.LLM_COMPLETION_TOKENS.inc(model, amount=getattr(usage, 'completion_tokens', 0) or 0)
+
+    def _with_retries(self, expires: float, model: str, call):
+        """在截止时间内调用，遇到可重试错误时按全抖动指数退避重试"""
+        attempt = 0
+        while True:
+            timeout = expires - time.monotonic()
+            if timeout <= 0:
+                raise DeadlineExceededError()
+            try:
+                probe = self.breaker.allow()
+            except CircuitOpenError:
+                LLM_REJECTED.inc('circuit_open')
+                raise
+            start = time.perf_counter()
+            try:
+                result = call(timeout)
+            except TransientLLMError:
+                metrics.LLM_LATENCY.observe(time.perf_counter() - start, model, 'transient_error')
+                self.breaker.record_failure()
+                with self._lock:
+                    self.failures += 1
+                delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+                if attempt >= self.max_retries:
+                    raise
+                if time.monotonic() + delay >= expires:
+                    raise DeadlineExceededError()
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                LLM_RETRIES.inc()
+                time.sleep(delay)
+                continue
+            except Exception:
+                metrics.LLM_LATENCY.observe(time.perf_counter() - start, model, 'error')
+                raise
+            else:
+                metrics.LLM_LATENCY.observe(time.perf_counter() - start, model, 'ok')
+                self.breaker.record_success()
+                return result
+            finally:
+                # 每个退出路径都要释放试探名额，否则熔断器会一直停在半开状态
+                if probe:
+                    self.breaker.release_probe()
+
+def create_provider(name: str = LLM_PROVIDER, api_key: Optional[str] = None):
+    """按名称创建提供方：zhipuai 需要 api_key，fake 为离线模拟"""
+    if name == 'fake':
+        return FakeProvider()
+    from zhipuai import ZhipuAI
+    return ZhipuAIProvider(ZhipuAI(api_key=api_key, max_retries=0))
+
+# 离线压测：python llm_gateway.py [请求数] [并发数]
+if __name__ == "__main__":
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    gateway = LLMGateway(FakeProvider())
+    outcomes: Dict[str, int] = {}
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            gateway.complete([{"role": "user", "content": f"用户问题: 问题{i}"}], model="fake")
+            outcome = "ok"
+        except LLMError as e:
+            outcome = type(e).__name__
+        return outcome, time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    for outcome, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    latencies = sorted(latency for _, latency in results)
+    print(f"请求数: {total}，并发: {concurrency}，总耗时: {elapsed:.2f}s，吞吐: {total / elapsed:.1f} req/s")
+    print(f"p50: {latencies[len(latencies) // 2] * 1000:.0f}ms，p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.0f}ms")
+    print(f"结果: {outcomes}")
+    print(f"网关统计: {gateway.stats()}")
@@ -0,0 +1,222 @@
+"""
+轻量级指标采集：Counter / Gauge / Histogram，以 Prometheus 文本格式导出（/api/metrics，需要管理员令牌）
+每次记录只是一次加锁的字典查找和加法，开销在微秒级，可以在生产环境常开
+注意：gunicorn 多进程部署时每个进程各自计数，抓取到的是处理该次请求的进程的数据
+"""
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 默认的延迟分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {} if self.labelnames else {(): 0}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in items]
+
+class Gauge(_Metric):
+    """可增可减的数值；传入 callback 时在导出时调用它读取当前值（返回数值或 {标签元组: 数值}）"""
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], object]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {} if self.labelnames else {(): 0}
+        self.callback = callback
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def _samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                return []
+            items = list(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+                for labels, value in items]
+
+class Histogram(_Metric):
+    """分桶直方图，导出 _bucket / _sum / _count"""
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, list] = {}  # labels -> [各桶计数..., +Inf 计数, sum]
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def time(self, *labels):
+        """上下文管理器：with histogram.time('label'): ..."""
+        return _Timer(self, labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(state)) for labels, state in self._values.items()]
+        lines = []
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_str} {_format_value(state[-1])}')
+            lines.append(f'{self.name}_count{label_str} {cumulative}')
+        return lines
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (),
+          callback: Optional[Callable[[], object]] = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback))
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+def render() -> str:
+    """导出所有指标"""
+    return REGISTRY.render()
+
+# ==================== 各模块共用的指标 ====================
+
+HTTP_REQUESTS = counter('bbvdle_http_requests_total', 'HTTP requests by route, method and status.',
+                        ('route', 'method', 'status'))
+HTTP_LATENCY = histogram('bbvdle_http_request_duration_seconds', 'HTTP request latency by route and status.',
+                         ('route', 'method', 'status'))
+HTTP_IN_FLIGHT = gauge('bbvdle_http_requests_in_flight', 'HTTP requests currently being processed.')
+DB_QUERY_LATENCY = histogram('bbvdle_db_query_duration_seconds', 'SQLite query latency by database.py function or repository method.',
+                             ('function',))
+BCRYPT_LATENCY = histogram('bbvdle_bcrypt_duration_seconds', 'bcrypt hashing/verification time.',
+                           ('operation',), buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+LLM_LATENCY = histogram('bbvdle_llm_upstream_duration_seconds', 'LLM upstream call latency per attempt.',
+                        ('model', 'outcome'))
+LLM_PROMPT_TOKENS = counter('bbvdle_llm_prompt_tokens_total', 'Prompt tokens reported by the LLM provider.',
+                            ('model',))
+LLM_COMPLETION_TOKENS = counter('bbvdle_llm_completion_tokens_total',
+                                'Completion tokens reported by the LLM provider.', ('model',))
+
+def timed_query(fn: Callable) -> Callable:
+    """装饰 database.py 中的函数和仓储方法，记录每次调用的耗时"""
+    name = fn.__qualname__
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - start, name)
+    return wrapper
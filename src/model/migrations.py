@@ -0,0 +1,215 @@
+"""
+数据库结构迁移：按 PRAGMA user_version 记录当前版本，启动时依次执行尚未执行的迁移
+新增迁移：在文件末尾添加一个 @migration(下一个版本号, "说明") 函数，不要修改已发布的迁移
+也可以手动执行：python migrations.py [--db data/bbvdle.db] [--status]
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from typing import Callable, List, Tuple
+
+from structured_logging import get_logger, setup_logging
+
+logger = get_logger('migrations')
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = []
+
+def migration(version: int, description: str):
+    """注册一个迁移，版本号必须连续递增"""
+    def register(fn: Callable[[sqlite3.Connection], None]):
+        expected = len(MIGRATIONS) + 1
+        if version != expected:
+            raise ValueError(f"迁移版本号应为 {expected}，实际为 {version}")
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """执行所有未执行的迁移，每个迁移一个事务；返回本次执行的版本号"""
+    applied = []
+    for version, description, fn in MIGRATIONS:
+        if get_version(conn) >= version:
+            continue
+        # 多个进程同时启动时，写锁保证每个迁移只执行一次
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_version(conn) >= version:
+                conn.rollback()
+                continue
+            fn(conn)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        logger.info("数据库迁移 %d: %s", version, description)
+    return applied
+
+# ==================== 迁移 ====================
+
+@migration(1, "创建基础表")
+def _create_tables(conn: sqlite3.Connection):
+    # 旧版本 init_database() 创建的数据库版本号为 0，表已存在时跳过
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_login DATETIME,
+            is_active BOOLEAN DEFAULT 1
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token VARCHAR(500) UNIQUE NOT NULL,
+            expires_at DATETIME NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    ''')
+    # AI回复缓存（可选持久化，重启后仍可命中）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ai_response_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    # 吊销列表（无状态认证模式使用）：登出的 token 和被禁用用户的截止签发时间
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            jti CHAR(32) PRIMARY KEY,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_users (
+            user_id INTEGER PRIMARY KEY,
+            revoked_before REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+@migration(2, "为会话表的 user_id 和 expires_at 建立索引")
+def _session_indexes(conn: sqlite3.Connection):
+    # 按用户查询/级联删除会话
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions (user_id)')
+    # 过期会话清理按 expires_at 做范围扫描
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_sessions_expires_at ON user_sessions (expires_at)')
+
+@migration(3, "邮箱唯一性不区分大小写")
+def _email_nocase(conn: sqlite3.Connection):
+    duplicates = conn.execute('''
+        SELECT lower(email) FROM users GROUP BY email COLLATE NOCASE HAVING COUNT(*) > 1
+    ''').fetchall()
+    if duplicates:
+        raise RuntimeError("以下邮箱仅大小写不同，请先手动合并账户: "
+                           + ', '.join(row[0] for row in duplicates))
+    conn.execute('UPDATE users SET email = lower(email) WHERE email != lower(email)')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_nocase ON users (email COLLATE NOCASE)')
+
+@migration(4, "更新查询规划器统计信息")
+def _analyze(conn: sqlite3.Connection):
+    conn.execute('ANALYZE')
+
+@migration(5, "预热的AI回复表")
+def _prewarmed_answers(conn: sqlite3.Connection):
+    # 离线批量生成的教学内容回复（prewarm.py），/api/reply 在调用大模型之前先查这里
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ai_prewarmed_answers (
+            cache_key CHAR(64) PRIMARY KEY,
+            response TEXT NOT NULL,
+            source VARCHAR(200) NOT NULL,
+            model VARCHAR(50) NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+
+@migration(6, "相似问题索引表")
+def _similar_questions(conn: sqlite3.Connection):
+    # 历史问答和管理员整理的问答（similar_questions.py），换一种说法的同一问题直接返回这里的回答
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ai_similar_questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            context_key TEXT NOT NULL,
+            question TEXT NOT NULL,
+            question_norm TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            source VARCHAR(20) NOT NULL,
+            enabled BOOLEAN NOT NULL DEFAULT 1,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            UNIQUE (context_key, question_norm)
+        )
+    ''')
+
+@migration(7, "AI助手对话历史表")
+def _conversations(conn: sqlite3.Connection):
+    # 每个用户每段对话的摘要和最近几轮问答（conversation_memory.py），按 updated_at 清理过期对话
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ai_conversations (
+            conversation_key VARCHAR(100) PRIMARY KEY,
+            summary TEXT NOT NULL,
+            turns TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ai_conversations_updated_at ON ai_conversations (updated_at)')
+
+@migration(8, "相似问题按提问类型重新归一化")
+def _similar_question_types(conn: sqlite3.Connection):
+    # 归一化结果改为“提问类型|正文”，已有条目按问题原文重新计算；与已有条目冲突的自动条目直接删除
+    # （使用执行迁移时的归一化规则，之后修改规则需要新的迁移）
+    from similar_questions import normalize_question
+    now = time.time()
+    rows = conn.execute('SELECT id, question, source FROM ai_similar_questions').fetchall()
+    for row_id, question, source in rows:
+        cursor = conn.execute('''
+            UPDATE OR IGNORE ai_similar_questions SET question_norm = ?, updated_at = ? WHERE id = ?
+        ''', (normalize_question(question), now, row_id))
+        if cursor.rowcount == 0 and source == 'auto':
+            conn.execute('DELETE FROM ai_similar_questions WHERE id = ?', (row_id,))
+
+@migration(9, "会话过期时间统一为 SQLite 的日期时间格式")
+def _session_expiry_format(conn: sqlite3.Connection):
+    # 之前按 isoformat() 保存（日期和时间之间为 T），与 datetime('now')（空格分隔）按字符串比较时，
+    # 当天已过期的会话仍被视为有效，清理任务也要到第二天才删除
+    conn.execute("UPDATE user_sessions SET expires_at = replace(expires_at, 'T', ' ') WHERE expires_at LIKE '%T%'")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="执行数据库迁移")
+    parser.add_argument('--db', default=None, help='数据库路径（默认使用 BBVDLE_DB_PATH 或 data/bbvdle.db）')
+    parser.add_argument('--status', action='store_true', help='只显示当前版本，不执行迁移')
+    args = parser.parse_args(argv)
+
+    import database
+    from config import load_config
+    setup_logging()
+    database.DB_PATH = args.db or load_config()['DB_PATH']
+    with database.db_connection() as conn:
+        current = get_version(conn)
+        logger.info("当前版本 %d，最新版本 %d", current, latest_version())
+        if args.status:
+            return 0
+        applied = migrate(conn)
+    if applied:
+        logger.info("已执行 %d 个迁移", len(applied))
+    else:
+        logger.info("数据库已是最新版本")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+AI助手的模型路由：按提问的类型（教学内容的解释/概括/测验、是否选中了层、问题和提示词长度）选择模型档位和 max_tokens，
+简单的问题（如“这个参数是什么意思”）交给更快、更便宜的模型
+- 主模型最近 WINDOW 秒内的 p95 延迟超过 FALLBACK_P95 时，原本使用主模型的路由临时改用快速模型；
+  延迟样本过期后自动恢复主模型
+- 缓存键按路由的主模型参数计算（与离线预热一致），降级期间生成的回复不写入缓存，避免长期返回快速模型的回答
+- 每个路由的延迟和 token 用量导出为指标
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import metrics
+from prompt_builder import AI_MODEL, model_params
+
+# 模型档位（可通过环境变量调整）
+MODEL_TIERS = {
+    "primary": os.environ.get('BBVDLE_MODEL_PRIMARY', AI_MODEL),
+    "fast": os.environ.get('BBVDLE_MODEL_FAST', 'glm-4-flash'),
+}
+# 默认路由；BBVDLE_MODEL_ROUTES 可以用 JSON 覆盖，例如 {"layer": {"tier": "primary"}, "quiz": {"max_tokens": 1500}}
+DEFAULT_MODEL_ROUTES: Dict[str, Dict[str, Any]] = {
+    "explain": {"tier": "primary", "max_tokens": 1500},
+    "summarize": {"tier": "fast", "max_tokens": 800},
+    "quiz": {"tier": "primary", "max_tokens": 1200},
+    "education": {"tier": "primary", "max_tokens": 1500},   # 选中教学内容后自由提问
+    "layer": {"tier": "fast", "max_tokens": 800},           # 选中了层的简短问题，通常是参数含义
+    "short": {"tier": "fast", "max_tokens": 1000},
+    "long": {"tier": "primary", "max_tokens": 2000},        # 粘贴了代码或长段落
+    "default": {"tier": "primary", "max_tokens": 2000},
+}
+# 问题不超过该字数时视为简短问题；提示词超过该字数时视为长提示词
+SHORT_QUESTION_CHARS = int(os.environ.get('BBVDLE_SHORT_QUESTION_CHARS', '20'))
+LONG_PROMPT_CHARS = int(os.environ.get('BBVDLE_LONG_PROMPT_CHARS', '3000'))
+# 主模型 p95 延迟超过该秒数时降级到快速模型（0 表示不降级）
+MODEL_FALLBACK_P95 = float(os.environ.get('BBVDLE_MODEL_FALLBACK_P95', '20'))
+MODEL_LATENCY_WINDOW = float(os.environ.get('BBVDLE_MODEL_LATENCY_WINDOW', '300'))  # 秒
+MODEL_LATENCY_MIN_SAMPLES = int(os.environ.get('BBVDLE_MODEL_LATENCY_MIN_SAMPLES', '20'))
+
+ROUTE_LATENCY = metrics.histogram('bbvdle_reply_route_duration_seconds',
+                                  'AI reply generation time by route and the model actually used.',
+                                  ('route', 'model'))
+ROUTE_TOKENS = metrics.counter('bbvdle_reply_route_tokens_total', 'LLM tokens used by route, model and kind.',
+                               ('route', 'model', 'kind'))
+ROUTE_CALLS = metrics.counter('bbvdle_reply_route_calls_total', 'Upstream LLM calls by route and selection.',
+                              ('route', 'model', 'selection'))
+
+class RouteDecision:
+    """一次路由的结果：实际使用的模型和 max_tokens，以及计算缓存键用的主模型"""
+    __slots__ = ('route', 'model', 'max_tokens', 'primary_model', 'fallback')
+
+    def __init__(self, route: str, model: str, max_tokens: int, primary_model: str, fallback: bool = False):
+        self.route = route
+        self.model = model
+        self.max_tokens = max_tokens
+        self.primary_model = primary_model
+        self.fallback = fallback
+
+    @property
+    def params(self) -> dict:
+        """本次调用大模型的参数"""
+        return model_params(self.model, self.max_tokens)
+
+    @property
+    def cache_params(self) -> dict:
+        """参与缓存键计算的参数（不随降级变化）"""
+        return model_params(self.primary_model, self.max_tokens)
+
+class _LatencyWindow:
+    """最近一段时间内的延迟样本"""
+
+    def __init__(self, maxlen: int = 1000):
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=maxlen)  # (时间, 秒)
+
+    def p95(self, window: float, min_samples: int) -> Optional[float]:
+        cutoff = time.monotonic() - window
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        if len(self.samples) < max(1, min_samples):
+            return None
+        values = sorted(seconds for _ts, seconds in self.samples)
+        return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+class ModelRouter:
+    """线程安全的模型路由"""
+
+    def __init__(self, routes: Optional[Dict[str, Dict[str, Any]]] = None, tiers: Optional[Dict[str, str]] = None,
+                 fallback_p95: float = MODEL_FALLBACK_P95, window: float = MODEL_LATENCY_WINDOW,
+                 min_samples: int = MODEL_LATENCY_MIN_SAMPLES):
+        self.routes = routes or DEFAULT_MODEL_ROUTES
+        self.tiers = tiers or MODEL_TIERS
+        self.fallback_p95 = fallback_p95
+        self.window = window
+        self.min_samples = min_samples
+        self._latency: Dict[str, _LatencyWindow] = {}
+        self._lock = threading.Lock()
+        self.fallbacks = 0
+
+    def classify(self, user_message: str, selected_layer=None, education_context=None,
+                 full_prompt: str = '') -> str:
+        """按提问的特征选择路由名"""
+        if isinstance(education_context, dict) and (education_context.get('text') or '').strip():
+            mode = education_context.get('mode')
+            return mode if mode in ('explain', 'summarize', 'quiz') else 'education'
+        if len(full_prompt) > LONG_PROMPT_CHARS:
+            return 'long'
+        if len(user_message) <= SHORT_QUESTION_CHARS:
+            return 'layer' if selected_layer else 'short'
+        return 'default'
+
+    def route(self, user_message: str, selected_layer=None, education_context=None,
+              full_prompt: str = '', allow_fallback: bool = True) -> RouteDecision:
+        """选择模型和 max_tokens；allow_fallback=False 时总是使用路由配置的模型（离线预热）"""
+        name = self.classify(user_message, selected_layer, education_context, full_prompt)
+        config = self.routes.get(name) or self.routes['default']
+        tier = config.get('tier', 'primary')
+        model = self.tiers.get(tier, self.tiers['primary'])
+        max_tokens = int(config.get('max_tokens', 2000))
+        if allow_fallback and tier == 'primary' and self._primary_slow(model):
+            with self._lock:
+                self.fallbacks += 1
+            return RouteDecision(name, self.tiers['fast'], max_tokens, model, fallback=True)
+        return RouteDecision(name, model, max_tokens, model)
+
+    def record(self, decision: RouteDecision, seconds: float, usage=None):
+        """记录一次上游调用的耗时和 token 用量（usage 为提供方返回的用量，可能为 None）"""
+        ROUTE_LATENCY.observe(seconds, decision.route, decision.model)
+        ROUTE_CALLS.inc(decision.route, decision.model, 'fallback' if decision.fallback else 'route')
+        if usage is not None:
+            ROUTE_TOKENS.inc(decision.route, decision.model, 'prompt',
+                             amount=getattr(usage, 'prompt_tokens', 0) or 0)
+            ROUTE_TOKENS.inc(decision.route, decision.model, 'completion',
+                             amount=getattr(usage, 'completion_tokens', 0) or 0)
+        with self._lock:
+            window = self._latency.get(decision.model)
+            if window is None:
+                window = self._latency[decision.model] = _LatencyWindow()
+            window.samples.append((time.monotonic(), seconds))
+
+    def p95(self, model: str) -> Optional[float]:
+        """模型最近的 p95 延迟（秒），样本不足时返回 None"""
+        with self._lock:
+            window = self._latency.get(model)
+            return window.p95(self.window, self.min_samples) if window is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = list(self._latency)
+            fallbacks = self.fallbacks
+        return {
+            "tiers": dict(self.tiers),
+            "routes": self.routes,
+            "fallback_p95": self.fallback_p95,
+            "fallbacks": fallbacks,
+            "p95": {model: self.p95(model) for model in models},
+        }
+
+    def _primary_slow(self, model: str) -> bool:
+        if self.fallback_p95 <= 0 or self.tiers['fast'] == model:
+            return False
+        p95 = self.p95(model)
+        return p95 is not None and p95 > self.fallback_p95
+
+def create_model_router(routes_json: Optional[str] = None) -> ModelRouter:
+    """按配置创建路由，routes_json 覆盖默认路由的档位或 max_tokens"""
+    routes = {name: dict(config) for name, config in DEFAULT_MODEL_ROUTES.items()}
+    if routes_json:
+        for name, config in json.loads(routes_json).items():
+            routes.setdefault(name, {}).update(config)
+    for name, config in routes.items():
+        if config.get('tier', 'primary') not in MODEL_TIERS:
+            raise ValueError(f"路由 {name} 的模型档位无效: {config.get('tier')}")
+    return ModelRouter(routes)
+
+# 进程内唯一的模型路由
+model_router = create_model_router(os.environ.get('BBVDLE_MODEL_ROUTES'))
@@ -0,0 +1,170 @@
+"""
+教学内容AI回复的离线预热：枚举任务步骤（dist/tasksteps.json）和教学页面（index.html 中 #educationTab 的段落），
+按 /api/reply 的方式构建“解释/概括/测验”的提示词，限制并发调用大模型，结果写入 ai_prewarmed_answers 表；
+/api/reply 在调用大模型之前先查这张表。已生成的条目按缓存键跳过，中断后重新运行即可继续
+    python prewarm.py [--db data/bbvdle.db] [--concurrency 4] [--modes explain,summarize,quiz] [--limit N] [--dry-run]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import database
+from config import ROOT_DIR, load_config
+from llm_gateway import LLMGateway, create_provider
+from model_router import model_router
+from prompt_builder import EDUCATION_ACTION_MESSAGES, build_prompt, chat_messages, education_action_message
+from response_cache import make_cache_key
+
+TASKSTEPS_PATH = os.path.join(ROOT_DIR, 'dist', 'tasksteps.json')
+EDUCATION_HTML_PATH = os.path.join(ROOT_DIR, 'index.html')
+# 太短的段落（标题、作者、链接文字）不值得预热
+MIN_TEXT_LENGTH = 20
+
+class _EducationParser(HTMLParser):
+    """收集 #educationTab 内每个段落（p、li、.educationContent）的文字，嵌套的段落分别收集"""
+
+    BLOCKS = ('p', 'li')
+
+    def __init__(self):
+        super().__init__()
+        self.texts: List[Tuple[str, str]] = []  # (所在章节的 id, 文字)
+        self._depth = 0          # 在 #educationTab 内的 div 嵌套深度，0 表示不在其中
+        self._section = ''
+        self._stack: List[Tuple[str, List[str]]] = []  # 正在收集的段落 (标签, 文字片段)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self._depth == 0:
+            if tag == 'div' and attrs.get('id') == 'educationTab':
+                self._depth = 1
+            return
+        if tag == 'div':
+            self._depth += 1
+            if self._depth == 2 and attrs.get('id'):
+                self._section = attrs['id']
+        if tag in self.BLOCKS or (tag == 'div' and 'educationContent' in (attrs.get('class') or '').split()):
+            self._stack.append((tag, []))
+
+    def handle_endtag(self, tag):
+        if self._depth == 0:
+            return
+        if self._stack and self._stack[-1][0] == tag:
+            _tag, parts = self._stack.pop()
+            text = ' '.join(''.join(parts).split())
+            if len(text) >= MIN_TEXT_LENGTH:
+                self.texts.append((self._section, text))
+        if tag == 'div':
+            self._depth -= 1
+
+    def handle_data(self, data):
+        if self._stack:
+            self._stack[-1][1].append(data)
+
+def education_snippets(path: str = EDUCATION_HTML_PATH) -> List[Tuple[str, str]]:
+    """教学页面中的段落，返回 [(章节 id, 文字), ...]"""
+    parser = _EducationParser()
+    with open(path, 'r', encoding='utf-8') as f:
+        parser.feed(f.read())
+    return parser.texts
+
+def task_step_snippets(path: str = TASKSTEPS_PATH) -> List[Tuple[str, str]]:
+    """任务步骤，返回 [(任务名, 步骤文字), ...]"""
+    with open(path, 'r', encoding='utf-8') as f:
+        steps = json.load(f)
+    return [(task, step['step']) for task, items in steps.items() for step in items
+            if len(step.get('step', '')) >= MIN_TEXT_LENGTH]
+
+def enumerate_jobs(modes: List[str], tasksteps_path: str = TASKSTEPS_PATH,
+                   html_path: str = EDUCATION_HTML_PATH) -> Iterator[Dict[str, Any]]:
+    """生成所有待预热的条目：cache_key、prompt、模型参数和来源说明，与 /api/reply 的路由和缓存键一致"""
+    seen = set()
+    # 教学页面选中内容时通常没有进行中的任务；任务步骤在对应任务进行中时被选中
+    sources = [(section, text, "None") for section, text in education_snippets(html_path)]
+    sources += [(f"tasksteps:{task}", text, task) for task, text in task_step_snippets(tasksteps_path)]
+    for source, text, task_name in sources:
+        for mode in modes:
+            message = education_action_message(mode, text)
+            education_context = {"text": text, "mode": mode}
+            prompt = build_prompt(message, None, task_name, education_context)
+            # 离线预热总是使用路由配置的模型，不受线上延迟降级影响
+            params = model_router.route(message, None, education_context, prompt, allow_fallback=False).cache_params
+            cache_key = make_cache_key(prompt, params)
+            if cache_key in seen:
+                continue
+            seen.add(cache_key)
+            yield {"cache_key": cache_key, "prompt": prompt, "params": params, "source": f"{source}:{mode}"}
+
+def prewarm(jobs: List[Dict[str, Any]], gateway: LLMGateway, concurrency: int = 4) -> Dict[str, int]:
+    """并发生成回复，每完成一条立即写入数据库；返回成功和失败的条数"""
+    counts = {"generated": 0, "failed": 0}
+
+    def generate(job):
+        result = gateway.complete(chat_messages(job['prompt']), **job['params'])
+        database.save_prewarmed_answer(job['cache_key'], result.content, job['source'], job['params']['model'])
+
+    with ThreadPoolExecutor(max(1, concurrency)) as executor:
+        futures = {executor.submit(generate, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                future.result()
+                counts["generated"] += 1
+            except Exception as e:
+                # 单条失败（大模型错误、未映射的服务商异常、写库失败）只计入失败数，不中断其余条目
+                counts["failed"] += 1
+                print(f"生成失败 {job['source']}: {type(e).__name__}: {e}")
+            done = counts["generated"] + counts["failed"]
+            if done % 20 == 0 or done == len(jobs):
+                print(f"进度 {done}/{len(jobs)}（失败 {counts['failed']}）")
+    return counts
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="离线预热教学内容的AI回复")
+    parser.add_argument('--db', default=None, help='数据库路径（默认使用 BBVDLE_DB_PATH 或 data/bbvdle.db）')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时进行的大模型调用数')
+    parser.add_argument('--modes', default=','.join(EDUCATION_ACTION_MESSAGES),
+                        help='预热的操作，逗号分隔（explain,summarize,quiz）')
+    parser.add_argument('--limit', type=int, default=None, help='本次最多生成多少条')
+    parser.add_argument('--force', action='store_true', help='重新生成已存在的条目')
+    parser.add_argument('--dry-run', action='store_true', help='只统计待生成的条目，不调用大模型')
+    args = parser.parse_args(argv)
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in EDUCATION_ACTION_MESSAGES]
+    if unknown:
+        parser.error(f"未知的操作: {', '.join(unknown)}")
+
+    config = load_config()
+    database.DB_PATH = args.db or config['DB_PATH']
+    database.init_database()
+
+    jobs = list(enumerate_jobs(modes))
+    done = set() if args.force else database.get_prewarmed_keys()
+    pending = [job for job in jobs if job['cache_key'] not in done]
+    print(f"共 {len(jobs)} 条，已预热 {len(jobs) - len(pending)} 条", end='')
+    if args.limit is not None:
+        pending = pending[:args.limit]
+    print(f"，本次生成 {len(pending)} 条")
+    if args.dry_run or not pending:
+        return 0
+
+    api_key: Optional[str] = None
+    if config['LLM_PROVIDER'] != 'fake':
+        api_key = config['ZHIPUAI_API_KEY']
+        if not api_key:
+            with open(config['ZHIPUAI_KEY_FILE'], 'r') as f:
+                api_key = f.read().strip()
+    gateway = LLMGateway(create_provider(config['LLM_PROVIDER'], api_key), max_concurrency=args.concurrency)
+    started = time.perf_counter()
+    counts = prewarm(pending, gateway, args.concurrency)
+    print(f"完成：生成 {counts['generated']} 条，失败 {counts['failed']} 条，"
+          f"耗时 {time.perf_counter() - started:.1f}s（失败的条目重新运行即可补齐）")
+    return 0 if counts['failed'] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+AI助手的提示词构建：/api/reply 和离线预热（prewarm.py）使用同一套规则，保证缓存键一致
+提示词按估计的 token 数控制长度：层参数和教学内容片段各有上限，对话历史只使用整体预算中剩余的部分
+（最近的轮次优先，其次是更早对话的摘要），多轮对话时提示词不会无限增长
+"""
+import math
+import os
+import re
+
+# 大模型调用参数
+AI_MODEL = "glm-4"
+AI_TOP_P = 0.7
+AI_TEMPERATURE = 0.9
+AI_MAX_TOKENS = 2000
+
+# 提示词的 token 预算（可通过环境变量调整）
+PROMPT_TOKEN_BUDGET = int(os.environ.get('BBVDLE_PROMPT_TOKEN_BUDGET', '3000'))
+PROMPT_SNIPPET_TOKENS = int(os.environ.get('BBVDLE_PROMPT_SNIPPET_TOKENS', '800'))
+PROMPT_LAYER_TOKENS = int(os.environ.get('BBVDLE_PROMPT_LAYER_TOKENS', '200'))
+
+_CJK = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中文（含全角标点）每字约 0.7 个 token，其余字符约 4 个一个 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return math.ceil(cjk * 0.7 + (len(text) - cjk) / 4)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断到估计不超过 max_tokens 的前缀（二分查找截断位置）"""
+    text = text[:max(0, max_tokens) * 4]  # 每个字符至少 0.25 个 token，更长的部分一定放不下
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+def chat_messages(full_prompt) -> list:
+    """把提示词包装为对话消息"""
+    return [{"role": "user", "content": full_prompt}]
+
+def model_params(model: str = AI_MODEL, max_tokens: int = AI_MAX_TOKENS) -> dict:
+    """调用大模型使用的参数，参与缓存键计算（模型和 max_tokens 由 model_router 按路由选择）"""
+    return {
+        "model": model,
+        "top_p": AI_TOP_P,
+        "temperature": AI_TEMPERATURE,
+        "max_tokens": max_tokens,
+    }
+
+def build_prompt(user_message, selected_layer=None, task_name=None, education_context=None,
+                 history=None, budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """根据选中的层、当前任务、教学内容和对话历史构建完整的提示词
+    history 为 conversation_memory.Conversation（summary 为摘要行，turns 为最近的 (问题, 回答)），
+    只占用 budget 中其余部分用剩的 token"""
+    context_parts = ["你现在作为一名深度学习神经网络教学者,用简洁准确的语言为我解答与神经网络相关的问题。"]
+    
+    # 如果有选中的层，添加层信息到上下文
+    if selected_layer:
+        layer_type = selected_layer.get('layerType', '')
+        layer_params = selected_layer.get('params', {})
+        context_parts.append(f"\n当前用户选中了一个 {layer_type} 层。")
+        if layer_params:
+            params_str = ", ".join([f"{k}: {v}" for k, v in layer_params.items()])
+            context_parts.append(f"该层的参数为: {truncate_to_tokens(params_str, PROMPT_LAYER_TOKENS)}。")
+        context_parts.append("请根据这个层的信息，提供更有针对性的解答，例如解释该层的参数含义、作用等。")
+    
+    # 如果有当前任务，添加任务信息到上下文
+    if task_name and task_name != "None":
+        task_mapping = {
+            "MLP": "多层感知机",
+            "CNN": "卷积神经网络",
+            "RNN": "循环神经网络"
+        }
+        task_display_name = task_mapping.get(task_name, task_name)
+        context_parts.append(f"\n当前用户正在进行 {task_display_name} 的学习任务。请结合该任务的特点提供建议。")
+    
+    # 如果有教学内容选中，添加进上下文
+    if education_context:
+        snippet = (education_context.get('text') or '').strip()
+        mode = education_context.get('mode', 'custom')
+        if snippet:
+            snippet = truncate_to_tokens(snippet, PROMPT_SNIPPET_TOKENS)
+            if mode == 'summarize':
+                context_parts.append(f"\n请概括以下教学内容的要点，并突出重点：\n{snippet}\n")
+            elif mode == 'quiz':
+                context_parts.append(f"\n请根据以下教学内容设计三道测验题，并给出标准答案：\n{snippet}\n")
+            elif mode == 'explain':
+                context_parts.append(f"\n请用循序渐进的方式解释以下教学内容，并结合初学者视角：\n{snippet}\n")
+            else:
+                context_parts.append(f"\n以下是用户选中的教学内容，请在回答时参考：\n{snippet}\n")
+    
+    question = "\n\n用户问题: " + user_message
+    if history is not None:
+        remaining = budget - estimate_tokens("".join(context_parts)) - estimate_tokens(question)
+        context_parts.append(render_history(history, remaining))
+    
+    # 组合完整的提示词
+    return "".join(context_parts) + question
+
+_SUMMARY_HEADER = "\n更早的对话摘要：\n"
+_TURNS_HEADER = "\n最近的对话：\n"
+_HISTORY_FOOTER = "请结合以上对话理解用户的问题。"
+_HISTORY_HEADERS = _SUMMARY_HEADER + _TURNS_HEADER + _HISTORY_FOOTER
+
+def render_history(history, max_tokens: int) -> str:
+    """在 max_tokens 内渲染对话历史：从最近的轮次往前取，放不下的更早轮次只保留摘要中能放下的部分"""
+    max_tokens -= estimate_tokens(_HISTORY_HEADERS)
+    if max_tokens <= 0 or not (history.turns or history.summary):
+        return ""
+    turns = []
+    for question, answer in reversed(history.turns):
+        text = f"用户：{question}\n助手：{answer}\n"
+        cost = estimate_tokens(text)
+        if cost > max_tokens:
+            break
+        turns.append(text)
+        max_tokens -= cost
+    summary = []
+    for line in reversed(history.summary):
+        text = f"- {line}\n"
+        cost = estimate_tokens(text)
+        if cost > max_tokens:
+            break
+        summary.append(text)
+        max_tokens -= cost
+    parts = []
+    if summary:
+        parts.append(_SUMMARY_HEADER + "".join(reversed(summary)))
+    if turns:
+        parts.append(_TURNS_HEADER + "".join(reversed(turns)))
+    if parts:
+        parts.append(_HISTORY_FOOTER)
+    return "".join(parts)
+
+# 教学内容选中后“解释/概括/测验”按钮发送的问题（与前端 app.ts 的 handleAiContextAction 保持一致）
+EDUCATION_ACTION_MESSAGES = {
+    "explain": "请用通俗易懂的语言解释以下内容：\n{text}",
+    "summarize": "请概括以下内容的要点，突出关键信息：\n{text}",
+    "quiz": "请根据以下内容设计三道测验题，并给出参考答案：\n{text}",
+}
+
+def education_action_message(mode, text) -> str:
+    """教学内容快捷操作对应的用户问题"""
+    return EDUCATION_ACTION_MESSAGES[mode].format(text=text)
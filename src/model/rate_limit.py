@@ -0,0 +1,198 @@
+"""
+令牌桶限流：按路由配置 ip / user / global 三种维度的限额，超限时返回需要等待的秒数
+限额格式 "次数/周期"（周期为 sec、min、hour、day），桶容量等于次数，按 次数/周期 的速率恢复
+状态保存在进程内（memory）时每个进程各自计数，N 个 gunicorn 进程的全局限额相当于 N 倍；
+多进程部署默认使用 sqlite 后端共享限额（建议放在 /dev/shm 等内存文件系统上），见 config.py
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+# 默认限额；BBVDLE_RATE_LIMITS 可以用 JSON 覆盖，例如 {"reply": {"user": "10/min"}, "llm": {"global": "100/min"}}
+# 课堂上学生通常共用一个出口 IP，ip 维度的限额要足够宽松
+DEFAULT_RATE_LIMITS: Dict[str, Dict[str, str]] = {
+    "login": {"user": "10/min", "ip": "120/min"},   # user 为提交的用户名，防止针对单个账户的暴力破解
+    "register": {"ip": "120/hour"},
+    "reply": {"user": "20/min", "ip": "300/min"},
+    "llm": {"global": "300/min"},                    # 实际发往上游大模型的调用（缓存命中不计）
+}
+
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('BBVDLE_RATE_LIMIT_MAX_KEYS', '100000'))
+# sqlite 后端每处理多少次请求清理一次长期未使用的桶
+_PRUNE_EVERY = 10000
+
+RATE_LIMITED = metrics.counter('bbvdle_rate_limited_total', 'Requests rejected by the rate limiter.',
+                               ('route', 'scope'))
+
+_PERIODS = {'sec': 1, 's': 1, 'min': 60, 'm': 60, 'hour': 3600, 'h': 3600, 'day': 86400, 'd': 86400}
+
+class RateLimitedError(Exception):
+    """超出限额，调用方应返回 429 并带上 Retry-After"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("请求过于频繁，请稍后重试")
+        self.retry_after = max(1, math.ceil(retry_after))
+
+def parse_rate(text: str) -> Tuple[float, float]:
+    """把 "20/min" 解析为 (每秒恢复的令牌数, 桶容量)"""
+    try:
+        count, period = text.strip().split('/')
+        count = float(count)
+        seconds = _PERIODS[period.strip().lower()]
+    except (ValueError, KeyError):
+        raise ValueError(f"限额格式不正确: {text!r}（应为 次数/sec|min|hour|day）")
+    if count <= 0:
+        raise ValueError(f"限额必须大于0: {text!r}")
+    return count / seconds, count
+
+def _refill(tokens: float, updated_at: float, rate: float, burst: float, now: float) -> float:
+    return min(burst, tokens + (now - updated_at) * rate)
+
+def _wait_time(buckets: List[Tuple[str, float, float]], levels: List[float], cost: float) -> Tuple[float, int]:
+    """令牌不足时返回 (最长等待秒数, 对应桶的下标)，都足够时返回 (0, -1)"""
+    wait, blocked = 0.0, -1
+    for index, ((_key, rate, _burst), tokens) in enumerate(zip(buckets, levels)):
+        if tokens < cost and (cost - tokens) / rate > wait:
+            wait, blocked = (cost - tokens) / rate, index
+    return wait, blocked
+
+class MemoryStore:
+    """进程内的令牌桶状态，按最近使用淘汰，最多保存 max_keys 个桶"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max(1, max_keys)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def consume(self, buckets: List[Tuple[str, float, float]], cost: float = 1) -> Tuple[float, int]:
+        """所有桶都有足够令牌时一起扣除并返回 (0, -1)，否则不扣除并返回 (需要等待的秒数, 最紧的桶的下标)"""
+        now = time.time()
+        with self._lock:
+            levels = [burst if key not in self._buckets else _refill(*self._buckets[key], rate, burst, now)
+                      for key, rate, burst in buckets]
+            wait, blocked = _wait_time(buckets, levels, cost)
+            if blocked >= 0:
+                return wait, blocked
+            for (key, _rate, _burst), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - cost, now)
+                self._buckets.move_to_end(key)
+            # 被淘汰的桶相当于已经恢复满，只会让限流略微宽松
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0.0, -1
+
+    def __len__(self):
+        return len(self._buckets)
+
+class SQLiteStore:
+    """保存在 SQLite 文件中的令牌桶状态，同一台机器上的多个进程共享限额"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        self._calls_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # 每个线程一个连接；限流状态丢失无关紧要，因此不做 fsync
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def consume(self, buckets: List[Tuple[str, float, float]], cost: float = 1) -> Tuple[float, int]:
+        """与 MemoryStore.consume 相同，在一个写事务中完成读取和扣除"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            levels = []
+            for key, rate, burst in buckets:
+                row = conn.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?',
+                                   (key,)).fetchone()
+                levels.append(burst if row is None else _refill(row[0], row[1], rate, burst, now))
+            wait, blocked = _wait_time(buckets, levels, cost)
+            if blocked < 0:
+                conn.executemany('''
+                    INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+                ''', [(key, tokens - cost, now) for (key, _rate, _burst), tokens in zip(buckets, levels)])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        with self._calls_lock:
+            self._calls += 1
+            prune = self._calls % _PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return wait, blocked
+
+    def prune(self, max_age: float = 86400) -> int:
+        """删除长时间未使用的桶（它们早已恢复满）"""
+        conn = self._connection()
+        return conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?', (time.time() - max_age,)).rowcount
+
+class RateLimiter:
+    """按路由检查各维度的令牌桶"""
+
+    def __init__(self, store, limits: Optional[Dict[str, Dict[str, str]]] = None):
+        self.store = store
+        self.rules: Dict[str, List[Tuple[str, float, float]]] = {}
+        for route, scopes in (limits or DEFAULT_RATE_LIMITS).items():
+            self.rules[route] = [(scope, *parse_rate(rate)) for scope, rate in scopes.items() if rate]
+
+    def check(self, route: str, identity: Dict[str, Optional[str]], cost: float = 1):
+        """identity 提供 ip / user 的取值（缺少的维度跳过）；超出任一限额时抛出 RateLimitedError"""
+        buckets = []
+        scopes = []
+        for scope, rate, burst in self.rules.get(route, ()):
+            if scope == 'global':
+                key = f'{route}:global'
+            elif identity.get(scope):
+                key = f'{route}:{scope}:{identity[scope]}'
+            else:
+                continue
+            buckets.append((key, rate, burst))
+            scopes.append(scope)
+        if not buckets:
+            return
+        wait, blocked = self.store.consume(buckets, cost)
+        if blocked >= 0:
+            RATE_LIMITED.inc(route, scopes[blocked])
+            raise RateLimitedError(wait)
+
+def create_rate_limiter(backend: str = 'memory', path: Optional[str] = None,
+                        limits_json: Optional[str] = None) -> RateLimiter:
+    """按配置创建限流器：backend 为 memory 或 sqlite，limits_json 覆盖默认限额"""
+    limits = {route: dict(scopes) for route, scopes in DEFAULT_RATE_LIMITS.items()}
+    if limits_json:
+        for route, scopes in json.loads(limits_json).items():
+            limits.setdefault(route, {}).update(scopes)
+    if backend == 'sqlite':
+        store = SQLiteStore(path)
+    elif backend == 'memory':
+        store = MemoryStore()
+    else:
+        raise ValueError(f"未知的限流后端: {backend}")
+    return RateLimiter(store, limits)
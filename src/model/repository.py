@@ -0,0 +1,122 @@
+"""
+仓储与工作单元：每个请求绑定一个数据库连接和一个事务
+路由通过 request_unit_of_work() 取得当前请求的工作单元，所有写操作在 commit() 时一次提交；
+请求结束时未提交的事务自动回滚，连接归还连接池
+用户名、邮箱的唯一性由 UNIQUE 约束保证（INSERT ... RETURNING），不再事先查询
+"""
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from flask import g
+
+import database
+from metrics import timed_query
+
+class UserRepository:
+    """用户表的读写"""
+
+    def __init__(self, uow: 'UnitOfWork'):
+        self._uow = uow
+
+    @timed_query
+    def create(self, username: str, email: str, password_hash: str) -> int:
+        """插入新用户并返回ID，用户名或邮箱重复时抛出 ValueError"""
+        try:
+            row = self._uow.connection.execute('''
+                INSERT INTO users (username, email, password_hash)
+                VALUES (?, ?, ?)
+                RETURNING id
+            ''', (username, email, password_hash)).fetchone()
+        except sqlite3.IntegrityError as e:
+            if 'users.username' in str(e):
+                raise ValueError("用户名已存在")
+            if 'users.email' in str(e):
+                raise ValueError("邮箱已被注册")
+            raise
+        return row['id']
+
+    @timed_query
+    def find_for_login(self, username_or_email: str) -> Optional[Dict[str, Any]]:
+        """按用户名或邮箱（包含 @ 时）查找用户"""
+        # 邮箱比较不区分大小写（使用 idx_users_email_nocase 索引）
+        condition = 'email = ? COLLATE NOCASE' if '@' in username_or_email else 'username = ?'
+        row = self._uow.connection.execute(f'''
+            SELECT id, username, email, password_hash, is_active
+            FROM users WHERE {condition}
+        ''', (username_or_email,)).fetchone()
+        if row:
+            return dict(row)
+        return None
+
+class SessionRepository:
+    """会话表的读写"""
+
+    def __init__(self, uow: 'UnitOfWork'):
+        self._uow = uow
+
+    @timed_query
+    def add(self, user_id: int, token: str, expires_at: datetime):
+        """保存用户会话"""
+        self._uow.connection.execute('''
+            INSERT INTO user_sessions (user_id, token, expires_at)
+            VALUES (?, ?, ?)
+        ''', (user_id, token, expires_at.isoformat(sep=' ')))  # 与 datetime('now') 格式一致，按字符串比较
+
+class UnitOfWork:
+    """一个连接上的一个事务；连接在第一次使用时才从连接池借出，commit/rollback 后立即归还"""
+
+    def __init__(self, pool: Optional[database.ConnectionPool] = None):
+        self._pool = pool
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pool: Optional[database.ConnectionPool] = None
+        self.users = UserRepository(self)
+        self.sessions = SessionRepository(self)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn_pool = self._pool or database.get_pool()
+            self._conn = self._conn_pool.acquire()
+        return self._conn
+
+    def commit(self):
+        """提交事务并归还连接"""
+        if self._conn is None:
+            return
+        try:
+            self._conn.commit()
+        finally:
+            self.release()
+
+    def rollback(self):
+        """回滚未提交的写操作并归还连接"""
+        self.release()
+
+    def release(self):
+        """归还连接（连接池会回滚未提交的事务），例如在 bcrypt 计算期间不占用连接"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._conn_pool.release(conn)
+
+    def __enter__(self) -> 'UnitOfWork':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+def request_unit_of_work() -> UnitOfWork:
+    """当前请求的工作单元（同一请求内多次调用返回同一个）"""
+    uow = g.get('unit_of_work')
+    if uow is None:
+        uow = g.unit_of_work = UnitOfWork()
+    return uow
+
+def close_unit_of_work(_exc=None):
+    """请求结束时回滚未提交的事务并归还连接（注册为 teardown_request）"""
+    uow = g.pop('unit_of_work', None)
+    if uow is not None:
+        uow.rollback()
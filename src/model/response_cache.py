@@ -0,0 +1,116 @@
+"""
+AI助手回复缓存：按完整提示词和模型参数的哈希做 LRU + TTL 缓存，可选持久化到SQLite
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from database import get_cached_response, save_cached_response, delete_expired_cached_responses
+from structured_logging import get_logger
+
+logger = get_logger('response_cache')
+
+# 缓存配置（可通过环境变量调整）
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('BBVDLE_AI_CACHE_MAX_ENTRIES', '1000'))
+AI_CACHE_TTL = float(os.environ.get('BBVDLE_AI_CACHE_TTL', '86400'))  # 秒
+AI_CACHE_PERSIST = os.environ.get('BBVDLE_AI_CACHE_PERSIST', '0').lower() in ('1', 'true', 'yes')
+
+def make_cache_key(prompt: str, params: Dict[str, Any]) -> str:
+    """对提示词做空白归一化后，与模型参数一起计算 sha256 作为缓存键"""
+    normalized = " ".join(prompt.split())
+    payload = json.dumps({"prompt": normalized, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """线程安全的 LRU + TTL 缓存"""
+
+    def __init__(self, max_entries: int = AI_CACHE_MAX_ENTRIES, ttl: float = AI_CACHE_TTL,
+                 persist: bool = AI_CACHE_PERSIST):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.persist = persist
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (response, created_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pruned = False
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，过期条目视为未命中"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[1] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+        if self.persist:
+            response = self._load(key, now)
+            if response is not None:
+                with self._lock:
+                    self.hits += 1
+                return response
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, response: str):
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        now = time.time()
+        self._put(key, response, now)
+        if self.persist:
+            try:
+                save_cached_response(key, response, now)
+            except Exception as e:
+                logger.warning("写入回复缓存失败: %s", e)
+
+    def clear(self):
+        """清空内存缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "persist": self.persist,
+            }
+
+    def _put(self, key: str, response: str, created_at: float):
+        with self._lock:
+            self._entries[key] = (response, created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _load(self, key: str, now: float) -> Optional[str]:
+        """从SQLite读取持久化的缓存，并提升到内存中"""
+        try:
+            if not self._pruned:
+                # 首次访问持久化缓存时顺带清理过期记录
+                self._pruned = True
+                delete_expired_cached_responses(now - self.ttl)
+            row = get_cached_response(key, now - self.ttl)
+        except Exception as e:
+            logger.warning("读取回复缓存失败: %s", e)
+            return None
+        if row is None:
+            return None
+        self._put(key, row['response'], row['created_at'])
+        return row['response']
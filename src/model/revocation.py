@@ -0,0 +1,78 @@
+"""
+无状态认证模式下的吊销列表：登出的 token（按 jti）和被禁用用户（按签发时间截止点）
+内存中的集合由 database.py 在写入数据库时同步更新；多进程部署时各进程每隔 RELOAD 秒从数据库重新加载
+条目在对应 token 过期后失效，集合大小只与有效期内的登出/禁用次数有关
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Tuple
+
+# 从数据库重新加载的间隔（秒），即其它进程中的登出/禁用最迟多久生效
+REVOCATION_RELOAD_INTERVAL = float(os.environ.get('BBVDLE_REVOCATION_RELOAD_INTERVAL', '5'))
+# 每新增多少条目清理一次内存中已过期的条目
+_PRUNE_EVERY = 1000
+
+class RevocationList:
+    """线程安全的吊销集合：jti -> 过期时间，user_id -> (截止签发时间（整数秒，与 iat 一致）, 过期时间)"""
+
+    def __init__(self, reload_interval: float = REVOCATION_RELOAD_INTERVAL):
+        self.reload_interval = reload_interval
+        self._tokens: Dict[str, float] = {}
+        self._users: Dict[int, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._next_reload = 0.0
+        self._added = 0
+
+    def is_revoked(self, payload: Dict[str, Any]) -> bool:
+        """token 的 jti 已被吊销，或签发时间不晚于用户的截止时间"""
+        if payload.get('jti') in self._tokens:
+            return True
+        user = self._users.get(payload.get('user_id'))
+        return user is not None and int(payload.get('iat', 0)) <= user[0]
+
+    def add_token(self, jti: str, expires_at: float):
+        with self._lock:
+            self._tokens[jti] = expires_at
+            self._after_add()
+
+    def add_user(self, user_id: int, revoked_before: float, expires_at: float):
+        with self._lock:
+            self._users[user_id] = (int(revoked_before), expires_at)
+            self._after_add()
+
+    def replace(self, tokens: Iterable[Tuple[str, float]], users: Iterable[Tuple[int, float, float]]):
+        """用数据库中的内容替换内存集合（只保留未过期的条目）"""
+        now = time.time()
+        new_tokens = {jti: exp for jti, exp in tokens if exp > now}
+        new_users = {user_id: (int(before), exp) for user_id, before, exp in users if exp > now}
+        with self._lock:
+            self._tokens = new_tokens
+            self._users = new_users
+            self._added = 0
+
+    def claim_reload(self) -> bool:
+        """到了重新加载的时间时返回 True（同一时刻只有一个调用方会拿到）"""
+        now = time.time()
+        if now < self._next_reload:
+            return False
+        with self._lock:
+            if now < self._next_reload:
+                return False
+            self._next_reload = now + self.reload_interval
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tokens": len(self._tokens), "users": len(self._users)}
+
+    def _after_add(self):
+        # 调用方已持有锁
+        self._added += 1
+        if self._added >= _PRUNE_EVERY:
+            now = time.time()
+            self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+            self._users = {uid: entry for uid, entry in self._users.items() if entry[1] > now}
+            self._added = 0
+
+# 进程内唯一的吊销列表
+revocation_list = RevocationList()
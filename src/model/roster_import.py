@@ -0,0 +1,180 @@
+"""
+班级名单批量导入：校验每一行、并行计算密码哈希、在一个事务中 executemany 插入，返回逐行结果
+可通过管理接口 POST /api/admin/roster/import 调用（最多 ROSTER_REQUEST_MAX_ROWS 行），更大的名单直接运行：
+    python roster_import.py roster.csv [--db data/bbvdle.db] [--dry-run] [--report report.json]
+CSV 需包含表头 username,email,password；JSON 为对象数组或 {"students": [...]}
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import database
+from auth_utils import BCRYPT_WORKERS, calibrate_bcrypt_rounds, hash_passwords
+from validators import validate_email, validate_username, validate_password
+
+# 单次导入的最大行数
+ROSTER_MAX_ROWS = int(os.environ.get('BBVDLE_ROSTER_MAX_ROWS', '2000'))
+# 管理接口在请求线程中导入的最大行数（需在 gunicorn 超时内完成哈希），更大的名单用命令行导入
+ROSTER_REQUEST_MAX_ROWS = int(os.environ.get('BBVDLE_ROSTER_REQUEST_MAX_ROWS', '200'))
+# 管理接口导入时并行哈希的线程数（默认与登录注册的 bcrypt 线程池相同，避免占满全部核心）；
+# 命令行导入不与登录竞争，使用全部核心
+ROSTER_HASH_WORKERS = int(os.environ.get('BBVDLE_ROSTER_HASH_WORKERS', str(BCRYPT_WORKERS)))
+# SQLite 单条语句的参数个数有上限，IN 查询按批拆分
+_IN_BATCH = 500
+# 导入时使用的 bcrypt 成本因子（默认与登录注册相同）；调低可加快导入，学生首次登录时会自动升级
+ROSTER_BCRYPT_ROUNDS = os.environ.get('BBVDLE_ROSTER_BCRYPT_ROUNDS')
+
+def parse_roster(text: str, fmt: str = 'csv') -> List[Dict[str, Any]]:
+    """解析 CSV 或 JSON 名单，返回 [{username, email, password}, ...]"""
+    if fmt == 'json':
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get('students', [])
+        if not isinstance(data, list):
+            raise ValueError("JSON 名单应为对象数组或 {\"students\": [...]}")
+        return [row if isinstance(row, dict) else {} for row in data]
+    if fmt != 'csv':
+        raise ValueError(f"不支持的名单格式: {fmt}")
+    reader = csv.DictReader(io.StringIO(text.lstrip('\ufeff')))
+    missing = {'username', 'email', 'password'} - set(name.strip() for name in reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"CSV 缺少列: {', '.join(sorted(missing))}")
+    return [{(key or '').strip(): value for key, value in row.items()} for row in reader]
+
+def _existing(conn, column: str, values: List[str]) -> set:
+    """查询数据库中已存在的用户名或邮箱"""
+    found = set()
+    for i in range(0, len(values), _IN_BATCH):
+        batch = values[i:i + _IN_BATCH]
+        placeholders = ','.join('?' * len(batch))
+        collate = ' COLLATE NOCASE' if column == 'email' else ''
+        found.update(row[0].lower() if collate else row[0] for row in conn.execute(
+            f'SELECT {column} FROM users WHERE {column}{collate} IN ({placeholders})', batch))
+    return found
+
+def _mark_conflicts(conn, pending: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """把与数据库已有用户冲突的行标记为失败，返回剩余的行"""
+    usernames = _existing(conn, 'username', [r['username'] for r in pending])
+    emails = _existing(conn, 'email', [r['email'] for r in pending])
+    remaining = []
+    for result in pending:
+        if result['username'] in usernames:
+            result.update(status='failed', error="用户名已存在")
+        elif result['email'] in emails:
+            result.update(status='failed', error="邮箱已被注册")
+        else:
+            remaining.append(result)
+    return remaining
+
+def import_roster(rows: List[Dict[str, Any]], dry_run: bool = False,
+                  workers: int = ROSTER_HASH_WORKERS) -> Dict[str, Any]:
+    """导入名单并返回 {"total", "created", "failed", "elapsed_ms", "results": [逐行结果]}"""
+    start = time.perf_counter()
+    if len(rows) > ROSTER_MAX_ROWS:
+        raise ValueError(f"名单最多 {ROSTER_MAX_ROWS} 行")
+
+    # 逐行校验（与注册接口相同的规则），并检查名单内部的重复
+    results = []
+    passwords = {}
+    seen_usernames, seen_emails = set(), set()
+    for index, row in enumerate(rows, start=1):
+        username = str(row.get('username') or '').strip()
+        email = str(row.get('email') or '').strip().lower()
+        password = str(row.get('password') or '')
+        result = {"row": index, "username": username, "email": email, "status": "pending"}
+        results.append(result)
+        if not username or not email or not password:
+            error = "用户名、邮箱和密码不能为空"
+        elif not validate_username(username):
+            error = "用户名格式不正确（3-20个字符，只能包含字母、数字、下划线）"
+        elif not validate_email(email):
+            error = "邮箱格式不正确"
+        elif not validate_password(password)[0]:
+            error = validate_password(password)[1]
+        elif username in seen_usernames:
+            error = "用户名在名单中重复"
+        elif email in seen_emails:
+            error = "邮箱在名单中重复"
+        else:
+            error = None
+            seen_usernames.add(username)
+            seen_emails.add(email)
+            passwords[index] = password
+        if error:
+            result.update(status='failed', error=error)
+
+    pending = [r for r in results if r['status'] == 'pending']
+    if pending:
+        # 先排除已存在的用户，避免为它们做无用的哈希计算
+        with database.db_connection() as conn:
+            pending = _mark_conflicts(conn, pending)
+
+    if pending and not dry_run:
+        hashes = dict(zip((r['row'] for r in pending),
+                          hash_passwords([passwords[r['row']] for r in pending], workers,
+                                         int(ROSTER_BCRYPT_ROUNDS) if ROSTER_BCRYPT_ROUNDS else None)))
+        with database.db_connection() as conn:
+            # 写锁在事务开始时获取，冲突复查与插入之间不会有其他写入
+            conn.execute('BEGIN IMMEDIATE')
+            pending = _mark_conflicts(conn, pending)
+            conn.executemany('''
+                INSERT INTO users (username, email, password_hash)
+                VALUES (?, ?, ?)
+            ''', [(r['username'], r['email'], hashes[r['row']]) for r in pending])
+            ids = {}
+            for i in range(0, len(pending), _IN_BATCH):
+                batch = [r['username'] for r in pending[i:i + _IN_BATCH]]
+                ids.update(conn.execute(
+                    f"SELECT username, id FROM users WHERE username IN ({','.join('?' * len(batch))})", batch))
+            conn.commit()
+        for result in pending:
+            result.update(status='created', user_id=ids[result['username']])
+    elif dry_run:
+        for result in pending:
+            result['status'] = 'valid'
+
+    created = sum(1 for r in results if r['status'] == 'created')
+    return {
+        "total": len(results),
+        "created": created,
+        "failed": sum(1 for r in results if r['status'] == 'failed'),
+        "dry_run": dry_run,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000),
+        "results": results,
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="批量导入班级名单")
+    parser.add_argument('roster', help='名单文件（.csv 或 .json）')
+    parser.add_argument('--format', choices=('csv', 'json'), default=None, help='名单格式（默认按扩展名判断）')
+    parser.add_argument('--db', default=None, help='数据库路径（默认使用 BBVDLE_DB_PATH 或 data/bbvdle.db）')
+    parser.add_argument('--dry-run', action='store_true', help='只校验，不写入数据库')
+    parser.add_argument('--report', default=None, help='把逐行结果写入 JSON 文件')
+    args = parser.parse_args(argv)
+
+    from config import load_config
+    database.DB_PATH = args.db or load_config()['DB_PATH']
+    database.init_database()
+    calibrate_bcrypt_rounds()
+
+    fmt = args.format or ('json' if args.roster.lower().endswith('.json') else 'csv')
+    with open(args.roster, 'r', encoding='utf-8') as f:
+        rows = parse_roster(f.read(), fmt)
+    report = import_roster(rows, dry_run=args.dry_run, workers=os.cpu_count() or 1)
+
+    for result in report['results']:
+        if result['status'] == 'failed':
+            print(f"第 {result['row']} 行 {result['username']}: {result['error']}")
+    print(f"共 {report['total']} 行，成功 {report['created']}，失败 {report['failed']}，耗时 {report['elapsed_ms']}ms")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if report['failed'] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
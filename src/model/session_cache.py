@@ -0,0 +1,83 @@
+"""
+已验证会话的进程内缓存：命中时 /api/auth/verify 不需要访问数据库
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any
+
+# 缓存容量；多进程部署时其它进程无法收到失效通知，REVALIDATE 秒后强制回源数据库
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get('BBVDLE_SESSION_CACHE_MAX_ENTRIES', '10000'))
+SESSION_CACHE_REVALIDATE = float(os.environ.get('BBVDLE_SESSION_CACHE_REVALIDATE', '60'))
+
+def _token_key(token: str) -> str:
+    """缓存中只保存 token 的哈希，不保存 token 本身"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def session_expiry_timestamp(expires_at: str) -> float:
+    """把数据库中的 expires_at（UTC 的 ISO 格式）转换为时间戳"""
+    return datetime.fromisoformat(expires_at).replace(tzinfo=timezone.utc).timestamp()
+
+class SessionCache:
+    """线程安全的会话缓存，条目在 min(JWT exp, 会话 expires_at, 回源间隔) 时过期"""
+
+    def __init__(self, max_entries: int = SESSION_CACHE_MAX_ENTRIES, revalidate: float = SESSION_CACHE_REVALIDATE):
+        self.max_entries = max(1, max_entries)
+        self.revalidate = revalidate
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (session, expires_ts)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """返回缓存的会话（含 user_id、username、email），未命中或已过期返回 None"""
+        key = _token_key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time.time() < entry[1]:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, token: str, session: Dict[str, Any], expires_ts: float):
+        """缓存已验证的会话，expires_ts 为会话失效的时间戳"""
+        if self.revalidate > 0:
+            expires_ts = min(expires_ts, time.time() + self.revalidate)
+        key = _token_key(token)
+        with self._lock:
+            self._entries[key] = (session, expires_ts)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_token(self, token: str):
+        """使单个 token 的缓存失效（登出时调用）"""
+        with self._lock:
+            self._entries.pop(_token_key(token), None)
+
+    def invalidate_user(self, user_id: int):
+        """使某个用户的所有会话缓存失效（禁用账户时调用）"""
+        with self._lock:
+            stale = [key for key, (session, _) in self._entries.items() if session['user_id'] == user_id]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+# 进程内共享的会话缓存
+session_cache = SessionCache()
@@ -0,0 +1,72 @@
+"""
+后台会话清理：定时分批删除过期会话、过期的吊销记录和过期的AI对话历史，替代每次请求前的同步清理
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+from conversation_memory import CONVERSATION_TTL
+from database import delete_expired_conversations, delete_expired_sessions, delete_expired_revocations
+from structured_logging import get_logger
+
+logger = get_logger('session_reaper')
+
+# 清理间隔（秒）和每批删除的最大行数
+SESSION_REAP_INTERVAL = float(os.environ.get('BBVDLE_SESSION_REAP_INTERVAL', '300'))
+SESSION_REAP_BATCH_SIZE = int(os.environ.get('BBVDLE_SESSION_REAP_BATCH_SIZE', '500'))
+
+class SessionReaper:
+    """在守护线程中按固定间隔清理过期会话"""
+
+    def __init__(self, interval: float = SESSION_REAP_INTERVAL, batch_size: int = SESSION_REAP_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动清理线程（重复调用无副作用）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='session-reaper', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止清理线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self) -> int:
+        """执行一次清理，返回删除的会话数"""
+        delete_expired_revocations()
+        delete_expired_conversations(time.time() - CONVERSATION_TTL)
+        return delete_expired_sessions(self.batch_size)
+
+    def _run(self):
+        # 启动后先清理一次，随后每隔 interval 秒清理一次
+        while not self._stop.is_set():
+            try:
+                deleted = self.run_once()
+                if deleted:
+                    logger.info("已清理过期会话: %d", deleted)
+            except Exception as e:
+                logger.warning("清理过期会话失败: %s", e)  # 清理失败不影响服务，等待下一轮
+            self._stop.wait(self.interval)
+
+_reaper: Optional[SessionReaper] = None
+_reaper_lock = threading.Lock()
+
+def start_session_reaper(interval: float = SESSION_REAP_INTERVAL,
+                         batch_size: int = SESSION_REAP_BATCH_SIZE) -> Optional[SessionReaper]:
+    """启动进程内唯一的会话清理线程；interval <= 0 表示禁用"""
+    global _reaper
+    if interval <= 0:
+        return None
+    with _reaper_lock:
+        if _reaper is None:
+            _reaper = SessionReaper(interval, batch_size)
+        _reaper.start()
+        return _reaper
@@ -0,0 +1,278 @@
+"""
+相似问题索引：换一种说法提出的同一问题（如“什么是Dropout”和“Dropout是什么？”），在上下文（模型、选中的层、
+当前任务）相同时直接返回已有的回答，不再调用大模型
+- 问题先归一化（小写，去掉标点、空白和“请问”之类的客套话），识别提问类型（为什么/怎么做/是什么）后去掉疑问词，
+  归一化结果为“类型|正文”（如 "why|设置学习率"）；正文取 2、3 字符 n-gram，计算 NUM_PERM 个 MinHash
+- 同一上下文、同一提问类型的签名保存在一个 NumPy 矩阵中，查询时一次向量化比较得到与所有已有问题的估计 Jaccard 相似度；
+  类型不同的问题（“如何设置学习率”和“为什么设置学习率”）即使正文相同也不会匹配
+- 大模型生成的问答自动加入（延迟写入 ai_similar_questions 表）；管理员可以添加、修改或停用条目，
+  停用的条目保留在表中，同一问题不会被自动重新加入
+- 多进程部署时各进程的后台线程每隔 RELOAD 秒检查表是否有变化，有变化时重新加载（不占用请求线程）
+"""
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import database
+import metrics
+from structured_logging import get_logger
+from write_behind import write_behind
+
+logger = get_logger('similar_questions')
+
+# 配置（可通过环境变量调整）
+SIMILAR_ENABLED = os.environ.get('BBVDLE_SIMILAR_ENABLED', '1').lower() in ('1', 'true', 'yes')
+# 估计的 Jaccard 相似度不低于该值时视为同一问题
+SIMILAR_THRESHOLD = float(os.environ.get('BBVDLE_SIMILAR_THRESHOLD', '0.6'))
+SIMILAR_MAX_ENTRIES = int(os.environ.get('BBVDLE_SIMILAR_MAX_ENTRIES', '20000'))
+SIMILAR_RELOAD_INTERVAL = float(os.environ.get('BBVDLE_SIMILAR_RELOAD_INTERVAL', '30'))  # 秒
+
+NUM_PERM = 128
+NGRAM_SIZES = (2, 3)
+# 归一化后过短（无法区分）或过长（粘贴的代码、长段落，不会被换一种说法重复提问）的问题不参与
+MIN_QUESTION_CHARS = 2
+MAX_QUESTION_CHARS = 200
+# 不影响问题含义的客套话，去掉后只比较问题本身
+FILLER_PHRASES = ('我想知道', '请问', '一下')
+# 提问类型及其疑问词：按顺序识别（“为什么”包含“什么”，必须先于 what），同一类型内长的在前
+QUESTION_TYPES = (
+    ('why', ('为什么', '为何', '为啥')),
+    ('how', ('怎么样', '怎么', '怎样', '如何')),
+    ('what', ('什么是', '是什么', '什么', '是啥', '啥是')),
+)
+
+_PUNCTUATION = re.compile(r'[\W_]+')
+_TRAILING_PARTICLES = re.compile(r'[吗呢啊吧]+$')
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240601)  # 固定种子：各进程、重启前后的签名一致
+_PERM_A = _rng.randint(1, _PRIME, NUM_PERM).astype(np.uint64)[:, None]
+_PERM_B = _rng.randint(0, _PRIME, NUM_PERM).astype(np.uint64)[:, None]
+
+SIMILAR_LOOKUPS = metrics.counter('bbvdle_reply_similar_total',
+                                  'Near-duplicate question lookups (hit = upstream LLM call avoided).', ('result',))
+
+write_behind.register('similar_question', '''
+    INSERT OR IGNORE INTO ai_similar_questions
+        (context_key, question, question_norm, answer, source, enabled, hits, created_at, updated_at)
+    VALUES (?, ?, ?, ?, 'auto', 1, 0, ?, ?)
+''')
+write_behind.register('similar_question_hit',
+                      'UPDATE ai_similar_questions SET hits = hits + ? WHERE context_key = ? AND question_norm = ?',
+                      merge=lambda old, new: (old[0] + new[0],) + new[1:])
+
+def normalize_question(text: str) -> str:
+    """小写，去掉标点、空白、客套话和句末语气词；返回“提问类型|去掉疑问词的正文”（没有疑问词时类型为空）"""
+    text = _PUNCTUATION.sub('', (text or '').lower())
+    for phrase in FILLER_PHRASES:
+        text = text.replace(phrase, '')
+    question_type = ''
+    for name, words in QUESTION_TYPES:
+        if any(word in text for word in words):
+            question_type = question_type or name
+            for word in words:
+                text = text.replace(word, '')
+    return f"{question_type}|{_TRAILING_PARTICLES.sub('', text)}"
+
+def split_question(normalized: str) -> Tuple[str, str]:
+    """归一化的问题拆分为 (提问类型, 正文)"""
+    question_type, _, body = normalized.rpartition('|')
+    return question_type, body
+
+def minhash(normalized: str) -> Optional[np.ndarray]:
+    """正文的字符 n-gram 集合的 MinHash 签名（uint32 × NUM_PERM），问题过短或过长时返回 None"""
+    body = split_question(normalized)[1]
+    if not MIN_QUESTION_CHARS <= len(body) <= MAX_QUESTION_CHARS:
+        return None
+    grams = {body[i:i + n] for n in NGRAM_SIZES for i in range(max(1, len(body) - n + 1))}
+    hashes = np.fromiter((zlib.crc32(gram.encode('utf-8')) & 0x7fffffff for gram in grams),
+                         dtype=np.uint64, count=len(grams))
+    # 每一行是一个随机哈希函数 (a*x + b) mod p，取所有 n-gram 上的最小值
+    return ((_PERM_A * hashes + _PERM_B) % _PRIME).min(axis=1).astype(np.uint32)
+
+def context_key(selected_layer=None, task_name=None, education_context=None, model: str = '') -> Optional[str]:
+    """问题所在的上下文，只在上下文相同的问题之间匹配；针对教学内容的提问返回 None（由离线预热覆盖）"""
+    if isinstance(education_context, dict) and (education_context.get('text') or '').strip():
+        return None
+    layer = selected_layer if isinstance(selected_layer, dict) else {}
+    return json.dumps({
+        "model": model,
+        "layer": layer.get('layerType') or '',
+        "params": layer.get('params') or {},
+        "task": task_name if task_name and task_name != "None" else '',
+    }, sort_keys=True, ensure_ascii=False)
+
+def _group_key(context: str, normalized: str) -> Tuple[str, str]:
+    """只在上下文和提问类型都相同的问题之间比较"""
+    return context, split_question(normalized)[0]
+
+class _Group:
+    """同一上下文、同一提问类型的问题：签名矩阵按容量倍增，查询时只比较前 size 行"""
+    __slots__ = ('signatures', 'questions', 'answers', 'size')
+
+    def __init__(self):
+        self.signatures = np.empty((8, NUM_PERM), dtype=np.uint32)
+        self.questions: List[str] = []  # 归一化后的问题
+        self.answers: List[str] = []
+        self.size = 0
+
+    def add(self, normalized: str, answer: str, signature: np.ndarray):
+        if self.size == len(self.signatures):
+            grown = np.empty((self.size * 2, NUM_PERM), dtype=np.uint32)
+            grown[:self.size] = self.signatures
+            self.signatures = grown
+        self.signatures[self.size] = signature
+        self.questions.append(normalized)
+        self.answers.append(answer)
+        self.size += 1
+
+class SimilarQuestionIndex:
+    """线程安全的相似问题索引"""
+
+    def __init__(self, threshold: float = SIMILAR_THRESHOLD, max_entries: int = SIMILAR_MAX_ENTRIES,
+                 reload_interval: float = SIMILAR_RELOAD_INTERVAL, enabled: bool = SIMILAR_ENABLED):
+        self.threshold = threshold
+        self.max_entries = max(0, max_entries)
+        self.reload_interval = reload_interval
+        self.enabled = enabled
+        self._groups: Dict[Tuple[str, str], _Group] = {}
+        self._known: set = set()  # (上下文, 归一化问题)，包括已停用的条目
+        self._entries = 0
+        self._lock = threading.Lock()
+        self._version: Optional[Tuple] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, question: str, context: str) -> Optional[str]:
+        """返回上下文相同、相似度达到阈值的已有回答"""
+        match = self.best_match(question, context)
+        if match is None or match['score'] < self.threshold:
+            with self._lock:
+                self.misses += 1
+            SIMILAR_LOOKUPS.inc('miss')
+            return None
+        with self._lock:
+            self.hits += 1
+        SIMILAR_LOOKUPS.inc('hit')
+        write_behind.put('similar_question_hit', (context, match['normalized']),
+                         (1, context, match['normalized']))
+        return match['answer']
+
+    def best_match(self, question: str, context: str) -> Optional[Dict[str, Any]]:
+        """上下文中与问题最相似的条目（不论是否达到阈值），索引为空或问题不适用时返回 None"""
+        if not self.enabled:
+            return None
+        normalized = normalize_question(question)
+        signature = minhash(normalized)
+        if signature is None:
+            return None
+        with self._lock:
+            group = self._groups.get(_group_key(context, normalized))
+            if group is None or group.size == 0:
+                return None
+            signatures, size = group.signatures, group.size
+            questions, answers = group.questions, group.answers
+        scores = (signatures[:size] == signature).mean(axis=1)
+        best = int(scores.argmax())
+        return {"normalized": questions[best], "answer": answers[best], "score": float(scores[best])}
+
+    def remember(self, question: str, context: str, answer: str):
+        """加入大模型生成的问答（已有相同问题或索引已满时忽略），数据库写入延迟合并"""
+        if not self.enabled or not answer:
+            return
+        normalized = normalize_question(question)
+        signature = minhash(normalized)
+        if signature is None:
+            return
+        with self._lock:
+            if (context, normalized) in self._known or self._entries >= self.max_entries:
+                return
+            self._add_locked(context, normalized, answer, signature)
+        now = time.time()
+        write_behind.put('similar_question', (context, normalized),
+                         (context, question, normalized, answer, now, now))
+
+    def start(self):
+        """启动后台刷新线程：立即加载一次，之后定时检查（重复调用无副作用）"""
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='similar-questions', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def refresh(self):
+        """表有变化（其它进程写入或管理员修改）时重新加载"""
+        try:
+            version = database.get_similar_questions_version()
+            if version != self._version:
+                self.reload(version)
+        except Exception as e:
+            logger.warning("加载相似问题索引失败: %s", e)
+
+    def reload(self, version: Optional[Tuple] = None):
+        """从数据库重新构建索引（管理员修改后立即调用）"""
+        if version is None:
+            version = database.get_similar_questions_version()
+        # 已在索引中的问题沿用原来的签名，只为新增的问题计算
+        with self._lock:
+            previous = {question: group.signatures[i]
+                        for group in self._groups.values() for i, question in enumerate(group.questions)}
+        groups: Dict[Tuple[str, str], _Group] = {}
+        known = set()
+        entries = 0
+        for row in database.get_similar_question_rows():
+            key = (row['context_key'], row['question_norm'])
+            known.add(key)
+            if not row['enabled'] or entries >= self.max_entries:
+                continue
+            signature = previous.get(row['question_norm'])
+            if signature is None:
+                signature = minhash(row['question_norm'])
+            if signature is None:
+                continue
+            groups.setdefault(_group_key(*key), _Group()).add(row['question_norm'], row['answer'], signature)
+            entries += 1
+        with self._lock:
+            self._groups, self._known, self._entries = groups, known, entries
+            self._version = version
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": self._entries,
+                "contexts": len({context for context, _question_type in self._groups}),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.reload_interval)
+
+    def _add_locked(self, context: str, normalized: str, answer: str, signature: np.ndarray):
+        self._groups.setdefault(_group_key(context, normalized), _Group()).add(normalized, answer, signature)
+        self._known.add((context, normalized))
+        self._entries += 1
+
+# 进程内唯一的相似问题索引
+similar_index = SimilarQuestionIndex()
+
+metrics.gauge('bbvdle_reply_similar_entries', 'Question/answer pairs held in the near-duplicate index.',
+              callback=lambda: similar_index.stats()['entries'])
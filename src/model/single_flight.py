@@ -0,0 +1,122 @@
+"""
+请求合并（single-flight）：相同键的并发调用只执行一次，其余调用等待并共享结果
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict
+
+# 跟随者等待首个调用结果的最长时间（秒）
+SINGLE_FLIGHT_TIMEOUT = float(os.environ.get('BBVDLE_SINGLE_FLIGHT_TIMEOUT', '120'))
+
+class SingleFlight:
+    """
+    同一时刻每个键只有一个调用（leader）真正执行，期间到达的相同调用（follower）等待同一个 Future：
+    - leader 成功时所有 follower 得到相同结果；
+    - leader 抛出异常时所有 follower 收到同一个异常，错误不会被缓存，下一次调用会重新执行；
+    - follower 等待超过 timeout 秒时抛出 concurrent.futures.TimeoutError，leader 不受影响。
+    """
+
+    def __init__(self, timeout: float = SINGLE_FLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.executions = 0  # 实际执行的调用次数
+        self.coalesced = 0   # 被合并（节省）的调用次数
+        self.timeouts = 0
+        self.errors = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """执行 fn，若相同 key 的调用正在进行则等待其结果"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                raise
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self.errors += 1
+                self._calls.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._calls.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """返回合并统计，coalesced 即节省的上游调用次数"""
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "in_flight": len(self._calls),
+            }
+
+class AsyncSingleFlight:
+    """SingleFlight 的 asyncio 版本：follower 等待 leader 的协程结果，需在同一个事件循环中使用"""
+
+    def __init__(self, timeout: float = SINGLE_FLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self._calls: Dict[str, "asyncio.Future"] = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 await fn()，若相同 key 的调用正在进行则等待其结果（超时抛出 asyncio.TimeoutError）"""
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                # shield：follower 超时或被取消时不影响 leader
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+
+        future = asyncio.get_event_loop().create_future()
+        self._calls[key] = future
+        self.executions += 1
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.errors += 1
+            self._calls.pop(key, None)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # 没有 follower 时避免 “exception was never retrieved” 警告
+            raise
+        self._calls.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "in_flight": len(self._calls),
+        }
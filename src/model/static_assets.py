@@ -0,0 +1,145 @@
+"""
+前端启动时请求的静态文件（dist/ip.txt、dist/tasksteps.json、resources/educationimages/*.png）
+- 启动时读入内存：强 ETag 为内容的 SHA-256，文本类文件预先压缩为 gzip（安装了 brotli 时还有 br），请求时不再读盘或压缩
+- 带 If-None-Match 的重复请求返回 304；各编码的 ETag 不同（"<版本>"、"<版本>-gzip"），任意一个匹配都说明客户端的副本仍然有效
+- URL 带 ?v=<版本>（/api/config 返回）且与当前内容一致时按不可变资源缓存一年；不带版本时
+  图片缓存 STATIC_MAX_AGE 秒，部署时会改写的 dist 文件缓存 STATIC_CONFIG_MAX_AGE 秒，过期后用 ETag 重新验证
+- 只服务白名单内的文件（dist 下还有 API key 等文件）
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import metrics
+from config import ROOT_DIR
+from structured_logging import get_logger
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只提供 gzip
+    brotli = None
+
+logger = get_logger('static_assets')
+
+# 配置（可通过环境变量调整）
+STATIC_MAX_AGE = int(os.environ.get('BBVDLE_STATIC_MAX_AGE', '86400'))  # 秒
+STATIC_CONFIG_MAX_AGE = int(os.environ.get('BBVDLE_STATIC_CONFIG_MAX_AGE', '300'))  # 秒
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# 白名单：单个文件（部署时会改写，缓存时间较短）和目录（只包含指定扩展名的文件）
+STATIC_FILES = ('dist/ip.txt', 'dist/tasksteps.json')
+STATIC_DIRS = (('resources/educationimages', ('.png',)),)
+# 压缩后至少减少 10% 才保存压缩版本（PNG 等已压缩的格式通常达不到）
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_BYTES = 256
+MIN_COMPRESS_RATIO = 0.9
+
+STATIC_REQUESTS = metrics.counter('bbvdle_static_requests_total', 'Static asset requests by result and encoding.',
+                                  ('result', 'encoding'))
+
+class StaticAsset:
+    """一个文件的各编码版本（identity、gzip、br）"""
+    __slots__ = ('content_type', 'max_age', 'version', 'bodies')
+
+    def __init__(self, content: bytes, content_type: str, max_age: int):
+        self.content_type = content_type
+        self.max_age = max_age
+        self.version = hashlib.sha256(content).hexdigest()[:20]
+        self.bodies: Dict[str, bytes] = {'identity': content}
+        if content_type.startswith(COMPRESSIBLE_TYPES) and len(content) >= MIN_COMPRESS_BYTES:
+            self._add('gzip', gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._add('br', brotli.compress(content))
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.version}"' if encoding == 'identity' else f'"{self.version}-{encoding}"'
+
+    def matches(self, if_none_match: str) -> bool:
+        """If-None-Match 是否包含本文件任意编码的 ETag（按弱比较，忽略 W/ 前缀）"""
+        tags = {tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip()
+                for tag in if_none_match.split(',')}
+        return '*' in tags or any(self.etag(encoding) in tags for encoding in self.bodies)
+
+    def _add(self, encoding: str, body: bytes):
+        if len(body) < len(self.bodies['identity']) * MIN_COMPRESS_RATIO:
+            self.bodies[encoding] = body
+
+class StaticAssetStore:
+    """启动时加载白名单内的文件，之后只读（多线程共享无需加锁）"""
+
+    def __init__(self, root: str = ROOT_DIR):
+        self.root = root
+        self.assets: Dict[str, StaticAsset] = {}
+
+    def load(self) -> 'StaticAssetStore':
+        assets: Dict[str, StaticAsset] = {}
+        for path in STATIC_FILES:
+            self._load_file(assets, path, STATIC_CONFIG_MAX_AGE)
+        for directory, extensions in STATIC_DIRS:
+            full_dir = os.path.join(self.root, directory)
+            if not os.path.isdir(full_dir):
+                continue
+            for name in sorted(os.listdir(full_dir)):
+                if name.lower().endswith(extensions):
+                    self._load_file(assets, f'{directory}/{name}', STATIC_MAX_AGE)
+        self.assets = assets
+        logger.info("静态文件已加载", extra={"fields": self.stats()})
+        return self
+
+    def versioned_urls(self) -> Dict[str, str]:
+        """各文件带版本的 URL，内容变化后版本随之变化"""
+        return {f'/{path}': f'/{path}?v={asset.version}' for path, asset in self.assets.items()}
+
+    def respond(self, path: str, version: Optional[str], if_none_match: str,
+                accept_encoding: str) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        """返回 (状态码, 响应头, 响应体)；不在白名单内时返回 None"""
+        asset = self.assets.get(path.lstrip('/'))
+        if asset is None:
+            return None
+        encoding = choose_encoding(accept_encoding, asset.bodies)
+        if version == asset.version:
+            cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            cache_control = f'public, max-age={asset.max_age}'
+        headers = {"ETag": asset.etag(encoding), "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if if_none_match and asset.matches(if_none_match):
+            STATIC_REQUESTS.inc('not_modified', encoding)
+            return 304, headers, b''
+        STATIC_REQUESTS.inc('ok', encoding)
+        headers["Content-Type"] = asset.content_type
+        if encoding != 'identity':
+            headers["Content-Encoding"] = encoding
+        return 200, headers, asset.bodies[encoding]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "files": len(self.assets),
+            "bytes": sum(len(asset.bodies['identity']) for asset in self.assets.values()),
+            "compressed": sum(1 for asset in self.assets.values() if len(asset.bodies) > 1),
+            "brotli": brotli is not None,
+        }
+
+    def _load_file(self, assets: Dict[str, StaticAsset], path: str, max_age: int):
+        try:
+            with open(os.path.join(self.root, path), 'rb') as f:
+                content = f.read()
+        except OSError:
+            return
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/'):
+            content_type += '; charset=utf-8'
+        assets[path] = StaticAsset(content, content_type, max_age)
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """按 Accept-Encoding 选择已有的编码，优先 br，其次 gzip（q=0 表示不接受）"""
+    accepted = set()
+    for part in (accept_encoding or '').lower().split(','):
+        name, _, params = part.strip().partition(';')
+        if name and params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.strip())
+    for encoding in ('br', 'gzip'):
+        if encoding in available and (encoding in accepted or '*' in accepted):
+            return encoding
+    return 'identity'
@@ -0,0 +1,146 @@
+"""
+结构化日志：每条日志为一行 JSON（时间、级别、logger、消息、请求ID 和附加字段）
+请求线程只把日志放入有界队列（队列满时丢弃并计数，不会阻塞），由后台 QueueListener 线程写入文件或标准输出；
+写入文件时按大小轮转。提示词和回复正文按比例采样并截断，避免大段文本拖慢请求或写满磁盘
+
+用法：
+    logger = get_logger('reply')
+    logger.info("生成回复", extra={"fields": {"duration_ms": 12.3}})
+    logger.info("提示词", extra={"fields": body_fields(full_prompt)})
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+import metrics
+
+LOG_LEVEL = os.environ.get('BBVDLE_LOG_LEVEL', 'INFO').upper()
+# 日志文件（未设置时写标准输出）；多进程部署时可包含 {pid}，每个进程写自己的文件，避免轮转时互相覆盖
+LOG_FILE = os.environ.get('BBVDLE_LOG_FILE')
+LOG_MAX_BYTES = int(os.environ.get('BBVDLE_LOG_MAX_BYTES', str(20 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get('BBVDLE_LOG_BACKUP_COUNT', '5'))
+LOG_QUEUE_SIZE = int(os.environ.get('BBVDLE_LOG_QUEUE_SIZE', '10000'))
+# 提示词/回复正文的采样比例和最大长度（DEBUG 级别时总是记录正文）
+LOG_BODY_SAMPLE_RATE = float(os.environ.get('BBVDLE_LOG_BODY_SAMPLE_RATE', '0.05'))
+LOG_BODY_MAX_CHARS = int(os.environ.get('BBVDLE_LOG_BODY_MAX_CHARS', '500'))
+
+LOG_DROPPED = metrics.counter('bbvdle_log_dropped_total', 'Log records dropped because the log queue was full.')
+
+# 当前请求的ID（Flask 请求和 asyncio 任务各自独立）
+request_id_var: contextvars.ContextVar = contextvars.ContextVar('request_id', default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_target: Optional[logging.Handler] = None
+
+def get_logger(name: str) -> logging.Logger:
+    """应用内的 logger 都在 bbvdle 之下，由 setup_logging() 统一配置"""
+    return logging.getLogger(f'bbvdle.{name}')
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    """使用客户端或反向代理传入的 X-Request-ID（长度合理时），否则生成新的ID，并绑定到当前上下文"""
+    request_id = incoming if incoming and len(incoming) <= 64 else uuid.uuid4().hex[:16]
+    request_id_var.set(request_id)
+    return request_id
+
+def clear_request_id():
+    """请求结束时清除，避免线程复用时后续的后台日志带上旧的请求ID"""
+    request_id_var.set(None)
+
+def body_fields(text: Optional[str], key: str = 'body') -> Dict[str, Any]:
+    """正文的日志字段：总是记录长度，按采样比例记录截断后的正文"""
+    text = text or ''
+    fields: Dict[str, Any] = {f'{key}_chars': len(text)}
+    logger = logging.getLogger('bbvdle')
+    if logger.isEnabledFor(logging.DEBUG) or random.random() < LOG_BODY_SAMPLE_RATE:
+        if len(text) > LOG_BODY_MAX_CHARS:
+            text = text[:LOG_BODY_MAX_CHARS] + f"…(+{len(text) - LOG_BODY_MAX_CHARS})"
+        fields[key] = text
+    return fields
+
+class JsonFormatter(logging.Formatter):
+    """把日志记录格式化为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            entry["request_id"] = request_id
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """在调用线程中只做最少的工作：记录请求ID、合并消息参数，然后非阻塞地放入队列"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = request_id_var.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # 异常对象不能跨线程保留，先格式化为文本（只在出错时发生）
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # 队列满时也要等待放入结束标记，保证退出前写完已入队的日志
+        self.queue.put(self._sentinel)
+
+def setup_logging(level: str = LOG_LEVEL, log_file: Optional[str] = LOG_FILE) -> logging.Logger:
+    """配置 bbvdle logger（重复调用无副作用），进程退出时写完队列中剩余的日志"""
+    global _listener, _target
+    root = logging.getLogger('bbvdle')
+    if _listener is not None:
+        return root
+    if log_file:
+        log_file = log_file.replace('{pid}', str(os.getpid()))
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        target: logging.Handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    else:
+        target = logging.StreamHandler(sys.stdout)
+    target.setFormatter(JsonFormatter())
+    _target = target
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE))
+    root.handlers = [NonBlockingQueueHandler(log_queue)]
+    root.setLevel(level)
+    root.propagate = False
+    _listener = _Listener(log_queue, target, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_logging)
+    return root
+
+def stop_logging():
+    """停止后台写入线程（会先写完队列中的日志）；之后的日志（如其他退出钩子）直接同步写入"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        logging.getLogger('bbvdle').handlers = [_target]
@@ -0,0 +1,52 @@
+"""
+AirPassengers 时间序列的服务端预处理：全量 MinMax 归一化 + 滑动窗口 + 按时间顺序划分训练/测试集
+与前端 AirPassengersData 的处理方式一致（归一化参数基于全量数据，窗口预测下一个月），全部用 NumPy 向量化完成
+返回紧凑的 little-endian float32 二进制：
+    头部 5 个数：time_step, 训练样本数, 测试样本数, min, max
+    然后依次为 x_train（训练样本数 × time_step）、y_train、x_test（测试样本数 × time_step）、y_test
+"""
+import hashlib
+import os
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from config import ROOT_DIR
+
+AIRPASSENGERS_CSV = os.path.join(ROOT_DIR, 'AirPassengers.csv')
+HEADER_SIZE = 5
+
+@lru_cache(maxsize=1)
+def load_series(path: str = AIRPASSENGERS_CSV) -> np.ndarray:
+    """读取 CSV 的 value 列（只读取一次）"""
+    series = np.loadtxt(path, delimiter=',', skiprows=1, usecols=1, dtype=np.float64)
+    series.setflags(write=False)
+    return series
+
+def make_windows(series: np.ndarray, time_step: int, split: float) -> Tuple[np.ndarray, ...]:
+    """返回 (x_train, y_train, x_test, y_test, min, max)，窗口是归一化序列上的只读视图，不复制数据"""
+    if not 0 < time_step < len(series) - 1:
+        raise ValueError(f"time_step 必须在 1 到 {len(series) - 2} 之间")
+    if not 0 < split < 1:
+        raise ValueError("split 必须在 0 到 1 之间")
+    lo, hi = float(series.min()), float(series.max())
+    scaled = (series - lo) / (hi - lo) if hi > lo else np.zeros_like(series)
+    # 第 i 个窗口为 scaled[i:i+time_step]，目标为 scaled[i+time_step]；最后一个窗口没有目标，去掉
+    windows = sliding_window_view(scaled, time_step)[:-1]
+    targets = scaled[time_step:]
+    split_index = int(len(windows) * split)
+    if split_index == 0 or split_index == len(windows):
+        raise ValueError("划分后训练集或测试集为空")
+    return (windows[:split_index], targets[:split_index],
+            windows[split_index:], targets[split_index:], lo, hi)
+
+@lru_cache(maxsize=64)
+def windows_payload(time_step: int, split: float) -> Tuple[bytes, str]:
+    """按参数缓存的二进制数据和 ETag"""
+    x_train, y_train, x_test, y_test, lo, hi = make_windows(load_series(), time_step, split)
+    header = np.array([time_step, len(x_train), len(x_test), lo, hi])
+    payload = np.concatenate([header, x_train.ravel(), y_train, x_test.ravel(), y_test]).astype('<f4').tobytes()
+    etag = '"' + hashlib.sha256(payload).hexdigest()[:32] + '"'
+    return payload, etag
@@ -0,0 +1,20 @@
+"""
+注册信息校验（注册接口与班级名单导入共用）
+"""
+import re
+
+def validate_email(email: str) -> bool:
+    """验证邮箱格式"""
+    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+    return re.match(pattern, email) is not None
+
+def validate_username(username: str) -> bool:
+    """验证用户名格式（3-20个字符，只能包含字母、数字、下划线）"""
+    pattern = r'^[a-zA-Z0-9_]{3,20}$'
+    return re.match(pattern, username) is not None
+
+def validate_password(password: str):
+    """验证密码强度（至少6个字符）"""
+    if len(password) < 6:
+        return (False, "密码长度至少为6个字符")
+    return (True, "")
@@ -0,0 +1,137 @@
+"""
+低优先级写入的延迟合并：last_login 之类不影响响应的写操作先放入内存缓冲，
+按 (类型, 键) 合并后由后台线程每隔 INTERVAL 毫秒或积累 MAX_PENDING 条时在一个事务中写入，进程退出时写完剩余数据
+新增一种写入：write_behind.register('类型', 'SQL', merge) 后调用 write_behind.put('类型', 键, 参数)
+"""
+import atexit
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import database
+import metrics
+from metrics import timed_query
+from structured_logging import get_logger
+
+logger = get_logger('write_behind')
+
+# 刷新间隔（毫秒）和触发立即刷新的待写条目数
+WRITE_BEHIND_INTERVAL_MS = float(os.environ.get('BBVDLE_WRITE_BEHIND_INTERVAL_MS', '500'))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('BBVDLE_WRITE_BEHIND_MAX_PENDING', '1000'))
+
+WRITE_BEHIND_FLUSHED = metrics.counter('bbvdle_write_behind_flushed_total',
+                                       'Coalesced low-priority writes flushed to SQLite.', ('kind',))
+WRITE_BEHIND_FAILURES = metrics.counter('bbvdle_write_behind_failures_total',
+                                        'Write-behind flushes that failed and were requeued.')
+
+class WriteBehindBuffer:
+    """线程安全的写入缓冲：同一 (类型, 键) 只保留合并后的一条，批量 executemany 写入"""
+
+    def __init__(self, interval_ms: float = WRITE_BEHIND_INTERVAL_MS, max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self.interval = interval_ms / 1000
+        self.max_pending = max(1, max_pending)
+        self._statements: Dict[str, Tuple[str, Optional[Callable[[tuple, tuple], tuple]]]] = {}
+        self._pending: Dict[Tuple[str, Any], tuple] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, kind: str, sql: str, merge: Optional[Callable[[tuple, tuple], tuple]] = None):
+        """注册一种写入；merge(旧参数, 新参数) 返回合并后的参数，默认保留最新的"""
+        self._statements[kind] = (sql, merge)
+
+    def put(self, kind: str, key: Any, params: tuple):
+        """放入一条待写数据（首次调用时启动后台线程）"""
+        merge = self._statements[kind][1]
+        with self._lock:
+            old = self._pending.get((kind, key))
+            self._pending[(kind, key)] = merge(old, params) if merge and old is not None else params
+            pending = len(self._pending)
+            if self._thread is None:
+                self._start_locked()
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @timed_query
+    def flush(self) -> int:
+        """把当前缓冲的数据在一个事务中写入，返回写入条数；失败时放回缓冲等待下次重试"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            by_kind: Dict[str, list] = {}
+            for (kind, _key), params in batch.items():
+                by_kind.setdefault(kind, []).append(params)
+            try:
+                with database.db_connection() as conn:
+                    for kind, rows in by_kind.items():
+                        conn.executemany(self._statements[kind][0], rows)
+                    conn.commit()
+            except Exception:
+                WRITE_BEHIND_FAILURES.inc()
+                self._requeue(batch)
+                raise
+            for kind, rows in by_kind.items():
+                WRITE_BEHIND_FLUSHED.inc(kind, amount=len(rows))
+            return len(batch)
+
+    def start(self):
+        """启动后台刷新线程（重复调用无副作用）"""
+        with self._lock:
+            self._start_locked()
+
+    def stop(self, timeout: Optional[float] = 5):
+        """停止后台线程并写完剩余数据"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("延迟写入失败，%d 条数据未写入: %s", self.pending(), e)
+
+    def _start_locked(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def _requeue(self, batch: Dict[Tuple[str, Any], tuple]):
+        with self._lock:
+            for (kind, key), params in batch.items():
+                newer = self._pending.get((kind, key))
+                merge = self._statements[kind][1]
+                if newer is None:
+                    self._pending[(kind, key)] = params
+                elif merge:
+                    self._pending[(kind, key)] = merge(params, newer)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("延迟写入失败，稍后重试: %s", e)  # 数据已放回缓冲
+
+# 进程内唯一的写入缓冲，进程退出时写完剩余数据
+write_behind = WriteBehindBuffer()
+write_behind.register('last_login', 'UPDATE users SET last_login = ? WHERE id = ?')
+atexit.register(write_behind.stop)
+
+metrics.gauge('bbvdle_write_behind_pending', 'Low-priority writes waiting to be flushed.',
+              callback=write_behind.pending)
+
+def record_last_login(user_id: int):
+    """记录最后登录时间（延迟写入，同一用户多次登录只写最后一次）"""
+    write_behind.put('last_login', user_id, (datetime.now().isoformat(), user_id))
@@ -0,0 +1,25 @@
+"""
+生产环境 WSGI 入口
+
+多进程（Linux，推荐）：
+    gunicorn -c src/model/gunicorn.conf.py wsgi:app
+单进程多线程（Windows 或未安装 gunicorn 时）：
+    python src/model/wsgi.py
+
+进程数、线程数、keep-alive 等通过环境变量配置（见 config.py）：
+    BBVDLE_WORKERS、BBVDLE_THREADS、BBVDLE_KEEPALIVE、BBVDLE_TIMEOUT、BBVDLE_HOST、BBVDLE_PORT
+"""
+from GLM import create_app
+
+app = create_app()
+
+if __name__ == "__main__":
+    from waitress import serve
+
+    serve(
+        app,
+        host=app.config['HOST'],
+        port=app.config['PORT'],
+        threads=app.config['THREADS'],
+        channel_timeout=app.config['TIMEOUT'],
+    )
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { authService, getApiBaseUrl } from './auth/authService';
 
 function renderMarkdown(src: string): string {
     // 简单转义，避免 HTML 注入
@@ -54,8 +55,8 @@ function renderMarkdown(src: string): string {
     return out.join("\n").replace(/\n/g, "<br>");
 }
 
-// 添加消息到对话框，并注明发送者
-export function appendMessage(container: HTMLElement, sender: string, message: string): void {
+// 添加消息到对话框，并注明发送者；返回消息内容元素，便于流式更新
+export function appendMessage(container: HTMLElement, sender: string, message: string): HTMLElement {
     const messageWrapper = document.createElement("div");
     messageWrapper.className = sender === "user" ? "message user" : "message assistant";
 
@@ -76,21 +77,104 @@ export function appendMessage(container: HTMLElement, sender: string, message: s
 
     // 自动滚动到最新消息
     container.scrollTop = container.scrollHeight;
+    return messageContent;
 }
 
-// 从 dist 目录读取 ip.txt 文件的内容
-async function getServerIP() {
+// 更新已添加消息的内容（用于流式回复逐段显示）
+export function updateMessage(container: HTMLElement, messageContent: HTMLElement, message: string): void {
+    messageContent.innerHTML = renderMarkdown(message);
+    container.scrollTop = container.scrollHeight;
+}
+
+// 请求过于频繁（HTTP 429）时显示给用户的提示
+const RATE_LIMITED_MESSAGE = "提问过于频繁，请稍后再试。";
+
+class RateLimitedError extends Error {}
+
+// 已登录时附带 token，后端按用户限流
+function authHeaders(): { [key: string]: string } {
+    const token = authService.getToken();
+    return token ? { "Authorization": `Bearer ${token}` } : {};
+}
+
+// 解析一条 SSE 消息（"event: xxx\ndata: {...}"）
+function parseSseEvent(raw: string): { event: string; data: any } | null {
+    let event = "message";
+    const dataLines: string[] = [];
+    for (const line of raw.split("\n")) {
+        if (line.startsWith("event:")) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith("data:")) {
+            dataLines.push(line.slice(5).trim());
+        }
+    }
+    if (dataLines.length === 0) {
+        return null;
+    }
     try {
-      const response = await fetch('/dist/ip.txt');  // 假设 ip.txt 放在静态目录下
-      const ip = await response.text();
-      return ip.trim();  // 去掉任何多余的换行符或空格
+        return { event, data: JSON.parse(dataLines.join("\n")) };
     } catch (error) {
-      console.error('获取 IP 地址失败:', error);
-      return 'localhost';  // 如果失败，可以返回默认的本地地址
+        return null;
+    }
+}
+
+// 以 SSE 流的方式请求回复，每收到一段内容就回调 onChunk（参数为目前累计的完整文本）
+async function fetchAiResponseStream(
+    apiUrl: string,
+    payload: object,
+    onChunk: (partialReply: string) => void
+): Promise<string> {
+    const response = await fetch(apiUrl, {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+            ...authHeaders()
+        },
+        body: JSON.stringify({ ...payload, stream: true })
+    });
+    if (response.status === 429) {
+        throw new RateLimitedError(RATE_LIMITED_MESSAGE);
+    }
+    if (!response.ok || !response.body) {
+        throw new Error(`流式请求失败: ${response.status}`);
     }
-  }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder("utf-8");
+    let buffer = "";
+    let reply = "";
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let boundary = buffer.indexOf("\n\n");
+        while (boundary !== -1) {
+            const message = parseSseEvent(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+            boundary = buffer.indexOf("\n\n");
+            if (!message) {
+                continue;
+            }
+            if (message.event === "error") {
+                throw new Error(message.data.error);
+            }
+            if (message.event === "done") {
+                return message.data.reply ?? reply;
+            }
+            if (message.data.delta) {
+                reply += message.data.delta;
+                onChunk(reply);
+            }
+        }
+    }
+    return reply;
+}
 
 // 调用 Python 后端的 REST API 获取回复
+// 传入 onChunk 时使用流式接口，回复会在生成过程中逐段回调
 export async function fetchAiResponse(
     userMessage: string,
     selectedLayerInfo?: {
@@ -101,22 +185,41 @@ export async function fetchAiResponse(
     educationContext?: {
         text: string;
         mode?: string;
-    }
+    },
+    onChunk?: (partialReply: string) => void,
+    conversationId?: string
 ): Promise<string> {
     // return "你好，我是AI助手，有什么可以帮助你的吗？"
-    const serverIP = await getServerIP();
-    const apiUrl = `http://${serverIP}:5000/api/reply`;
+    const apiUrl = `${await getApiBaseUrl()}/reply`;
+    // conversationId：登录后服务端按对话保存历史，追问时带上前几轮的问答
+    const payload = {
+        message: userMessage,
+        selectedLayer: selectedLayerInfo,
+        taskName: taskName,
+        educationContext,
+        conversationId
+    };
+
+    if (onChunk && typeof ReadableStream !== "undefined") {
+        try {
+            return await fetchAiResponseStream(apiUrl, payload, onChunk);
+        } catch (error) {
+            console.error("流式请求失败:", error);
+            if (error instanceof RateLimitedError) {
+                return RATE_LIMITED_MESSAGE;
+            }
+            return "无法连接到后端服务。";
+        }
+    }
 
     try {
-        const response = await axios.post(apiUrl, {
-            message: userMessage,
-            selectedLayer: selectedLayerInfo,
-            taskName: taskName,
-            educationContext
-        });
+        const response = await axios.post(apiUrl, payload, { headers: authHeaders() });
         return response.data.reply;
     } catch (error) {
         console.error("请求失败:", error);
+        if (axios.isAxiosError(error) && error.response?.status === 429) {
+            return RATE_LIMITED_MESSAGE;
+        }
         return "无法连接到后端服务。";
     }
-}
\ No newline at end of file
+}
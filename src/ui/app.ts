@@ -33,7 +33,7 @@ import { Point } from "./shapes/shape";
 import { getSvgOriginalBoundingBox } from "./utils";
 import { windowProperties } from "./window";
 import { switchTask, toggleTaskSteps,verifyStepCompletion,isTaskAlready, getCurrentTask } from './taskModule';
-import { appendMessage, fetchAiResponse } from './ai_assistant';
+import { appendMessage, fetchAiResponse, updateMessage } from './ai_assistant';
 import { authService } from './auth/authService';
 import { authDialog } from './auth/authDialog';
 import { loginPage } from './auth/loginPage';
@@ -94,6 +94,8 @@ let voiceRecognition: any = null;
 let isRecording: boolean = false;
 let conversations: IConversation[] = [];
 let currentConversationId: number | null = null;
+// 本页面的随机标识：对话编号每次打开页面都从 1 开始，加上它后服务端不会把历史串到新页面的对话中
+const pageSessionId = Math.random().toString(36).slice(2, 10);
 let aiConversationSelectElement: HTMLSelectElement | null = null;
 let aiNewConversationButtonElement: HTMLButtonElement | null = null;
 
@@ -315,7 +317,7 @@ function renderCurrentConversation(): void {
     }
 }
 
-function appendMessageToCurrentConversation(sender: "user" | "assistant", content: string): void {
+function appendMessageToCurrentConversation(sender: "user" | "assistant", content: string, render: boolean = true): void {
     if (!aiDialogContentElement) {
         return;
     }
@@ -329,7 +331,10 @@ function appendMessageToCurrentConversation(sender: "user" | "assistant", conten
         updateConversationSelectOptions();
     }
     
-    appendMessage(aiDialogContentElement, sender, content);
+    // 流式回复已经逐段渲染过，只需记录到对话中
+    if (render) {
+        appendMessage(aiDialogContentElement, sender, content);
+    }
 }
 
 function addOnClickToOptions(categoryId: string, func: (optionValue: string, element: HTMLElement) => void): void {
@@ -1569,8 +1574,23 @@ async function sendAiMessage(
     }
 
     const taskName = getCurrentTask();
-    const aiResponse = await fetchAiResponse(userMessage, layerContext, taskName, educationContext);
-    appendMessageToCurrentConversation("assistant", aiResponse);
+    const conversationId = `${pageSessionId}-${getOrCreateCurrentConversation().id}`;
+    // 流式接收回复：第一段内容到达时创建消息，之后逐段更新
+    const streaming: { element: HTMLElement | null } = { element: null };
+    const aiResponse = await fetchAiResponse(userMessage, layerContext, taskName, educationContext, (partialReply) => {
+        if (!aiDialogContentElement) {
+            return;
+        }
+        if (streaming.element) {
+            updateMessage(aiDialogContentElement, streaming.element, partialReply);
+        } else {
+            streaming.element = appendMessage(aiDialogContentElement, "assistant", partialReply);
+        }
+    }, conversationId);
+    if (streaming.element && aiDialogContentElement) {
+        updateMessage(aiDialogContentElement, streaming.element, aiResponse);
+    }
+    appendMessageToCurrentConversation("assistant", aiResponse, !streaming.element);
     pendingAiAttachment = null;
     updateAiContextAttachment();
 }
@@ -28,24 +28,78 @@ export interface VerifyResponse {
 const TOKEN_KEY = 'bbvdle_auth_token';
 const USER_KEY = 'bbvdle_user_info';
 
+// 服务器IP在页面生命周期内不变：只读取一次 dist/ip.txt，并发的调用共用同一个请求
+let serverIPPromise: Promise<string> | null = null;
+
 // 从 dist 目录读取 ip.txt 文件的内容，获取服务器IP
-async function getServerIP(): Promise<string> {
-    try {
-        const response = await fetch('/dist/ip.txt');
-        const ip = await response.text();
-        return ip.trim();
-    } catch (error) {
-        console.error('获取 IP 地址失败:', error);
-        return 'localhost'; // 如果失败，返回默认的本地地址
+export function getServerIP(): Promise<string> {
+    if (!serverIPPromise) {
+        serverIPPromise = fetch('/dist/ip.txt')
+            .then((response) => {
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                return response.text();
+            })
+            .then((ip) => ip.trim())
+            .catch((error) => {
+                console.error('获取 IP 地址失败:', error);
+                serverIPPromise = null; // 失败时不记住结果，下次调用重新读取
+                return 'localhost'; // 如果失败，返回默认的本地地址
+            });
+    }
+    return serverIPPromise;
+}
+
+// 后端 /api/config 返回的启动配置
+export interface BootstrapConfig {
+    serverIP: string;
+    apiBaseUrl: string;
+    assetBaseUrl: string; // 后端地址，assets 中的 URL 相对于它
+    features: { stream: boolean; conversationMemory: boolean };
+    assets: { [path: string]: string }; // 静态文件路径 -> 带版本的 URL（内容变化后版本随之变化）
+}
+
+// 启动配置同样只请求一次；后端不可用时为 null，各调用方回退到原来的默认值
+let bootstrapConfigPromise: Promise<BootstrapConfig | null> | null = null;
+
+export function getBootstrapConfig(): Promise<BootstrapConfig | null> {
+    if (!bootstrapConfigPromise) {
+        bootstrapConfigPromise = getServerIP()
+            .then((serverIP) => fetch(`http://${serverIP}:5000/api/config`))
+            .then((response) => {
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                return response.json() as Promise<BootstrapConfig>;
+            })
+            .catch((error) => {
+                console.error('获取启动配置失败:', error);
+                bootstrapConfigPromise = null; // 失败时不记住结果，下次调用重新请求
+                return null;
+            });
     }
+    return bootstrapConfigPromise;
 }
 
 // 获取API基础URL
-async function getApiBaseUrl(): Promise<string> {
+export async function getApiBaseUrl(): Promise<string> {
+    const config = await getBootstrapConfig();
+    if (config) {
+        return config.apiBaseUrl;
+    }
     const serverIP = await getServerIP();
     return `http://${serverIP}:5000/api`;
 }
 
+// 静态文件（如 dist/tasksteps.json）在后端的带版本 URL，浏览器可以长期缓存并用 ETag 重新验证；
+// 后端不可用或没有提供该文件时返回原来的相对路径
+export async function getAssetUrl(path: string): Promise<string> {
+    const config = await getBootstrapConfig();
+    const versioned = config?.assets[`/${path}`];
+    return versioned ? `${config.assetBaseUrl}${versioned}` : path;
+}
+
 class AuthService {
     private currentUser: UserInfo | null = null;
     private token: string | null = null;
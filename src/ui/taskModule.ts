@@ -4,6 +4,7 @@ import { Layer } from "./shapes/layer";
 
 import { Draggable } from "./shapes/draggable";
 import { Activation,} from "./shapes/activation";
+import { getAssetUrl } from "./auth/authService";
 // 不再使用进度服务保存历史进度，只显示当前会话的进度
 
 // taskModule.ts
@@ -41,7 +42,7 @@ export async function switchTask(taskType: string): Promise<void> {
     CurrentTask = taskType; 
     taskDisplay.textContent = "当前任务: " + (taskMapping[taskType as keyof typeof taskMapping] || "未知任务");
     try {
-        const response = await fetch('dist/tasksteps.json');
+        const response = await fetch(await getAssetUrl('dist/tasksteps.json'));
         if (!response.ok) throw new Error('无法加载任务步骤数据');
         const taskData = await response.json();
         taskSteps = taskData;
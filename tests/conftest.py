@@ -0,0 +1,54 @@
+"""
+后端单元测试的公共配置：src/model 下的模块按顶层模块导入（与 GLM.py、wsgi.py 的运行方式一致）
+运行：python -m pytest -q
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'model'))
+
+import pytest
+
+import database
+
+@pytest.fixture(scope='session', autouse=True)
+def default_db_path(tmp_path_factory):
+    # 没有使用 db_path 的测试和测试结束后的后台线程也不会写入项目目录下的 data/bbvdle.db
+    database.DB_PATH = str(tmp_path_factory.mktemp('db') / 'default.db')
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """每个测试使用独立的临时数据库"""
+    path = str(tmp_path / 'bbvdle.db')
+    monkeypatch.setattr(database, 'DB_PATH', path)
+    yield path
+    database.close_pool()
+
+ADMIN_TOKEN = 'test-admin-token'
+
+@pytest.fixture
+def make_client(db_path, monkeypatch):
+    """创建使用临时数据库的 Flask 测试客户端，config 覆盖默认配置；测试结束时停止后台线程"""
+    import auth_utils
+    import GLM
+    from revocation import revocation_list
+    from session_cache import session_cache
+    from similar_questions import similar_index
+    from write_behind import write_behind
+
+    # 测试中使用最低的 bcrypt 成本因子，不做校准
+    monkeypatch.setattr(auth_utils, 'BCRYPT_ROUNDS', '4')
+    monkeypatch.setattr(auth_utils, '_bcrypt_rounds', 4)
+    revocation_list.replace([], [])
+    session_cache.clear()
+
+    def make(**config):
+        app = GLM.create_app({'DB_PATH': db_path, 'ADMIN_TOKEN': ADMIN_TOKEN, 'LLM_PROVIDER': 'fake',
+                              'RATE_LIMIT_ENABLED': False, 'SESSION_REAP_INTERVAL': 0, **config})
+        return app.test_client()
+
+    yield make
+    similar_index.stop(timeout=5)
+    write_behind.stop()
+    revocation_list.replace([], [])
+    session_cache.clear()
@@ -0,0 +1,42 @@
+from conftest import ADMIN_TOKEN
+
+ADMIN = {'X-Admin-Token': ADMIN_TOKEN}
+
+def register(client, username='alice'):
+    response = client.post('/api/auth/register', json={
+        "username": username, "email": f"{username}@example.com", "password": "secret123"})
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
+
+def verify(client, token):
+    return client.get('/api/auth/verify', headers={'Authorization': f'Bearer {token}'})
+
+def test_deactivate_user_invalidates_cached_session(make_client):
+    client = make_client()
+    user = register(client)
+    assert verify(client, user['token']).status_code == 200  # 会话已进入进程内缓存
+
+    response = client.patch(f"/api/admin/users/{user['user_id']}", json={"active": False}, headers=ADMIN)
+    assert response.status_code == 200
+    assert verify(client, user['token']).status_code == 401
+    login = client.post('/api/auth/login', json={"username": "alice", "password": "secret123"})
+    assert login.status_code in (401, 403)
+
+    client.patch(f"/api/admin/users/{user['user_id']}", json={"active": True}, headers=ADMIN)
+    login = client.post('/api/auth/login', json={"username": "alice", "password": "secret123"})
+    assert login.status_code == 200
+
+def test_admin_user_endpoint_validation(make_client):
+    client = make_client()
+    user = register(client)
+    assert client.patch(f"/api/admin/users/{user['user_id']}", json={"active": False}).status_code == 401
+    assert client.patch(f"/api/admin/users/{user['user_id']}", json={"active": "no"},
+                        headers=ADMIN).status_code == 400
+    assert client.patch("/api/admin/users/9999", json={"active": False}, headers=ADMIN).status_code == 404
+
+def test_cors_preflight_allows_patch(make_client):
+    client = make_client()
+    response = client.options('/api/admin/users/1', headers={
+        'Origin': 'http://localhost:8080', 'Access-Control-Request-Method': 'PATCH',
+        'Access-Control-Request-Headers': 'X-Admin-Token, Content-Type'})
+    assert 'PATCH' in response.headers['Access-Control-Allow-Methods']
@@ -0,0 +1,19 @@
+import auth_utils
+
+def test_calibration_never_goes_below_default_rounds(monkeypatch):
+    monkeypatch.setattr(auth_utils, 'BCRYPT_ROUNDS', None)
+    monkeypatch.setattr(auth_utils, '_bcrypt_rounds', auth_utils._bcrypt_rounds)
+    # 目标耗时极短（相当于很慢的机器）时也不降低成本因子
+    assert auth_utils.calibrate_bcrypt_rounds(target_ms=0.001) == auth_utils.BCRYPT_DEFAULT_ROUNDS == 12
+    assert auth_utils.get_bcrypt_rounds() == 12
+
+def test_lower_floor_is_explicit_opt_in(monkeypatch):
+    monkeypatch.setattr(auth_utils, 'BCRYPT_ROUNDS', None)
+    monkeypatch.setattr(auth_utils, 'BCRYPT_MIN_ROUNDS', 10)
+    monkeypatch.setattr(auth_utils, '_bcrypt_rounds', auth_utils._bcrypt_rounds)
+    assert auth_utils.calibrate_bcrypt_rounds(target_ms=0.001) == 10
+
+def test_calibration_can_raise_rounds(monkeypatch):
+    monkeypatch.setattr(auth_utils, 'BCRYPT_ROUNDS', None)
+    monkeypatch.setattr(auth_utils, '_bcrypt_rounds', auth_utils._bcrypt_rounds)
+    assert auth_utils.calibrate_bcrypt_rounds(target_ms=10 ** 9) == auth_utils.BCRYPT_MAX_ROUNDS
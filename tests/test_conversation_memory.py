@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+import conversation_memory
+import database
+from conversation_memory import load_conversation, record_turn
+
+@pytest.fixture(autouse=True)
+def db(db_path):
+    database.init_database()
+
+def test_record_turn_appends(monkeypatch):
+    record_turn('1:a', '什么是卷积层', '卷积层用卷积核提取局部特征。')
+    conversation = record_turn('1:a', '池化层呢', '池化层对特征图降采样。')
+    assert conversation.turns == [('什么是卷积层', '卷积层用卷积核提取局部特征。'), ('池化层呢', '池化层对特征图降采样。')]
+    assert load_conversation('1:a').turns == conversation.turns
+    assert load_conversation('1:b').turns == []
+
+def test_old_turns_fold_into_summary(monkeypatch):
+    monkeypatch.setattr(conversation_memory, 'CONVERSATION_HISTORY_TOKENS', 1)
+    record_turn('1:a', '什么是卷积层', '卷积层用卷积核提取局部特征。它的参数是共享的。')
+    conversation = record_turn('1:a', '池化层呢', '池化层对特征图降采样。')
+    assert conversation.turns == [('池化层呢', '池化层对特征图降采样。')]
+    assert conversation.summary == ['问：什么是卷积层；答：卷积层用卷积核提取局部特征。']
+
+def test_concurrent_turns_are_not_lost(monkeypatch):
+    monkeypatch.setattr(conversation_memory, 'CONVERSATION_HISTORY_TOKENS', 100000)
+    estimate_tokens = conversation_memory.estimate_tokens
+
+    def slow_estimate(text):
+        # 放大读取与写回之间的时间窗口
+        time.sleep(0.001)
+        return estimate_tokens(text)
+    monkeypatch.setattr(conversation_memory, 'estimate_tokens', slow_estimate)
+    threads, per_thread = 8, 5
+    barrier = threading.Barrier(threads)
+
+    def worker(n):
+        barrier.wait()
+        for i in range(per_thread):
+            record_turn('1:a', f'问题{n}-{i}', f'回答{n}-{i}')
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    turns = load_conversation('1:a').turns
+    assert len(turns) == threads * per_thread
+    assert {question for question, _ in turns} == {f'问题{n}-{i}' for n in range(threads) for i in range(per_thread)}
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from llm_async import AsyncLLMGateway
+from llm_gateway import CircuitBreaker, LLMResult
+
+MESSAGES = [{"role": "user", "content": "用户问题: 什么是卷积层"}]
+
+class ScriptedAsyncProvider:
+    """按顺序返回结果、抛出异常或一直等待（'hang'）的异步提供方"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+
+    async def complete(self, messages, timeout, **params):
+        outcome = self.outcomes.pop(0)
+        if outcome == 'hang':
+            await asyncio.sleep(3600)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return LLMResult(outcome, 'fake', 1, 1)
+
+def _open_breaker():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    return breaker
+
+def test_non_transient_probe_error_releases_probe():
+    async def scenario():
+        breaker = _open_breaker()
+        gateway = AsyncLLMGateway(ScriptedAsyncProvider(ValueError("401"), "ok"), max_retries=0, breaker=breaker)
+        with pytest.raises(ValueError):
+            await gateway.complete(MESSAGES)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert (await gateway.complete(MESSAGES)).content == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+    asyncio.run(scenario())
+
+def test_cancelled_probe_releases_probe():
+    async def scenario():
+        breaker = _open_breaker()
+        gateway = AsyncLLMGateway(ScriptedAsyncProvider('hang', "ok"), max_retries=0, breaker=breaker)
+        task = asyncio.ensure_future(gateway.complete(MESSAGES))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert (await gateway.complete(MESSAGES)).content == "ok"
+    asyncio.run(scenario())
@@ -0,0 +1,72 @@
+import pytest
+
+from llm_gateway import (
+    CircuitBreaker, CircuitOpenError, LLMGateway, LLMResult, TransientLLMError
+)
+
+MESSAGES = [{"role": "user", "content": "用户问题: 什么是卷积层"}]
+
+class ScriptedProvider:
+    """按顺序返回结果或抛出异常的提供方"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def complete(self, messages, timeout, **params):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return LLMResult(outcome, 'fake', 1, 1)
+
+def _open_breaker():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.allow() is False
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+def test_half_open_allows_single_probe():
+    breaker = _open_breaker()
+    assert breaker.allow() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_non_transient_probe_error_releases_probe():
+    breaker = _open_breaker()
+    gateway = LLMGateway(ScriptedProvider(ValueError("400 content filter"), "ok"), max_retries=0,
+                         breaker=breaker)
+    with pytest.raises(ValueError):
+        gateway.complete(MESSAGES)
+    # 试探请求没有得出结论：仍为半开状态，下一个请求可以重新试探
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert gateway.complete(MESSAGES).content == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_interrupted_probe_releases_probe():
+    breaker = _open_breaker()
+    gateway = LLMGateway(ScriptedProvider(KeyboardInterrupt(), "ok"), max_retries=0, breaker=breaker)
+    with pytest.raises(KeyboardInterrupt):
+        gateway.complete(MESSAGES)
+    assert gateway.complete(MESSAGES).content == "ok"
+
+def test_transient_probe_error_reopens_breaker():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    breaker.opened_at -= 60
+    gateway = LLMGateway(ScriptedProvider(TransientLLMError("503")), max_retries=0, breaker=breaker)
+    with pytest.raises(TransientLLMError):
+        gateway.complete(MESSAGES)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        gateway.complete(MESSAGES)
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+import database
+from migrations import MIGRATIONS, get_version, latest_version, migrate
+
+def _tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+def test_versions_are_contiguous():
+    assert [version for version, _description, _fn in MIGRATIONS] == list(range(1, latest_version() + 1))
+
+def test_migrate_empty_database_to_latest(db_path):
+    with database.db_connection() as conn:
+        assert get_version(conn) == 0
+        assert migrate(conn) == list(range(1, latest_version() + 1))
+        assert get_version(conn) == latest_version() == 9
+        assert {'users', 'user_sessions', 'revoked_tokens', 'revoked_users', 'ai_prewarmed_answers',
+                'ai_similar_questions', 'ai_conversations'} <= _tables(conn)
+        # 已是最新版本时不再执行
+        assert migrate(conn) == []
+
+def test_migrate_legacy_database(db_path):
+    # 旧版本 init_database() 创建的数据库：只有用户表和会话表，版本号为 0
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_login DATETIME,
+            is_active BOOLEAN DEFAULT 1
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE user_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token VARCHAR(500) UNIQUE NOT NULL,
+            expires_at DATETIME NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('alice', 'Alice@Example.com', 'x')")
+    conn.commit()
+    conn.close()
+
+    database.init_database()
+    with database.db_connection() as conn:
+        assert get_version(conn) == latest_version()
+        assert conn.execute('SELECT email FROM users').fetchone()[0] == 'alice@example.com'
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'idx_user_sessions_user_id', 'idx_users_email_nocase', 'idx_ai_conversations_updated_at'} <= indexes
+
+def test_case_insensitive_duplicate_emails_abort_migration(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT UNIQUE, email TEXT UNIQUE, '
+                 'password_hash TEXT, created_at DATETIME, last_login DATETIME, is_active BOOLEAN DEFAULT 1)')
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('a', 'x@example.com', 'x')")
+    conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('b', 'X@example.com', 'x')")
+    conn.commit()
+    conn.close()
+
+    with database.db_connection() as conn:
+        with pytest.raises(RuntimeError):
+            migrate(conn)
+        # 失败的迁移已回滚，之前的迁移保留
+        assert get_version(conn) == 2
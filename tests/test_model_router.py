@@ -0,0 +1,90 @@
+import pytest
+
+import model_router
+from model_router import ModelRouter, create_model_router
+
+TIERS = {"primary": "glm-4", "fast": "glm-4-flash"}
+LONG_QUESTION = "请解释一下卷积层的卷积核大小和步长分别对输出尺寸有什么影响"
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_router.time, 'monotonic', clock)
+    return clock
+
+def make_router(**kwargs):
+    kwargs.setdefault('fallback_p95', 5.0)
+    kwargs.setdefault('window', 60.0)
+    kwargs.setdefault('min_samples', 5)
+    return ModelRouter(tiers=TIERS, **kwargs)
+
+def record_primary(router, seconds, count):
+    decision = router.route(LONG_QUESTION, allow_fallback=False)
+    for _ in range(count):
+        router.record(decision, seconds)
+
+def test_classify_routes():
+    router = make_router()
+    assert router.classify("这是什么") == 'short'
+    assert router.classify("这是什么", selected_layer={'type': 'conv2d'}) == 'layer'
+    assert router.classify(LONG_QUESTION) == 'default'
+    assert router.classify(LONG_QUESTION, full_prompt='x' * (model_router.LONG_PROMPT_CHARS + 1)) == 'long'
+    assert router.classify("", education_context={'text': '卷积', 'mode': 'quiz'}) == 'quiz'
+    assert router.classify("", education_context={'text': '卷积', 'mode': 'other'}) == 'education'
+
+def test_falls_back_when_primary_p95_exceeds_budget(clock):
+    router = make_router()
+    record_primary(router, 1.0, 4)
+    assert router.route(LONG_QUESTION).model == 'glm-4'   # 样本不足时不降级
+
+    record_primary(router, 9.0, 4)
+    decision = router.route(LONG_QUESTION)
+    assert router.p95('glm-4') == 9.0
+    assert decision.fallback and decision.model == 'glm-4-flash'
+    assert decision.primary_model == 'glm-4'
+    assert decision.params['model'] == 'glm-4-flash'
+    assert decision.cache_params == model_router.model_params('glm-4', decision.max_tokens)
+    assert router.stats()['fallbacks'] == 1
+
+def test_fallback_is_skipped_when_disallowed_or_fast_tier(clock):
+    router = make_router()
+    record_primary(router, 9.0, 10)
+    offline = router.route(LONG_QUESTION, allow_fallback=False)
+    assert offline.model == 'glm-4' and not offline.fallback
+    short = router.route("这是什么")
+    assert short.model == 'glm-4-flash' and not short.fallback
+    assert router.stats()['fallbacks'] == 0
+
+def test_within_budget_keeps_primary(clock):
+    router = make_router()
+    record_primary(router, 4.0, 10)
+    assert router.route(LONG_QUESTION).model == 'glm-4'
+
+def test_recovers_after_slow_samples_expire(clock):
+    router = make_router()
+    record_primary(router, 9.0, 10)
+    assert router.route(LONG_QUESTION).fallback
+
+    clock.now += 61
+    assert router.p95('glm-4') is None
+    decision = router.route(LONG_QUESTION)
+    assert decision.model == 'glm-4' and not decision.fallback
+
+def test_zero_budget_disables_fallback(clock):
+    router = make_router(fallback_p95=0)
+    record_primary(router, 60.0, 10)
+    assert not router.route(LONG_QUESTION).fallback
+
+def test_create_model_router_overrides():
+    router = create_model_router('{"layer": {"tier": "primary"}, "quiz": {"max_tokens": 500}}')
+    assert router.routes['layer']['tier'] == 'primary'
+    assert router.routes['quiz'] == {"tier": "primary", "max_tokens": 500}
+    with pytest.raises(ValueError):
+        create_model_router('{"short": {"tier": "unknown"}}')
@@ -0,0 +1,39 @@
+import sqlite3
+from types import SimpleNamespace
+
+import database
+import prewarm
+from llm_gateway import LLMError
+
+class ScriptedGateway:
+    """按提示词返回结果或抛出异常"""
+
+    def __init__(self, errors):
+        self.errors = errors
+
+    def complete(self, messages, **params):
+        prompt = messages[-1]['content']
+        for marker, error in self.errors.items():
+            if marker in prompt:
+                raise error
+        return SimpleNamespace(content=f"回答：{prompt}")
+
+def job(name):
+    return {"cache_key": f"key-{name}", "prompt": f"问题 {name}", "params": {"model": "glm-4-flash"},
+            "source": f"test:{name}"}
+
+def test_prewarm_counts_failures_per_question(db_path, monkeypatch):
+    database.init_database()
+    save = database.save_prewarmed_answer
+
+    def flaky_save(cache_key, *args):
+        if cache_key == 'key-locked':
+            raise sqlite3.OperationalError("database is locked")
+        return save(cache_key, *args)
+    monkeypatch.setattr(database, 'save_prewarmed_answer', flaky_save)
+
+    gateway = ScriptedGateway({"timeout": LLMError("超时"), "bad": ValueError("unmapped 400")})
+    jobs = [job(name) for name in ('ok-1', 'timeout', 'bad', 'locked', 'ok-2')]
+    counts = prewarm.prewarm(jobs, gateway, concurrency=2)
+    assert counts == {"generated": 2, "failed": 3}
+    assert database.get_prewarmed_keys() == {'key-ok-1', 'key-ok-2'}
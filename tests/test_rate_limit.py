@@ -0,0 +1,70 @@
+import json
+import threading
+
+import pytest
+
+import rate_limit
+from config import load_config
+from rate_limit import MemoryStore, RateLimitedError, RateLimiter, SQLiteStore
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    return request.param, str(tmp_path / 'ratelimit.db')
+
+def make_store(backend):
+    name, path = backend
+    return MemoryStore() if name == 'memory' else SQLiteStore(path)
+
+def test_token_bucket(backend):
+    limiter = RateLimiter(make_store(backend), {"reply": {"user": "2/min", "ip": "100/min"}})
+    limiter.check('reply', {"user": "1", "ip": "10.0.0.1"})
+    limiter.check('reply', {"user": "1", "ip": "10.0.0.1"})
+    with pytest.raises(RateLimitedError) as excinfo:
+        limiter.check('reply', {"user": "1", "ip": "10.0.0.1"})
+    # 每 30 秒恢复一个令牌
+    assert 29 <= excinfo.value.retry_after <= 30
+    # 其它用户不受影响
+    limiter.check('reply', {"user": "2", "ip": "10.0.0.1"})
+
+def test_rejected_request_does_not_consume(backend):
+    limiter = RateLimiter(make_store(backend), {"reply": {"user": "1/min", "ip": "1/min"}})
+    limiter.check('reply', {"user": "1", "ip": "a"})
+    with pytest.raises(RateLimitedError):
+        limiter.check('reply', {"user": "2", "ip": "a"})
+    # 被拒绝的请求没有扣除 user 2 的令牌
+    limiter.check('reply', {"user": "2", "ip": "b"})
+
+def test_login_returns_429_with_retry_after(make_client, backend):
+    name, path = backend
+    client = make_client(RATE_LIMIT_ENABLED=True, RATE_LIMIT_BACKEND=name, RATE_LIMIT_DB=path,
+                         RATE_LIMITS=json.dumps({"login": {"ip": "2/min"}}))
+    credentials = {"username": "alice", "password": "wrong-password"}
+    for _ in range(2):
+        assert client.post('/api/auth/login', json=credentials).status_code == 401
+    response = client.post('/api/auth/login', json=credentials)
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 30
+
+def test_sqlite_prune_cadence_is_thread_safe(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limit, '_PRUNE_EVERY', 10)
+    store = SQLiteStore(str(tmp_path / 'ratelimit.db'))
+    pruned = []
+    monkeypatch.setattr(store, 'prune', lambda: pruned.append(1))
+    limiter = RateLimiter(store, {"reply": {"user": "1000/min"}})
+
+    def worker(n):
+        for _ in range(50):
+            limiter.check('reply', {"user": str(n)})
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(pruned) == 8 * 50 // 10
+
+@pytest.mark.parametrize('workers, expected', [('1', 'memory'), ('4', 'sqlite')])
+def test_default_backend_follows_worker_count(monkeypatch, workers, expected):
+    monkeypatch.delenv('BBVDLE_RATE_LIMIT_BACKEND', raising=False)
+    monkeypatch.setenv('BBVDLE_WORKERS', workers)
+    assert load_config()['RATE_LIMIT_BACKEND'] == expected
@@ -0,0 +1,67 @@
+import pytest
+
+import database
+import repository
+from repository import UnitOfWork
+
+@pytest.fixture
+def db(db_path):
+    database.init_database()
+
+def usernames():
+    with database.db_connection() as conn:
+        return {row[0] for row in conn.execute('SELECT username FROM users')}
+
+def test_commit_persists(db):
+    uow = UnitOfWork()
+    uow.users.create('alice', 'alice@example.com', 'hash')
+    uow.commit()
+    assert usernames() == {'alice'}
+
+def test_rollback_discards_writes_and_returns_connection(db):
+    pool = database.get_pool()
+    uow = UnitOfWork()
+    uow.users.create('alice', 'alice@example.com', 'hash')
+    idle = pool._idle.qsize()
+    uow.rollback()
+    assert pool._idle.qsize() == idle + 1
+    assert usernames() == set()
+
+def test_exception_in_context_rolls_back(db):
+    with pytest.raises(RuntimeError):
+        with UnitOfWork() as uow:
+            uow.users.create('alice', 'alice@example.com', 'hash')
+            raise RuntimeError("boom")
+    assert usernames() == set()
+
+@pytest.mark.parametrize('username, email, error', [
+    ('alice', 'other@example.com', "用户名已存在"),
+    ('bob', 'alice@example.com', "邮箱已被注册"),
+    ('bob', 'ALICE@example.com', "邮箱已被注册"),
+])
+def test_duplicate_returns_400(make_client, username, email, error):
+    client = make_client()
+    assert client.post('/api/auth/register', json={
+        "username": "alice", "email": "alice@example.com", "password": "secret123"}).status_code == 201
+    response = client.post('/api/auth/register', json={
+        "username": username, "email": email, "password": "secret123"})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == error
+
+def test_failed_session_insert_rolls_back_user(make_client, monkeypatch):
+    client = make_client()
+
+    def fail(self, *args):
+        raise RuntimeError("disk I/O error")
+    monkeypatch.setattr(repository.SessionRepository, 'add', fail)
+    response = client.post('/api/auth/register', json={
+        "username": "alice", "email": "alice@example.com", "password": "secret123"})
+    assert response.status_code == 500
+    assert usernames() == set()
+
+def test_duplicate_email_differing_in_case(db):
+    with UnitOfWork() as uow:
+        uow.users.create('alice', 'alice@example.com', 'hash')
+    with pytest.raises(ValueError, match="邮箱已被注册"):
+        with UnitOfWork() as uow:
+            uow.users.create('bob', 'ALICE@example.com', 'hash')
@@ -0,0 +1,51 @@
+import pytest
+
+import database
+import response_cache
+from response_cache import ResponseCache, make_cache_key
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, 'time', clock.time)
+    return clock
+
+def test_lru_eviction(clock):
+    cache = ResponseCache(max_entries=2, ttl=60, persist=False)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'  # a 变为最近使用
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('A', 'C')
+    assert cache.stats()['evictions'] == 1
+
+def test_ttl_expiry(clock):
+    cache = ResponseCache(max_entries=10, ttl=60, persist=False)
+    cache.set('a', 'A')
+    clock.now += 59
+    assert cache.get('a') == 'A'
+    clock.now += 1
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+def test_persisted_entries_survive_restart_until_expiry(db_path, clock):
+    database.init_database()
+    ResponseCache(ttl=60, persist=True).set('a', 'A')
+    restarted = ResponseCache(ttl=60, persist=True)
+    assert restarted.get('a') == 'A'
+    clock.now += 60
+    assert ResponseCache(ttl=60, persist=True).get('a') is None
+
+def test_cache_key_ignores_whitespace_but_not_params():
+    params = {"model": "glm-4", "max_tokens": 512}
+    assert make_cache_key("什么是 卷积层\n", params) == make_cache_key("什么是  卷积层", params)
+    assert make_cache_key("什么是 卷积层", params) != make_cache_key("什么是 卷积层", {**params, "model": "glm-4-flash"})
@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+
+import auth_utils
+import GLM
+import roster_import
+from conftest import ADMIN_TOKEN
+
+def roster(count):
+    lines = ['username,email,password'] + [f'student{i},student{i}@example.com,secret123' for i in range(count)]
+    return '\n'.join(lines)
+
+def test_bulk_hashing_is_bounded_by_bcrypt_workers(monkeypatch):
+    monkeypatch.setattr(auth_utils, 'BCRYPT_WORKERS', 2)
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def slow_hash(password, rounds):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return 'hash'
+    monkeypatch.setattr(auth_utils, '_hashpw', slow_hash)
+    assert auth_utils.hash_passwords(['secret123'] * 8) == ['hash'] * 8
+    assert peak[0] == 2
+    peak[0] = 0
+    auth_utils.hash_passwords(['secret123'] * 8, workers=4)
+    assert peak[0] == 4
+
+def capture_workers(monkeypatch):
+    workers = []
+
+    def fake_hash_passwords(passwords, count=None, rounds=None):
+        workers.append(count)
+        return [f'hash-{password}' for password in passwords]
+    monkeypatch.setattr(roster_import, 'hash_passwords', fake_hash_passwords)
+    return workers
+
+def test_cli_uses_all_cores(db_path, tmp_path, monkeypatch):
+    workers = capture_workers(monkeypatch)
+    monkeypatch.setattr(roster_import, 'calibrate_bcrypt_rounds', lambda: 12)
+    path = tmp_path / 'roster.csv'
+    path.write_text(roster(3), encoding='utf-8')
+    assert roster_import.main([str(path), '--db', str(db_path)]) == 0
+    assert workers == [os.cpu_count() or 1]
+
+def test_request_import_uses_bcrypt_worker_count(make_client, monkeypatch):
+    workers = capture_workers(monkeypatch)
+    client = make_client()
+    response = client.post('/api/admin/roster/import', data=roster(2),
+                           headers={'X-Admin-Token': ADMIN_TOKEN, 'Content-Type': 'text/csv'})
+    assert response.status_code == 200
+    assert workers == [roster_import.ROSTER_HASH_WORKERS]
+
+def test_request_import_limit(make_client, monkeypatch):
+    monkeypatch.setattr(GLM, 'ROSTER_REQUEST_MAX_ROWS', 2)
+    client = make_client()
+    headers = {'X-Admin-Token': ADMIN_TOKEN, 'Content-Type': 'text/csv'}
+
+    response = client.post('/api/admin/roster/import', data=roster(3), headers=headers)
+    assert response.status_code == 413
+    # 只校验时不计算哈希，不受请求行数限制
+    response = client.post('/api/admin/roster/import?dry_run=1', data=roster(3), headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['created'] == 0
+
+    response = client.post('/api/admin/roster/import', data=roster(2), headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['created'] == 2
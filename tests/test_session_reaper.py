@@ -0,0 +1,89 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+import session_reaper
+from session_reaper import SessionReaper
+
+@pytest.fixture
+def user_id(db_path):
+    database.init_database()
+    with database.db_connection() as conn:
+        cursor = conn.execute("INSERT INTO users (username, email, password_hash) VALUES ('alice', 'a@example.com', 'x')")
+        conn.commit()
+        return cursor.lastrowid
+
+def add_sessions(user_id, count, expires_at, prefix):
+    for i in range(count):
+        database.save_session(user_id, f'{prefix}-{i}', expires_at)
+
+def session_tokens():
+    with database.db_connection() as conn:
+        return {row[0] for row in conn.execute('SELECT token FROM user_sessions')}
+
+def test_run_once_deletes_expired_sessions_in_batches(user_id):
+    # 几分钟前过期的会话（同一天内）也要被删除
+    add_sessions(user_id, 5, datetime.utcnow() - timedelta(minutes=5), 'expired')
+    add_sessions(user_id, 2, datetime.utcnow() + timedelta(hours=1), 'valid')
+    statements = []
+    conn = database.get_pool().acquire()
+    conn.set_trace_callback(statements.append)
+    database.get_pool().release(conn)  # 连接池后进先出，清理时复用这个连接
+
+    assert SessionReaper(batch_size=2).run_once() == 5
+    conn.set_trace_callback(None)
+    assert session_tokens() == {'valid-0', 'valid-1'}
+    # 2 + 2 + 1，最后一批不满时停止
+    assert sum(1 for sql in statements if 'DELETE FROM user_sessions' in sql) == 3
+
+def test_expired_session_is_not_valid(user_id):
+    add_sessions(user_id, 1, datetime.utcnow() - timedelta(minutes=5), 'expired')
+    assert database.get_session_by_token('expired-0') is None
+
+def test_migration_normalizes_stored_expiry(user_id):
+    expired = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+    with database.db_connection() as conn:
+        conn.execute("INSERT INTO user_sessions (user_id, token, expires_at) VALUES (?, 'legacy', ?)",
+                     (user_id, expired))
+        conn.commit()
+    from migrations import _session_expiry_format
+    with database.db_connection() as conn:
+        _session_expiry_format(conn)
+        conn.commit()
+    assert SessionReaper().run_once() == 1
+
+def test_stop_interrupts_the_wait(monkeypatch):
+    calls = threading.Event()
+    reaper = SessionReaper(interval=3600)
+    monkeypatch.setattr(reaper, 'run_once', lambda: calls.set() or 0)
+    reaper.start()
+    assert calls.wait(2)
+    started = time.perf_counter()
+    reaper.stop(timeout=2)
+    assert not reaper._thread.is_alive()
+    assert time.perf_counter() - started < 1
+
+def test_errors_do_not_stop_the_loop(monkeypatch):
+    results = iter([RuntimeError("database is locked")])
+    done = threading.Event()
+
+    def run_once():
+        error = next(results, None)
+        if error is not None:
+            raise error
+        done.set()
+        return 0
+
+    reaper = SessionReaper(interval=0.01)
+    monkeypatch.setattr(reaper, 'run_once', run_once)
+    reaper.start()
+    try:
+        assert done.wait(2)
+    finally:
+        reaper.stop(timeout=2)
+
+def test_disabled_when_interval_is_zero():
+    assert session_reaper.start_session_reaper(interval=0) is None
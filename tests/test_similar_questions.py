@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+import pytest
+
+import database
+import similar_questions
+from migrations import migrate
+from similar_questions import SimilarQuestionIndex, minhash, normalize_question, split_question
+
+CONTEXT = similar_questions.context_key(model='glm-4')
+
+def _similarity(a: str, b: str) -> float:
+    return float(np.mean(minhash(normalize_question(a)) == minhash(normalize_question(b))))
+
+def _no_database():
+    raise AssertionError("请求路径上不应查询数据库")
+
+@pytest.fixture(autouse=True)
+def no_write_behind(monkeypatch):
+    # 命中次数和自动加入的问答不写入延迟队列（测试结束后临时数据库已删除）
+    monkeypatch.setattr(similar_questions.write_behind, 'put', lambda *args: None)
+
+@pytest.fixture
+def index(monkeypatch):
+    # 查询不应访问数据库（由后台线程刷新）
+    monkeypatch.setattr(database, 'get_similar_questions_version', _no_database)
+    return SimilarQuestionIndex(threshold=0.6, reload_interval=3600)
+
+@pytest.mark.parametrize('question, expected', [
+    ('什么是Dropout', 'what|dropout'),
+    ('Dropout是什么？', 'what|dropout'),
+    ('为什么设置学习率', 'why|设置学习率'),
+    ('如何设置学习率', 'how|设置学习率'),
+    ('请问卷积层的作用是什么呢', 'what|卷积层的作用'),
+    ('卷积层', '|卷积层'),
+])
+def test_normalize_keeps_question_type(question, expected):
+    assert normalize_question(question) == expected
+
+@pytest.mark.parametrize('first, second', [
+    ('如何设置学习率', '为什么设置学习率'),
+    ('什么是池化层', '池化层怎么用'),
+    ('为什么要用Dropout', 'Dropout是什么'),
+    ('怎么选择卷积核大小', '为什么选择卷积核大小'),
+])
+def test_different_question_types_do_not_match(index, first, second):
+    index.remember(first, CONTEXT, "回答：" + first)
+    assert index.lookup(second, CONTEXT) is None
+
+@pytest.mark.parametrize('first, second', [
+    ('什么是Dropout', 'Dropout是什么？'),
+    ('学习率如何设置', '请问学习率怎么设置呢？'),
+])
+def test_paraphrases_match(index, first, second):
+    index.remember(first, CONTEXT, "已有回答")
+    assert index.lookup(second, CONTEXT) == "已有回答"
+
+def test_unrelated_questions_below_threshold():
+    assert _similarity('什么是池化层', '什么是学习率') < 0.6
+
+def test_contexts_are_isolated(index):
+    other = similar_questions.context_key({"layerType": "conv2D", "params": {}}, model='glm-4')
+    index.remember('什么是Dropout', CONTEXT, "已有回答")
+    assert index.lookup('Dropout是什么', other) is None
+
+def test_migration_renormalizes_existing_rows(db_path):
+    with database.db_connection() as conn:
+        migrate(conn)
+        conn.execute('PRAGMA user_version = 7')
+        conn.executemany('''
+            INSERT INTO ai_similar_questions (context_key, question, question_norm, answer, source, enabled, hits,
+                                              created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, 1, 0, 0, 0)
+        ''', [(CONTEXT, '如何设置学习率', '设置学习率', 'a', 'curated'),
+              (CONTEXT, '为什么要有池化层', '为要有池化层', 'b', 'auto')])
+        conn.commit()
+        assert migrate(conn) == [8, 9]
+        norms = {row[0] for row in conn.execute('SELECT question_norm FROM ai_similar_questions')}
+    assert norms == {'how|设置学习率', 'why|要有池化层'}
+    assert split_question('how|设置学习率') == ('how', '设置学习率')
+
+def test_refresh_loads_new_rows(db_path):
+    database.init_database()
+    index = SimilarQuestionIndex(threshold=0.6)
+    index.refresh()
+    assert index.lookup('什么是过拟合', CONTEXT) is None
+    database.save_similar_question(CONTEXT, '什么是过拟合', normalize_question('什么是过拟合'), '整理过的回答')
+    index.refresh()
+    assert index.lookup('过拟合是什么？', CONTEXT) == '整理过的回答'
+
+def test_background_refresher(db_path):
+    database.init_database()
+    database.save_similar_question(CONTEXT, '什么是过拟合', normalize_question('什么是过拟合'), '整理过的回答')
+    index = SimilarQuestionIndex(threshold=0.6, reload_interval=3600)
+    index.start()
+    try:
+        for _ in range(100):
+            if index.stats()['entries']:
+                break
+            time.sleep(0.01)
+        assert index.lookup('过拟合是什么', CONTEXT) == '整理过的回答'
+    finally:
+        index.stop(timeout=1)
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+def run_followers(flight, key, leader_fn, followers=4):
+    """leader 开始执行后再提交 follower，返回所有调用的结果或异常"""
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def leader():
+        calls.append(1)
+        started.set()
+        assert release.wait(2)
+        return leader_fn()
+
+    def call():
+        try:
+            return flight.do(key, leader)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(followers + 1) as executor:
+        first = executor.submit(call)
+        assert started.wait(2)
+        rest = [executor.submit(call) for _ in range(followers)]
+        # 等所有 follower 都进入等待后再让 leader 返回
+        while flight.stats()['coalesced'] < followers:
+            time.sleep(0.001)
+        release.set()
+        return len(calls), [future.result() for future in [first] + rest]
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight(timeout=5)
+    executions, results = run_followers(flight, 'k', lambda: 'reply')
+    assert executions == 1
+    assert results == ['reply'] * 5
+    assert flight.stats() == {"executions": 1, "coalesced": 4, "timeouts": 0, "errors": 0, "in_flight": 0}
+
+def test_leader_exception_reaches_followers_and_is_not_cached():
+    flight = SingleFlight(timeout=5)
+    error = RuntimeError("upstream failed")
+
+    def fail():
+        raise error
+    executions, results = run_followers(flight, 'k', fail)
+    assert executions == 1
+    assert all(result is error for result in results)
+    assert flight.stats()['errors'] == 1
+    # 错误不被缓存，下一次调用重新执行
+    assert flight.do('k', lambda: 'recovered') == 'recovered'
+
+def test_follower_timeout_does_not_affect_leader():
+    flight = SingleFlight(timeout=0.05)
+    release = threading.Event()
+    with ThreadPoolExecutor(1) as executor:
+        leader = executor.submit(flight.do, 'k', lambda: release.wait(2) and 'reply')
+        while flight.stats()['in_flight'] == 0:
+            time.sleep(0.001)
+        with pytest.raises(FutureTimeoutError):
+            flight.do('k', lambda: 'unused')
+        release.set()
+        assert leader.result() == 'reply'
+    assert flight.stats()['timeouts'] == 1
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    assert [flight.do(key, lambda key=key: key) for key in 'abc'] == ['a', 'b', 'c']
+    assert flight.stats()['coalesced'] == 0
+
+def test_async_coalescing_and_exception():
+    async def scenario():
+        flight = AsyncSingleFlight(timeout=5)
+        calls = []
+
+        async def reply():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'reply'
+        results = await asyncio.gather(*(flight.do('k', reply) for _ in range(5)))
+        assert results == ['reply'] * 5 and len(calls) == 1
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+        results = await asyncio.gather(*(flight.do('k', fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flight.stats()['errors'] == 1 and flight.stats()['in_flight'] == 0
+
+    asyncio.run(scenario())
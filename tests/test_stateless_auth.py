@@ -0,0 +1,72 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import GLM
+from auth_utils import generate_token, verify_token
+from conftest import ADMIN_TOKEN
+from revocation import RevocationList, revocation_list
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+@pytest.fixture
+def client(make_client, monkeypatch):
+    # 无状态模式下验证 token 不应查询会话表
+    def no_session_lookup(token):
+        raise AssertionError("无状态模式不应查询会话表")
+    monkeypatch.setattr(GLM, 'get_session_by_token', no_session_lookup)
+    client = make_client(AUTH_MODE='stateless')
+    response = client.post('/api/auth/register', json={
+        "username": "alice", "email": "alice@example.com", "password": "secret123"})
+    assert response.status_code == 201
+    client.user = response.get_json()
+    return client
+
+def test_logout_revokes_token(client):
+    token = client.user['token']
+    assert client.get('/api/auth/verify', headers=bearer(token)).status_code == 200
+    assert client.post('/api/auth/logout', headers=bearer(token)).status_code == 200
+    response = client.get('/api/auth/verify', headers=bearer(token))
+    assert response.status_code == 401
+    assert response.get_json()['valid'] is False
+
+def test_deactivation_revokes_all_tokens(client):
+    other = client.post('/api/auth/login', json={"username": "alice", "password": "secret123"}).get_json()['token']
+    response = client.patch(f"/api/admin/users/{client.user['user_id']}", json={"active": False},
+                            headers={'X-Admin-Token': ADMIN_TOKEN})
+    assert response.status_code == 200
+    for token in (client.user['token'], other):
+        assert client.get('/api/auth/verify', headers=bearer(token)).status_code == 401
+
+def test_revocations_reload_from_database(client):
+    token = client.user['token']
+    client.post('/api/auth/logout', headers=bearer(token))
+    # 模拟另一个进程：内存中的吊销列表为空，到了重新加载时间后从数据库读取
+    revocation_list.replace([], [])
+    revocation_list._next_reload = 0.0
+    assert client.get('/api/auth/verify', headers=bearer(token)).status_code == 401
+    assert revocation_list.stats()['tokens'] == 1
+
+@pytest.mark.parametrize('remember_me, hours', [(False, 24), (True, 168)])
+def test_token_expiry_matches_session(client, remember_me, hours):
+    response = client.post('/api/auth/login', json={
+        "username": "alice", "password": "secret123", "remember_me": remember_me})
+    payload = verify_token(response.get_json()['token'])
+    assert abs(payload['exp'] - payload['iat'] - hours * 3600) <= 1
+
+def test_expired_session_token_is_rejected(client):
+    token = generate_token(client.user['user_id'], 'alice', 'alice@example.com',
+                           datetime.utcnow() - timedelta(seconds=1))
+    assert client.get('/api/auth/verify', headers=bearer(token)).status_code == 401
+
+def test_user_cutoff_uses_whole_seconds():
+    revocations = RevocationList()
+    far = time.time() + 3600
+    revocations.add_user(1, 100.7, far)
+    assert revocations.is_revoked({'user_id': 1, 'iat': 100})
+    assert not revocations.is_revoked({'user_id': 1, 'iat': 101})
+    revocations.replace([], [(1, 200.2, far)])
+    assert revocations.is_revoked({'user_id': 1, 'iat': 200})
+    assert not revocations.is_revoked({'user_id': 1, 'iat': 201})
@@ -0,0 +1,46 @@
+import pytest
+
+@pytest.fixture
+def client(make_client):
+    return make_client()
+
+def test_config_lists_versioned_assets(client):
+    response = client.get('/api/config', headers={'Origin': 'http://localhost:8080'})
+    assert response.status_code == 200
+    assert response.headers['Access-Control-Allow-Origin']
+    config = response.get_json()
+    assert config['apiBaseUrl'] == 'http://localhost/api'
+    assert config['assetBaseUrl'] == 'http://localhost'
+    assert config['assets']['/dist/tasksteps.json'].startswith('/dist/tasksteps.json?v=')
+    assert '/dist/zhipuai_key.txt' not in config['assets']
+
+    again = client.get('/api/config', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+def test_versioned_asset_is_immutable_and_revalidates(client):
+    url = client.get('/api/config').get_json()['assets']['/dist/tasksteps.json']
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+
+    again = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    assert again.data == b''
+
+def test_unversioned_asset_uses_short_max_age(client):
+    response = client.get('/dist/tasksteps.json?v=stale')
+    assert response.status_code == 200
+    assert 'immutable' not in response.headers['Cache-Control']
+    assert response.get_json()
+
+def test_only_whitelisted_files_are_served(client):
+    assert client.get('/dist/zhipuai_key.txt').status_code == 404
+    assert client.get('/resources/educationimages/missing.png').status_code == 404
+
+def test_assets_allow_cross_origin_fetch(client):
+    # 前端页面与后端不同源时，getAssetUrl 直接从后端获取
+    url = client.get('/api/config').get_json()['assets']['/dist/tasksteps.json']
+    response = client.get(url, headers={'Origin': 'http://localhost:8080'})
+    assert response.headers['Access-Control-Allow-Origin']
+    assert 'ETag' in response.headers['Access-Control-Expose-Headers']
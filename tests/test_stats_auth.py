@@ -0,0 +1,43 @@
+import asyncio
+
+import httpx
+import pytest
+
+from conftest import ADMIN_TOKEN
+
+STATS_ROUTES = ('/api/metrics', '/api/reply/cache/stats', '/api/reply/single-flight/stats',
+                '/api/reply/similar/stats', '/api/reply/router/stats', '/api/reply/gateway/stats')
+ADMIN = {'X-Admin-Token': ADMIN_TOKEN}
+
+@pytest.mark.parametrize('path', STATS_ROUTES)
+def test_stats_require_admin_token(make_client, path):
+    client = make_client()
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={'X-Admin-Token': 'wrong'}).status_code == 401
+    assert client.get(path, headers=ADMIN).status_code == 200
+
+def test_stats_disabled_without_admin_token(make_client):
+    client = make_client(ADMIN_TOKEN=None)
+    assert client.get('/api/metrics').status_code == 403
+
+def test_gateway_stats_do_not_create_gateway(make_client, tmp_path):
+    # 没有 API key 文件时统计接口也不应报错
+    client = make_client(LLM_PROVIDER='zhipuai', ZHIPUAI_API_KEY=None, ZHIPUAI_KEY_FILE=str(tmp_path / 'missing.txt'))
+    response = client.get('/api/reply/gateway/stats', headers=ADMIN)
+    assert response.status_code == 200
+    assert response.get_json() == {"initialized": False}
+
+def test_asgi_stats_require_admin_token(monkeypatch):
+    import asgi
+    monkeypatch.setitem(asgi.config, 'ADMIN_TOKEN', ADMIN_TOKEN)
+
+    async def fetch(path, headers):
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.get(path, headers=headers)
+
+    for path in ('/api/reply/gateway/stats', '/api/reply/single-flight/stats'):
+        assert asyncio.run(fetch(path, {})).status_code == 401
+        response = asyncio.run(fetch(path, ADMIN))
+        assert response.status_code == 200
+        assert response.json() == {"initialized": False}
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from timeseries import HEADER_SIZE, load_series, make_windows, windows_payload
+
+def test_default_window_shapes():
+    series = load_series()
+    assert len(series) == 144
+    x_train, y_train, x_test, y_test, lo, hi = make_windows(series, 12, 0.8)
+    assert x_train.shape == (105, 12) and y_train.shape == (105,)
+    assert x_test.shape == (27, 12) and y_test.shape == (27,)
+    assert (lo, hi) == (series.min(), series.max())
+
+def test_windows_match_frontend_sequences():
+    # 与前端 createSequences 的逐个窗口循环一致
+    series = np.array([1.0, 3.0, 2.0, 5.0, 4.0, 6.0])
+    x_train, y_train, x_test, y_test, lo, hi = make_windows(series, 2, 0.5)
+    scaled = (series - 1.0) / 5.0
+    windows = [scaled[i:i + 2] for i in range(len(series) - 2)]
+    np.testing.assert_allclose(np.concatenate([x_train, x_test]), windows)
+    np.testing.assert_allclose(np.concatenate([y_train, y_test]), scaled[2:])
+
+@pytest.mark.parametrize('time_step, split', [(0, 0.8), (143, 0.8), (12, 0), (12, 1.0), (12, 0.001)])
+def test_invalid_parameters(time_step, split):
+    with pytest.raises(ValueError):
+        make_windows(load_series(), time_step, split)
+
+def test_payload_layout():
+    payload, etag = windows_payload(12, 0.8)
+    values = np.frombuffer(payload, dtype='<f4')
+    time_step, num_train, num_test = values[:3]
+    assert (time_step, num_train, num_test) == (12, 105, 27)
+    assert len(values) == HEADER_SIZE + (num_train + num_test) * (time_step + 1)
+    assert etag.startswith('"') and etag == windows_payload(12, 0.8)[1]
+
+def test_endpoint(make_client):
+    client = make_client()
+    response = client.get('/api/timeseries/airpassengers')
+    assert response.status_code == 200
+    assert response.data == windows_payload(12, 0.8)[0]
+    again = client.get('/api/timeseries/airpassengers', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    for query in ('time_step=0', 'time_step=abc', 'split=1.5', 'time_step=200'):
+        assert client.get(f'/api/timeseries/airpassengers?{query}').status_code == 400
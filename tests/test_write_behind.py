@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+import database
+from write_behind import WriteBehindBuffer
+
+INSERT = 'INSERT INTO counters (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value'
+
+@pytest.fixture(autouse=True)
+def counters(db_path):
+    with database.db_connection() as conn:
+        conn.execute('CREATE TABLE counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        conn.commit()
+
+@pytest.fixture
+def make_buffer():
+    buffers = []
+
+    def make(interval_ms=60000, max_pending=1000):
+        buffer = WriteBehindBuffer(interval_ms, max_pending)
+        buffer.register('set', INSERT)
+        buffer.register('add', INSERT, lambda old, new: (old[0], old[1] + new[1]))
+        buffers.append(buffer)
+        return buffer
+    yield make
+    for buffer in buffers:
+        buffer.stop(timeout=2)
+
+def rows():
+    with database.db_connection() as conn:
+        return dict(conn.execute('SELECT key, value FROM counters').fetchall())
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+def test_updates_for_same_key_are_merged(make_buffer):
+    buffer = make_buffer()
+    for value in (1, 2, 3):
+        buffer.put('set', 'latest', ('latest', value))
+        buffer.put('add', 'total', ('total', value))
+    assert buffer.pending() == 2
+    assert buffer.flush() == 2
+    assert rows() == {'latest': 3, 'total': 6}
+
+def test_flushes_when_pending_reaches_limit(make_buffer):
+    buffer = make_buffer(max_pending=3)
+    for key in 'ab':
+        buffer.put('set', key, (key, 1))
+    time.sleep(0.05)
+    assert rows() == {}
+    buffer.put('set', 'c', ('c', 1))
+    assert wait_for(lambda: len(rows()) == 3)
+
+def test_flushes_on_interval(make_buffer):
+    buffer = make_buffer(interval_ms=20)
+    buffer.put('set', 'a', ('a', 1))
+    assert wait_for(lambda: rows() == {'a': 1})
+
+def test_failed_flush_is_requeued_and_merged(make_buffer, monkeypatch):
+    buffer = make_buffer()
+    buffer.put('add', 'total', ('total', 1))
+    connection = database.db_connection
+
+    def broken():
+        raise database.sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(database, 'db_connection', broken)
+    with pytest.raises(database.sqlite3.OperationalError):
+        buffer.flush()
+    monkeypatch.setattr(database, 'db_connection', connection)
+    buffer.put('add', 'total', ('total', 2))
+    assert buffer.pending() == 1
+    buffer.flush()
+    assert rows() == {'total': 3}
+
+def test_stop_writes_remaining(make_buffer):
+    buffer = make_buffer()
+    buffer.put('set', 'a', ('a', 1))
+    buffer.stop(timeout=2)
+    assert rows() == {'a': 1}